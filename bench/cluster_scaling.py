@@ -0,0 +1,141 @@
+"""Updates/sec of BOT_MODE=cluster as the worker count grows.
+
+For each worker count, runs ``main.py`` in cluster mode (SQLite storage) in a
+temporary data directory against bench/fake_telegram.py, delivers ``/start``
+and a "take exam" button press for every simulated user with at most
+``--connections`` updates in flight (Telegram's webhook max_connections), and
+times how long until every update has been answered. Reports updates/sec
+per worker count as JSON.
+
+    python bench/cluster_scaling.py --workers 1 2 4 --users 1000
+
+The fake Bot API server runs in this process, so on a machine with few cores
+it competes with the workers; compare runs on the same machine only.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from webhook_e2e import free_port  # noqa: E402
+
+REPLY_METHODS = ("sendMessage", "editMessageText")
+
+
+def start_cluster(workdir: str, api_port: int, ingress_port: int, workers: int, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BOT_TOKEN="1:fake",
+        BOT_MODE="cluster",
+        CLUSTER_WORKERS=str(workers),
+        CLUSTER_BASE_PORT=str(free_port()),
+        STORAGE_BACKEND="sqlite",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        WEBHOOK_URL=f"http://127.0.0.1:{ingress_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(ingress_port),
+        WEBHOOK_SECRET="bench-secret",
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "main.py")],
+        cwd=workdir, env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+
+
+async def drive(fake: FakeTelegram, args) -> dict:
+    updates = []
+    for user_id in range(10_000, 10_000 + args.users):
+        updates.append(fake.message_update(user_id, "/start"))
+        updates.append(fake.callback_update(user_id, "take_exam"))
+
+    def replies() -> int:
+        return sum(len(fake.sent(m)) for m in REPLY_METHODS)
+
+    baseline = replies()
+    slots = asyncio.Semaphore(args.connections)
+
+    async def send(update):
+        async with slots:
+            return await fake.deliver(update)
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(send(u) for u in updates))
+    answered = await fake.wait_for(lambda: replies() - baseline >= len(updates), args.timeout)
+    elapsed = time.perf_counter() - started
+    return {
+        "updates": len(updates),
+        "answered": answered,
+        "replies": replies() - baseline,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1),
+        "non_200": sum(1 for s in statuses if s != 200),
+        "redeliveries": fake.redeliveries,
+    }
+
+
+async def measure(workers: int, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="cluster_scaling_")
+    os.makedirs(os.path.join(workdir, "data"))
+    for name in ("exam_data.json", "lesson_data.json"):
+        shutil.copy(os.path.join(REPO_ROOT, "data", name), os.path.join(workdir, "data"))
+
+    fake = FakeTelegram()
+    api_port, ingress_port = free_port(), free_port()
+    server = uvicorn.Server(uvicorn.Config(fake.create_app(), host="127.0.0.1", port=api_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    cluster = start_cluster(workdir, api_port, ingress_port, workers, args)
+    try:
+        if not await fake.wait_for(lambda: fake.webhook_url is not None, timeout=args.timeout):
+            return {"workers": workers, "error": "webhook never registered"}
+        report = {"workers": workers, **await drive(fake, args)}
+    finally:
+        cluster.send_signal(signal.SIGINT)
+        try:
+            cluster.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            cluster.kill()
+        await fake.close()
+        server.should_exit = True
+        await server_task
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cluster-mode throughput per worker count.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=40, help="updates in flight at once")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the cluster's log output")
+    args = parser.parse_args()
+
+    runs = [asyncio.run(measure(n, args)) for n in args.workers]
+    report = {"cpu_count": os.cpu_count(), "users": args.users, "connections": args.connections, "runs": runs}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
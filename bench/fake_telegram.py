@@ -0,0 +1,280 @@
+"""A small in-memory stand-in for the Telegram Bot API, for offline runs.
+
+Answers the Bot API methods the bot uses (``getMe``, ``setWebhook``,
+``sendMessage``, ``editMessageText``, ``answerCallbackQuery``, ...), records
+every call, and can deliver updates to the webhook the bot registered, with
+the secret token it registered. Point the bot at it with TELEGRAM_API_URL:
+
+    python bench/fake_telegram.py --port 8081 --latency-ms 40 --jitter-ms 30 --error-rate 0.01
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:fake python main.py
+
+Every call except the setup methods can be delayed by ``latency`` plus up to
+``jitter`` seconds, and fails with probability ``error_rate`` with one of the
+``errors`` Telegram really returns (429 flood control, 500, 400 "message is
+not modified", 403 blocked by the user).
+
+See bench/webhook_e2e.py for a full webhook round trip against it and
+bench/load_students.py for a load test of the handlers.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Exam Bot", "username": "fake_exam_bot"}
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Never delayed or failed, so the bot under test always starts
+SETUP_METHODS = {
+    "getMe", "setWebhook", "deleteWebhook", "getWebhookInfo", "getUpdates",
+    "setMyCommands", "setMyDescription", "setMyShortDescription",
+}
+ERRORS = {
+    "429": (429, "Too Many Requests: retry after 1", {"retry_after": 1}),
+    "500": (500, "Internal Server Error", None),
+    "400": (400, "Bad Request: message is not modified: specified new message content and reply markup "
+                 "are exactly the same as a current content and reply markup of the message", None),
+    "403": (403, "Forbidden: bot was blocked by the user", None),
+}
+
+
+def _value(raw: str):
+    # PTB sends form fields with non-string values JSON-encoded
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def _chat(chat_id) -> Dict:
+    return {"id": int(chat_id), "type": "private", "first_name": f"Student {chat_id}"}
+
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Student {user_id}", "language_code": "km"}
+
+
+class BotAPIError(Exception):
+    def __init__(self, code: int, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 errors: Sequence[str] = ("429", "500"), seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = [ERRORS[e] for e in errors]
+        self._rng = random.Random(seed)
+        self.injected: Counter = Counter()
+        self._answered = set()
+        # Calls refused because the bot misused the API (not injected)
+        self.rejected: Counter = Counter()
+        self.calls: List[Dict] = []
+        self.webhook_url: Optional[str] = None
+        self.secret_token: Optional[str] = None
+        self.redeliveries = 0
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._changed = asyncio.Event()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.methods: Dict[str, Callable[[Dict], object]] = {
+            "getMe": lambda p: BOT_USER,
+            "setWebhook": self._set_webhook,
+            "deleteWebhook": self._delete_webhook,
+            "getWebhookInfo": lambda p: {"url": self.webhook_url or "", "has_custom_certificate": False,
+                                         "pending_update_count": 0},
+            "getUpdates": lambda p: [],
+            "setMyCommands": lambda p: True,
+            "setMyDescription": lambda p: True,
+            "setMyShortDescription": lambda p: True,
+            "sendMessage": self._message,
+            "editMessageText": self._message,
+            "editMessageReplyMarkup": self._message,
+            "answerCallbackQuery": self._answer_callback_query,
+            "deleteMessage": lambda p: True,
+            "sendChatAction": lambda p: True,
+        }
+
+    # --- Bot API side ---------------------------------------------------------
+
+    def _set_webhook(self, params: Dict):
+        self.webhook_url = params.get("url") or None
+        self.secret_token = params.get("secret_token")
+        return True
+
+    def _delete_webhook(self, params: Dict):
+        self.webhook_url = self.secret_token = None
+        return True
+
+    def _answer_callback_query(self, params: Dict):
+        # Telegram accepts one answer per callback query
+        query_id = str(params.get("callback_query_id"))
+        if query_id in self._answered:
+            raise BotAPIError(400, "Bad Request: query is too old and response timeout expired or query ID is invalid")
+        self._answered.add(query_id)
+        return True
+
+    def _message(self, params: Dict) -> Dict:
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": _chat(params.get("chat_id", 0)),
+            "text": params.get("text", ""),
+        }
+
+    async def _api(self, token: str, method: str, request: Request) -> JSONResponse:
+        body = await request.body()
+        if request.headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {k: _value(v[0]) for k, v in parse_qs(body.decode()).items()}
+        if method not in SETUP_METHODS:
+            delay = self.latency + self._rng.random() * self.jitter
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.errors and self._rng.random() < self.error_rate:
+                code, description, parameters = self._rng.choice(self.errors)
+                self.injected[f"{method}:{code}"] += 1
+                error = {"ok": False, "error_code": code, "description": description}
+                if parameters:
+                    error["parameters"] = parameters
+                return JSONResponse(error, status_code=code)
+        self.calls.append({"time": time.time(), "method": method, "params": params})
+        self._changed.set()
+        handler = self.methods.get(method)
+        if handler is None:
+            return JSONResponse({"ok": False, "error_code": 404, "description": "Not Found: method not found"},
+                                status_code=404)
+        try:
+            return JSONResponse({"ok": True, "result": handler(params)})
+        except BotAPIError as e:
+            self.rejected[f"{method}:{e.code}"] += 1
+            return JSONResponse({"ok": False, "error_code": e.code, "description": e.description}, status_code=e.code)
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+        app.add_api_route("/bot{token}/{method}", self._api, methods=["GET", "POST"])
+        return app
+
+    # --- test side ------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        return {
+            "calls": dict(Counter(c["method"] for c in self.calls).most_common()),
+            "injected_errors": dict(self.injected.most_common()),
+            "rejected": dict(self.rejected.most_common()),
+        }
+
+    def sent(self, method: str, chat_id: Optional[int] = None) -> List[Dict]:
+        return [
+            c["params"] for c in self.calls
+            if c["method"] == method and (chat_id is None or int(c["params"].get("chat_id", 0)) == chat_id)
+        ]
+
+    async def wait_for(self, predicate: Callable[[], bool], timeout: float = 10.0) -> bool:
+        """Wait until ``predicate()`` holds, re-checking after every API call."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            self._changed.clear()
+            if predicate():
+                return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def message_update(self, user_id: int, text: str) -> Dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": _chat(user_id),
+            "from": _user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback_update(self, user_id: int, data: str, message_id: int = 1) -> Dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": _user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {"message_id": message_id, "date": int(time.time()), "chat": _chat(user_id), "text": "…"},
+            },
+        }
+
+    async def deliver(self, update: Dict, secret_token: Optional[str] = None, attempts: int = 10) -> int:
+        """POST an update to the registered webhook the way Telegram does; returns the final status code.
+
+        Like Telegram, an update refused with 429 or a 5xx status is delivered
+        again after a pause, up to ``attempts`` times.
+        """
+        if self.webhook_url is None:
+            raise RuntimeError("no webhook registered")
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30)
+        token = self.secret_token if secret_token is None else secret_token
+        headers = {SECRET_HEADER: token} if token else {}
+        for _ in range(attempts):
+            response = await self._client.post(self.webhook_url, json=update, headers=headers)
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            self.redeliveries += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        return response.status_code
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every API call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls that fail")
+    parser.add_argument("--errors", default="429,500", help=f"error kinds to inject, from {','.join(ERRORS)}")
+
+
+def from_arguments(args) -> FakeTelegram:
+    return FakeTelegram(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        errors=[e.strip() for e in args.errors.split(",") if e.strip()],
+        seed=getattr(args, "seed", None),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Telegram Bot API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(from_arguments(args).create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Exam-catalog ingestion throughput on a synthetic catalog of any size.
+
+Writes a catalog shaped like data/exam_data.json (``--grades`` x
+``--subjects`` x ``--questions``, a few of them deliberately invalid) to a
+temporary directory, then times ``bot.ingest.ingest`` streaming it into an
+artifact against loading it whole with ``json.load`` + ``validate_catalog``.
+With ``--memory`` both are repeated under tracemalloc to report peak memory.
+
+    python bench/ingest_catalog.py --grades 12 --subjects 50 --questions 2000 --memory
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def write_catalog(path: str, args, rng: random.Random) -> int:
+    """Write the synthetic catalog one question at a time; returns the invalid question count."""
+    invalid = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for g in range(1, args.grades + 1):
+            f.write(("," if g > 1 else "") + f'"grade_{g}":{{"title":"ថ្នាក់ទី {g}","subjects":{{')
+            for s in range(args.subjects):
+                f.write(("," if s else "") + f'"subject_{s}":{{"title":"មុខវិជ្ជា {s}","description":"ការពិពណ៌នា",'
+                        f'"duration":{rng.randint(10, 60)},"questions":[')
+                for q in range(args.questions):
+                    question = {
+                        "question": f"សំណួរទី {q}: " + "ក" * rng.randint(10, 200),
+                        "options": [f"ចម្លើយ {i}" for i in range(4)],
+                        "correct": rng.randrange(4),
+                        "explanation": "ការពន្យល់",
+                    }
+                    if rng.random() < args.invalid_rate:
+                        question["correct"] = 9
+                        invalid += 1
+                    f.write(("," if q else "") + json.dumps(question, ensure_ascii=False))
+                f.write("]}")
+            f.write("}}")
+        f.write("}")
+    return invalid
+
+
+def measure(fn, memory: bool):
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result, round(seconds, 3), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time streaming catalog ingestion against a whole-file load.")
+    parser.add_argument("--grades", type=int, default=12)
+    parser.add_argument("--subjects", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=1000, help="questions per subject")
+    parser.add_argument("--invalid-rate", type=float, default=0.001)
+    parser.add_argument("--memory", action="store_true", help="also report peak memory (slow)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    from bot.ingest import ingest, validate_catalog
+
+    directory = tempfile.mkdtemp(prefix="ingest_catalog_")
+    try:
+        source = os.path.join(directory, "exam_data.json")
+        artifact = os.path.join(directory, "exam_catalog.json")
+        invalid = write_catalog(source, args, random.Random(args.seed))
+
+        def whole_file():
+            with open(source, encoding="utf-8") as f:
+                return validate_catalog(json.load(f))
+
+        streamed, stream_seconds, stream_peak = measure(lambda: ingest(source, artifact), args.memory)
+        (_, errors, _), load_seconds, load_peak = measure(whole_file, args.memory)
+        report = {
+            "source_mb": round(os.path.getsize(source) / 2**20, 1),
+            "artifact_mb": round(os.path.getsize(artifact) / 2**20, 1),
+            "questions": streamed["questions_read"],
+            "invalid_written": invalid,
+            "errors": len(streamed["errors"]),
+            "errors_match": len(streamed["errors"]) == len(errors),
+            "stream": {"seconds": stream_seconds, "questions_per_s": round(streamed["questions_read"] / stream_seconds),
+                       "peak_mb": stream_peak},
+            "whole_file": {"seconds": load_seconds, "peak_mb": load_peak},
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Time bot.analytics on a synthetic results history.
+
+Generates ``--sittings`` results in memory for the exams of
+data/exam_data.json (plus an optional synthetic question bank), each
+answered by a student of random ability, and times the two stages of the
+item analysis: flattening the nested results into columns and the NumPy
+statistics. Reports rows/sec per stage as JSON.
+
+    python bench/item_analysis.py --sittings 200000
+    python bench/item_analysis.py --sittings 100000 --bank-size 5000 --sample-size 40
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the item analysis on synthetic results.")
+    parser.add_argument("--sittings", type=int, default=200_000)
+    parser.add_argument("--bank-size", type=int, default=0, help="also sit a synthetic question bank this big")
+    parser.add_argument("--sample-size", type=int, default=40, help="questions drawn from the bank per sitting")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+    from bot.analytics import AnswerColumns, ItemAnalysis
+    from bot.catalog import CompiledExam, get_catalog
+    from bot.paper import draw_paper
+
+    catalog = get_catalog()
+    exams = list(catalog.compiled_exams().values())
+    if args.bank_size:
+        bank = CompiledExam("bench", "bank", {"title": "Bench"}, {
+            "title": "Question bank", "duration": 60, "sample_size": args.sample_size,
+            "questions": [{"question": f"Q{i}", "options": ["A", "B", "C", "D"], "correct": i % 4}
+                          for i in range(args.bank_size)],
+        })
+        exams.append(bank)
+        # Serve the synthetic bank alongside the real catalog
+        real_get = catalog.get_compiled
+        catalog.get_compiled = lambda g, s: bank if (g, s) == ("bench", "bank") else real_get(g, s)
+
+    rng = random.Random(args.seed)
+    results = {}
+    for user_id in range(args.sittings):
+        exam = rng.choice(exams)
+        paper = draw_paper(exam, seed=rng.randrange(2**31))
+        ability = rng.random()
+        answers = []
+        for j in range(paper.total):
+            q = paper.question(j)
+            answers.append(q.correct if rng.random() < ability else rng.randrange(len(q.options)))
+        result = {"grade_id": exam.grade_id, "subject_id": exam.subject_id, "answers": answers}
+        if paper.indices is not None:
+            result["paper"] = paper.to_dict()
+        results[user_id] = [result]
+
+    started = time.perf_counter()
+    columns = AnswerColumns.from_results(results)
+    flattened = time.perf_counter()
+    analysis = ItemAnalysis(columns)
+    flags = analysis.flags()
+    analysed = time.perf_counter()
+
+    report = {
+        "sittings": columns.sittings,
+        "rows": columns.rows,
+        "items": int(columns.item_offset[-1]),
+        "flatten_seconds": round(flattened - started, 3),
+        "analysis_seconds": round(analysed - flattened, 3),
+        "rows_per_sec": round(columns.rows / (analysed - started)),
+        "flagged": {name: len(ids) for name, ids in flags.items()},
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Synthetic student load against the real handlers and a fake Bot API server.
+
+Every simulated student walks the whole exam flow as separate updates:
+``/start`` -> take exam -> grade -> subject -> begin -> one answer per
+question -> (some quit early with "end exam"). Updates go through the same
+handlers the bot registers (``bot.core.register_handlers``) via
+``Application.process_update``; every Bot API call they make goes over HTTP
+to bench/fake_telegram.py, which can add latency and inject errors.
+
+Up to ``--concurrency`` students are mid-exam at once. Reports end-to-end
+updates/sec, latency percentiles per handler (command or callback route)
+and the API calls and errors seen, as JSON. Runs in a temporary data
+directory:
+
+    python bench/load_students.py --students 2000 --concurrency 200 --latency-ms 40 --jitter-ms 40
+    python bench/load_students.py --students 500 --error-rate 0.02 --errors 429,500,400
+    python bench/load_students.py --bank-size 5000 --sample-size 20  # everyone sits a question bank
+    STORAGE_BACKEND=sqlite python bench/load_students.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import uvicorn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import add_fault_arguments, from_arguments  # noqa: E402
+from webhook_e2e import free_port  # noqa: E402
+
+
+async def run(args) -> dict:
+    from telegram import Update
+    from telegram.ext import Application
+    from bot import storage
+    from bot.catalog import get_catalog
+    from bot.core import register_handlers
+    from bot.handlers import callback_router
+    from bot.markup import markup_cache
+    from bot.metrics import percentile
+    from bot.router import cb_answer, cb_begin, cb_exam, cb_grade
+
+    rng = random.Random(args.seed)
+    fake = from_arguments(args)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(fake.create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    application = (
+        Application.builder()
+        .token("1:fake")
+        .base_url(f"http://127.0.0.1:{port}/bot")
+        .connection_pool_size(args.concurrency + 8)
+        .build()
+    )
+    register_handlers(application)
+    handler_errors = defaultdict(int)
+
+    async def count_error(update, context):
+        handler_errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(count_error)
+
+    catalog = get_catalog()
+    catalog.reload()
+    markup_cache.grades_menu()
+    exams = [item for item in catalog.compiled_exams().items() if item[1].bank_mode or not args.bank_size]
+    widths = {key: max((len(q.options) for q in exam.questions), default=1) for key, exam in exams}
+    await application.initialize()
+    await storage.session_cache.start(storage.io_executor())
+
+    latencies = defaultdict(list)
+    session_bytes = []
+
+    def label(update: Update) -> str:
+        if update.callback_query:
+            route, _ = callback_router.resolve(update.callback_query.data)
+            return route.name if route else "<unmatched>"
+        return update.message.text.split()[0]
+
+    async def step(raw: dict):
+        update = Update.de_json(raw, application.bot)
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies[label(update)].append(time.perf_counter() - started)
+        if args.think_ms:
+            await asyncio.sleep(rng.random() * args.think_ms / 1000)
+
+    async def student(user_id: int):
+        (grade_id, subject_id), exam = rng.choice(exams)
+        await step(fake.message_update(user_id, "/start"))
+        for data in ("take_exam", cb_grade(grade_id), cb_exam(grade_id, subject_id), cb_begin(grade_id, subject_id)):
+            await step(fake.callback_update(user_id, data))
+        questions = exam.paper_length
+        session_bytes.append(len(json.dumps(await storage.aget_user_session(user_id))))
+        stop_at = rng.randrange(questions) if rng.random() < args.quit_rate else questions
+        for position in range(stop_at):
+            # A bank paper's questions are not known here; an out-of-range option just scores wrong
+            await step(fake.callback_update(user_id, cb_answer(position, rng.randrange(widths[(grade_id, subject_id)]))))
+        if stop_at < questions:
+            await step(fake.callback_update(user_id, "end_exam"))
+
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id: int):
+        async with slots:
+            await student(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(user_id) for user_id in range(100_000, 100_000 + args.students)))
+    elapsed = time.perf_counter() - started
+
+    await storage.session_cache.stop()
+    await application.shutdown()
+    results_stored = storage.count_all_results()
+    server.should_exit = True
+    await server_task
+
+    updates = sum(len(v) for v in latencies.values())
+    return {
+        "students": args.students,
+        "concurrency": args.concurrency,
+        "bank": {"size": args.bank_size, "sample_size": args.sample_size} if args.bank_size else None,
+        "storage_backend": os.getenv("STORAGE_BACKEND", "json"),
+        "fake_api": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                     "error_rate": args.error_rate, "errors": args.errors},
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(updates / elapsed, 1),
+        "results_stored": results_stored,
+        "max_session_bytes": max(session_bytes, default=0),
+        "handler_errors": dict(handler_errors),
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(max(values) * 1000, 2),
+            }
+            for name, values in sorted(latencies.items(), key=lambda item: -len(item[1]))
+        },
+        "api": fake.stats(),
+    }
+
+
+def add_question_bank(path: str, size: int, sample_size: int):
+    """Add a synthetic ``size``-question bank subject to the exam database at ``path``."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    grade = next(iter(data.values()))
+    grade["subjects"]["bench_bank"] = {
+        "title": "Question bank",
+        "description": "Synthetic question bank",
+        "duration": 60,
+        "sample_size": sample_size,
+        "shuffle_options": True,
+        "questions": [
+            {"question": f"Question {i}", "options": ["A", "B", "C", "D"], "correct": i % 4}
+            for i in range(size)
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the handlers with simulated students.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100, help="students mid-exam at once")
+    parser.add_argument("--quit-rate", type=float, default=0.2, help="fraction of students who end the exam early")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="max random pause between a student's taps")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bank-size", type=int, default=0, help="have every student sit a synthetic question bank this big")
+    parser.add_argument("--sample-size", type=int, default=20, help="questions drawn from the bank per sitting")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    else:
+        # Injected API errors make the handlers log a lot; they are counted in the report instead
+        logging.disable(logging.CRITICAL)
+
+    workdir = tempfile.mkdtemp(prefix="load_students_")
+    os.makedirs(os.path.join(workdir, "data"))
+    for name in ("exam_data.json", "lesson_data.json"):
+        shutil.copy(os.path.join(REPO_ROOT, "data", name), os.path.join(workdir, "data"))
+    if args.bank_size:
+        add_question_bank(os.path.join(workdir, "data", "exam_data.json"), args.bank_size, args.sample_size)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
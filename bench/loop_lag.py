@@ -0,0 +1,107 @@
+"""Event-loop lag with blocking vs executor-backed storage calls.
+
+Populates a temporary JSON data directory with a synthetic user base, then
+runs concurrent "handlers" that record exam results for a few seconds, once
+calling the blocking storage functions directly on the loop and once awaiting
+the async variants that run on the storage I/O pool. A LoopLagMonitor samples
+how late the loop wakes up, which is the extra latency every other user's
+update sees.
+
+    python bench/loop_lag.py --users 20000 --writers 8 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_result(rng: random.Random) -> dict:
+    answers = [rng.randrange(4) for _ in range(10)]
+    return {
+        "grade_id": str(rng.randint(1, 12)),
+        "subject_id": "mathematics",
+        "exam_title": "Synthetic exam",
+        "score": rng.random() * 100,
+        "correct": rng.randint(0, 10),
+        "total": 10,
+        "date": "2025-01-01 00:00:00",
+        "answers": answers,
+    }
+
+
+def populate(data_dir: str, users: int, results_per_user: int):
+    rng = random.Random(0)
+    shutil.copy(os.path.join(REPO_ROOT, "data", "exam_data.json"), data_dir)
+    sessions = {uid: {"current_exam": None, "current_question": 0, "answers": [], "start_time": None,
+                      "exam_active": False} for uid in range(1, users + 1)}
+    results = {uid: [make_result(rng) for _ in range(results_per_user)] for uid in range(1, users + 1)}
+    with open(os.path.join(data_dir, "user_sessions.json"), "w") as f:
+        json.dump(sessions, f, indent=2)
+    with open(os.path.join(data_dir, "exam_results.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+
+async def run_mode(mode: str, args) -> dict:
+    from bot import storage
+    from bot.metrics import LoopLagMonitor
+
+    monitor = LoopLagMonitor(interval=0.01, window=100000, report_every=0)
+    rng = random.Random(1)
+    ops = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def writer():
+        nonlocal ops
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, args.users)
+            if mode == "blocking":
+                storage.add_exam_result(user_id, make_result(rng))
+                await asyncio.sleep(0)
+            else:
+                await storage.aadd_exam_result(user_id, make_result(rng))
+            ops += 1
+
+    monitor.start()
+    await asyncio.gather(*(writer() for _ in range(args.writers)))
+    await monitor.stop()
+    storage.shutdown_io_executor()
+    return {"mode": mode, "ops": ops, "ops_per_sec": round(ops / args.duration, 1), **monitor.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare event-loop lag for blocking vs async storage calls.")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--results-per-user", type=int, default=2)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loop_lag_")
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir)
+    populate(data_dir, args.users, args.results_per_user)
+    pristine = os.path.join(workdir, "pristine")
+    shutil.copytree(data_dir, pristine)
+
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    report = []
+    try:
+        for mode in ("blocking", "async"):
+            shutil.rmtree(data_dir)
+            shutil.copytree(pristine, data_dir)
+            report.append(asyncio.run(run_mode(mode, args)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Allocation per render with and without the keyboard cache.
+
+Renders the main menu, grade menu, every subject menu and every question
+keyboard of the catalog, once building fresh markups each time (as the
+handlers used to) and once through the shared MarkupCache, and reports
+allocated bytes and time per render from tracemalloc.
+
+    python bench/markup_alloc.py --rounds 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def renders(cache, catalog):
+    yield cache.main_menu
+    yield cache.grades_menu()
+    for grade_id in catalog.grades():
+        yield cache.subjects_menu(grade_id.replace('grade_', ''))
+    for (grade_id, subject_id), exam in catalog.compiled_exams().items():
+        yield cache.exam_intro(grade_id, subject_id)
+        for position, idx in enumerate(exam.available):
+            yield cache.question_keyboard(grade_id, subject_id, position, idx)
+
+
+def measure(rounds: int, fresh: bool) -> dict:
+    from bot.catalog import get_catalog
+    from bot.markup import MarkupCache, build_main_menu
+
+    catalog = get_catalog()
+    shared = MarkupCache()
+    for _ in renders(shared, catalog):
+        pass
+
+    count = 0
+    allocated = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        if fresh:
+            # What the handlers did before: new buttons and markups on every render
+            cache = MarkupCache()
+            cache.main_menu = build_main_menu()
+        else:
+            cache = shared
+        for _ in renders(cache, catalog):
+            count += 1
+        allocated += tracemalloc.get_traced_memory()[1] - base
+        cache = None
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    return {
+        "mode": "fresh" if fresh else "cached",
+        "renders": count,
+        "bytes_per_render": round(allocated / count),
+        "us_per_render": round(elapsed / count * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare allocation per render with and without the markup cache.")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+    print(json.dumps([measure(args.rounds, True), measure(args.rounds, False)], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Dashboard query latency on a results snapshot with millions of sittings.
+
+Builds synthetic answer columns for the exams of data/exam_data.json
+directly with NumPy (a year of dates, random abilities), writes them with
+``bot.snapshot.write_snapshot`` to a temporary directory, opens the snapshot
+memory-mapped and times the queries the dashboard runs for a few filters:
+select + score histogram + per-exam means + weekly trend. Reports write
+time, snapshot size and per-filter query times as JSON.
+
+    python bench/snapshot_query.py --sittings 2000000
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def synthetic_columns(exams, sittings: int, rng: np.random.Generator):
+    from bot.analytics import AnswerColumns
+
+    sizes = np.array([len(e.questions) for e in exams])
+    sitting_exam = rng.integers(0, len(exams), sittings).astype(np.int32)
+    lengths = sizes[sitting_exam]
+    ability = rng.random(sittings)
+    sitting = np.repeat(np.arange(sittings), lengths)
+    question = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keys = np.concatenate([np.frombuffer(e.answer_key, dtype=np.int16) for e in exams])
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    right = keys[offsets[sitting_exam[sitting]] + question]
+    choice = np.where(rng.random(len(sitting)) < ability[sitting], right, rng.integers(0, 4, len(sitting))).astype(np.int16)
+    correct = np.bincount(sitting, weights=(choice == right), minlength=sittings)
+    return AnswerColumns(
+        exams,
+        user=np.repeat(rng.integers(0, sittings // 3 + 1, sittings), lengths),
+        exam=np.repeat(sitting_exam, lengths),
+        question=question,
+        choice=choice,
+        sitting=sitting,
+        sitting_exam=sitting_exam,
+        sitting_user=rng.integers(0, sittings // 3 + 1, sittings),
+        sitting_score=(correct / lengths * 100).astype(np.float32),
+        sitting_day=(19700 + rng.integers(0, 365, sittings)).astype(np.int32),
+    )
+
+
+def timed(snapshot, codes, first_day, last_day, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        mask = snapshot.select(codes, first_day, last_day)
+        snapshot.score_histogram(mask)
+        snapshot.per_exam(mask)
+        snapshot.trend(mask, 7)
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time dashboard queries on a synthetic results snapshot.")
+    parser.add_argument("--sittings", type=int, default=2_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+    from bot.catalog import get_catalog
+    from bot.snapshot import open_snapshot, write_snapshot
+
+    exams = list(get_catalog().compiled_exams().values())
+    columns = synthetic_columns(exams, args.sittings, np.random.default_rng(args.seed))
+    directory = tempfile.mkdtemp(prefix="snapshot_query_")
+    try:
+        written = write_snapshot(columns, directory)
+        snapshot = open_snapshot(directory)
+        size = sum(os.path.getsize(os.path.join(snapshot.path, f)) for f in os.listdir(snapshot.path))
+        one_grade = snapshot.exam_codes([exams[0].grade_id])
+        one_subject = snapshot.exam_codes([exams[0].grade_id], [exams[0].subject_id])
+        report = {
+            "sittings": snapshot.sittings,
+            "rows": snapshot.manifest["rows"],
+            "write_seconds": written["seconds"],
+            "snapshot_mb": round(size / 2**20, 1),
+            "query_ms": {
+                "everything": timed(snapshot, None, None, None, args.repeats),
+                "one_grade": timed(snapshot, one_grade, None, None, args.repeats),
+                "one_subject_one_month": timed(snapshot, one_subject, 19800, 19830, args.repeats),
+            },
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
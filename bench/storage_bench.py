@@ -0,0 +1,230 @@
+"""Storage benchmark at classroom scale.
+
+Builds a synthetic population (sessions plus a few results per user) in a
+temporary data directory and drives the bot.storage API against each backend:
+
+    json        sessions and results in the JSON files
+    sqlite      STORAGE_BACKEND=sqlite
+    json+log    JSON sessions, RESULTS_BACKEND=log
+    sqlite+log  SQLite sessions, RESULTS_BACKEND=log
+
+Each backend runs in its own subprocess so module state and peak RSS are
+isolated. For every operation it reports ops/sec, p50/p99 latency and bytes
+written per operation (from /proc/self/io where available); peak RSS is
+reported per backend. Output is JSON so runs can be diffed between versions.
+Everything runs offline; no Telegram connection is needed.
+
+    python bench/storage_bench.py --users 10000 --output bench_10k.json
+    python bench/storage_bench.py --users 100000 --backends sqlite,sqlite+log
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = {
+    "json": {"STORAGE_BACKEND": "json", "RESULTS_BACKEND": ""},
+    "sqlite": {"STORAGE_BACKEND": "sqlite", "RESULTS_BACKEND": ""},
+    "json+log": {"STORAGE_BACKEND": "json", "RESULTS_BACKEND": "log"},
+    "sqlite+log": {"STORAGE_BACKEND": "sqlite", "RESULTS_BACKEND": "log"},
+}
+
+
+def written_bytes() -> int:
+    """Bytes this process has passed to write() so far (Linux only, else 0)."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def synthetic_result(rng: random.Random) -> dict:
+    answers = [rng.randrange(4) for _ in range(rng.randint(3, 20))]
+    correct = rng.randint(0, len(answers))
+    return {
+        "grade_id": str(rng.randint(1, 12)),
+        "subject_id": rng.choice(["mathematics", "khmer_language", "science"]),
+        "exam_title": "Synthetic exam",
+        "score": correct / len(answers) * 100,
+        "correct": correct,
+        "total": len(answers),
+        "date": "2025-01-01 00:00:00",
+        "answers": answers,
+    }
+
+
+class Timer:
+    def __init__(self):
+        self.latencies = []
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def measure(self, func, *args):
+        before = written_bytes()
+        started = time.perf_counter()
+        result = func(*args)
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.elapsed += latency
+        self.bytes += written_bytes() - before
+        return result
+
+    def report(self, ops: int = None) -> dict:
+        from bot.metrics import percentile
+        ops = ops if ops is not None else len(self.latencies)
+        return {
+            "ops": ops,
+            "ops_per_sec": round(ops / self.elapsed, 1) if self.elapsed else None,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 3),
+            "bytes_per_op": round(self.bytes / ops) if ops else 0,
+        }
+
+
+def run_worker(args) -> dict:
+    from bot import storage
+
+    rng = random.Random(args.seed)
+    user_ids = list(range(1, args.users + 1))
+    report = {}
+
+    started = time.perf_counter()
+    storage.save_user_sessions({uid: storage.new_user_session() for uid in user_ids})
+    storage.save_exam_results({uid: [synthetic_result(rng) for _ in range(args.results_per_user)] for uid in user_ids})
+    storage.session_cache.clear()
+    report["populate_sec"] = round(time.perf_counter() - started, 2)
+
+    timer = Timer()
+    for _ in range(args.ops):
+        storage.session_cache.clear()
+        timer.measure(storage.get_user_session, rng.choice(user_ids))
+    report["get_user_session"] = timer.report()
+
+    timer = Timer()
+    for _ in range(args.ops):
+        user_id = rng.choice(user_ids)
+        session = storage.get_user_session(user_id)
+        session["answers"].append(rng.randrange(4))
+        timer.measure(storage.update_user_session, user_id, session)
+    report["update_user_session"] = timer.report()
+
+    async def answer_stream():
+        # The handle_answer pattern with the write-behind cache running
+        timer = Timer()
+        storage.session_cache.flush_interval = 0.05
+        await storage.session_cache.start(storage.io_executor())
+        before = written_bytes()
+        started = time.perf_counter()
+        for i in range(args.answers):
+            user_id = rng.choice(user_ids)
+            session = await storage.aget_user_session(user_id)
+            session["answers"].append(rng.randrange(4))
+            t0 = time.perf_counter()
+            await storage.aupdate_user_session(user_id, session)
+            timer.latencies.append(time.perf_counter() - t0)
+            if i % 100 == 0:
+                await asyncio.sleep(0)
+        await storage.session_cache.stop()
+        timer.elapsed = time.perf_counter() - started
+        timer.bytes = written_bytes() - before
+        result = timer.report(args.answers)
+        result["flushes"] = storage.session_cache.flush_count
+        return result
+    report["answer_stream_write_behind"] = asyncio.run(answer_stream())
+    storage.shutdown_io_executor()
+
+    timer = Timer()
+    for _ in range(args.ops):
+        timer.measure(storage.add_exam_result, rng.choice(user_ids), synthetic_result(rng))
+    report["add_exam_result"] = timer.report()
+
+    timer = Timer()
+    for _ in range(args.ops):
+        timer.measure(storage.get_user_result, rng.choice(user_ids), -1)
+    report["get_user_result"] = timer.report()
+
+    timer = Timer()
+    for _ in range(args.ops):
+        timer.measure(storage.get_recent_results, rng.choice(user_ids), 5)
+    report["get_recent_results"] = timer.report()
+
+    timer = Timer()
+    for _ in range(args.heavy_ops):
+        timer.measure(storage.load_exam_results)
+    report["load_exam_results"] = timer.report()
+
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot.storage backends with a synthetic population.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--results-per-user", type=int, default=3)
+    parser.add_argument("--ops", type=int, default=200, help="iterations for per-user operations")
+    parser.add_argument("--answers", type=int, default=5000, help="answers in the write-behind answer stream")
+    parser.add_argument("--heavy-ops", type=int, default=3, help="iterations for whole-store loads")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        workdir = tempfile.mkdtemp(prefix="storage_bench_")
+        os.makedirs(os.path.join(workdir, "data"))
+        shutil.copy(os.path.join(REPO_ROOT, "data", "exam_data.json"), os.path.join(workdir, "data"))
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_ROOT)
+        try:
+            print(json.dumps(run_worker(args)))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return
+
+    report = {
+        "meta": {
+            "users": args.users,
+            "results_per_user": args.results_per_user,
+            "ops": args.ops,
+            "answers": args.answers,
+            "python": sys.version.split()[0],
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "backends": {},
+    }
+    for name in args.backends.split(","):
+        env = dict(os.environ, **BACKENDS[name])
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", name,
+               "--users", str(args.users), "--results-per-user", str(args.results_per_user),
+               "--ops", str(args.ops), "--answers", str(args.answers),
+               "--heavy-ops", str(args.heavy_ops), "--seed", str(args.seed)]
+        print(f"Running {name}...", file=sys.stderr)
+        out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            report["backends"][name] = {"error": out.stderr.strip().splitlines()[-1:]}
+            continue
+        report["backends"][name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Concurrency stress test for handle_answer.
+
+Starts an exam for every simulated user, then has every user answer their
+questions at once, each answer tap fired together with extra double taps of
+the same button and a stale tap on the previous question's message, through
+the callback router to ``bot.exam.handle_answer`` with fake Telegram objects.
+Passes when every user ends up with exactly one stored result holding exactly
+the answers they gave, i.e. no answer was lost, no stale tap was recorded and
+no exam was recorded twice.
+
+Runs offline in a temporary data directory:
+
+    python bench/stress_answers.py --users 300 --extra-taps 2
+    STORAGE_BACKEND=sqlite python bench/stress_answers.py
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeMessage:
+    async def reply_text(self, *args, **kwargs):
+        await asyncio.sleep(0)
+
+
+class FakeCallbackQuery:
+    # Queries answered with a notice (the stale-tap warning)
+    notices = 0
+
+    def __init__(self, data: str, jitter: float):
+        self.data = data
+        self.message = FakeMessage()
+        self._jitter = jitter
+
+    async def answer(self, text=None, *args, **kwargs):
+        if text:
+            FakeCallbackQuery.notices += 1
+        await asyncio.sleep(random.random() * self._jitter)
+
+    async def edit_message_text(self, *args, **kwargs):
+        await asyncio.sleep(random.random() * self._jitter)
+
+
+def fake_update(user_id: int, data: str, jitter: float):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id, first_name=f"Student {user_id}"),
+        callback_query=FakeCallbackQuery(data, jitter),
+        message=None,
+    )
+
+
+async def run(args) -> int:
+    from bot import storage
+    from bot.catalog import get_catalog
+    from bot.handlers import callback_router
+    from bot.router import cb_answer
+
+    _, exam = get_catalog().get_exam(args.grade, args.subject)
+    if not exam:
+        print(f"Exam grade {args.grade} / {args.subject} not found")
+        return 2
+    n_questions = len(exam["questions"])
+
+    await storage.session_cache.start()
+    user_ids = list(range(1, args.users + 1))
+    expected = {}
+    for user_id in user_ids:
+        session = storage.get_user_session(user_id)
+        session.update({
+            "current_grade": args.grade,
+            "current_subject": args.subject,
+            "current_question": 0,
+            "answers": [],
+            "start_time": time.time(),
+            "exam_active": True,
+        })
+        storage.update_user_session(user_id, session)
+        expected[user_id] = [random.randrange(4) for _ in range(n_questions)]
+
+    async def student(user_id: int) -> int:
+        """Answer every question; returns the number of taps fired."""
+        answers = expected[user_id]
+        taps = 0
+        for position, option in enumerate(answers):
+            burst = [cb_answer(position, option)] * (1 + args.extra_taps)
+            if position:
+                # The previous question's message, tapped with an option this question was not given
+                burst.append(cb_answer(position - 1, (option + 1) % 4))
+            random.shuffle(burst)
+            await asyncio.gather(*(callback_router.dispatch(fake_update(user_id, data, args.jitter), None) for data in burst))
+            taps += len(burst)
+        return taps
+
+    started = time.perf_counter()
+    taps = sum(await asyncio.gather(*(student(user_id) for user_id in user_ids)))
+    elapsed = time.perf_counter() - started
+    await storage.session_cache.stop()
+    storage.session_cache.clear()
+
+    failures = 0
+    for user_id in user_ids:
+        results = storage.get_user_results(user_id)
+        session = storage.get_user_session(user_id)
+        stored = [r["answers"] for r in results]
+        if stored != [expected[user_id]] or session.get("exam_active"):
+            failures += 1
+            if failures <= 10:
+                print(f"user {user_id}: stored {stored}, expected {expected[user_id]}, "
+                      f"exam_active={session.get('exam_active')}")
+
+    print(
+        f"{taps} concurrent taps for {len(user_ids)} users in {elapsed:.2f}s "
+        f"({taps / elapsed:.0f} taps/s), {FakeCallbackQuery.notices} stale taps discarded: "
+        f"{failures} users with lost, stale or duplicated answers"
+    )
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire concurrent handle_answer calls and check for lost answers.")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--extra-taps", type=int, default=2, help="double taps of every answer button")
+    parser.add_argument("--grade", default="1")
+    parser.add_argument("--subject", default="mathematics")
+    parser.add_argument("--jitter", type=float, default=0.005, help="max fake API latency in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="stress_answers_")
+    os.makedirs(os.path.join(workdir, "data"))
+    shutil.copy(os.path.join(REPO_ROOT, "data", "exam_data.json"), os.path.join(workdir, "data"))
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        sys.exit(asyncio.run(run(args)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
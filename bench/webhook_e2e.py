@@ -0,0 +1,146 @@
+"""End-to-end check of webhook mode, fully offline.
+
+Starts bench/fake_telegram.py in-process, runs ``main.py`` with
+BOT_MODE=webhook against it in a temporary data directory, then delivers
+updates the way Telegram would and checks the bot's replies:
+
+* a request without the secret token is refused (403),
+* ``/start`` is answered with the main menu,
+* a button press is answered and edits the message,
+* a burst of ``/start`` from many users is answered in full, updates the
+  bot refuses while over WEBHOOK_MAX_PENDING being redelivered.
+
+    python bench/webhook_e2e.py --burst 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_bot(workdir: str, api_port: int, webhook_port: int, args) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BOT_TOKEN="1:fake",
+        BOT_MODE="webhook",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{api_port}",
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_SECRET="e2e-secret",
+        WEBHOOK_MAX_PENDING=str(args.max_pending),
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "main.py")],
+        cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+
+
+async def scenario(fake: FakeTelegram, args) -> dict:
+    checks = {}
+    if not await fake.wait_for(lambda: fake.webhook_url is not None, timeout=args.timeout):
+        return {"webhook_registered": False}
+    checks["webhook_registered"] = True
+
+    # The bot starts serving right after setWebhook; wait for the port
+    status = None
+    for _ in range(100):
+        try:
+            status = await fake.deliver(fake.message_update(10, "/help"), secret_token="wrong")
+            break
+        except Exception:
+            await asyncio.sleep(0.1)
+    checks["wrong_secret_refused"] = status == 403
+
+    await fake.deliver(fake.message_update(10, "/start"))
+    checks["start_answered"] = await fake.wait_for(lambda: bool(fake.sent("sendMessage", 10)), args.timeout)
+
+    await fake.deliver(fake.callback_update(10, "take_exam"))
+    checks["button_answered"] = await fake.wait_for(
+        lambda: bool(fake.sent("answerCallbackQuery")) and bool(fake.sent("editMessageText", 10)), args.timeout
+    )
+
+    users = range(1000, 1000 + args.burst)
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(fake.deliver(fake.message_update(u, "/start")) for u in users))
+    answered = await fake.wait_for(
+        lambda: all(fake.sent("sendMessage", u) for u in users), args.timeout
+    )
+    elapsed = time.perf_counter() - started
+    checks["burst_answered"] = answered
+    return {
+        **checks,
+        "burst": args.burst,
+        "burst_statuses": {str(s): statuses.count(s) for s in sorted(set(statuses))},
+        "burst_seconds": round(elapsed, 3),
+        "redeliveries": fake.redeliveries,
+        "api_calls": len(fake.calls),
+    }
+
+
+async def run(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="webhook_e2e_")
+    os.makedirs(os.path.join(workdir, "data"))
+    for name in ("exam_data.json", "lesson_data.json"):
+        shutil.copy(os.path.join(REPO_ROOT, "data", name), os.path.join(workdir, "data"))
+
+    fake = FakeTelegram()
+    api_port, webhook_port = free_port(), free_port()
+    server = uvicorn.Server(uvicorn.Config(fake.create_app(), host="127.0.0.1", port=api_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    bot = start_bot(workdir, api_port, webhook_port, args)
+    try:
+        report = await scenario(fake, args)
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            bot.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await fake.close()
+        server.should_exit = True
+        await server_task
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    ok = all(v for k, v in report.items() if isinstance(v, bool))
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot in webhook mode against a fake Telegram server.")
+    parser.add_argument("--burst", type=int, default=200, help="users sending /start at once")
+    parser.add_argument("--max-pending", type=int, default=50, help="WEBHOOK_MAX_PENDING for the bot")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
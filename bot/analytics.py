@@ -0,0 +1,307 @@
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bot.catalog import CompiledExam, get_catalog
+from bot.storage import load_exam_results
+
+logger = logging.getLogger(__name__)
+
+# Items answered by fewer sittings than this are reported but never flagged
+MIN_RESPONSES = 20
+TOO_EASY = 0.90
+TOO_HARD = 0.20
+LOW_DISCRIMINATION = 0.10
+SCORE_BINS = 11  # 0-9, 10-19, ..., 90-99, 100
+
+
+def result_days(dates: Sequence[str]) -> np.ndarray:
+    """Days since 1970-01-01 of results' ``date`` strings ("%Y-%m-%d %H:%M:%S"), -1 if unparsable."""
+    days = np.full(len(dates), -1, dtype=np.int32)
+    try:
+        parsed = np.array([d[:10] or "NaT" for d in dates], dtype="datetime64[D]")
+    except ValueError:
+        # A malformed date somewhere: parse one by one
+        for i, d in enumerate(dates):
+            try:
+                day = np.datetime64(d[:10] or "NaT", "D")
+            except ValueError:
+                continue
+            if not np.isnat(day):
+                days[i] = day.astype(np.int64)
+        return days
+    known = ~np.isnat(parsed)
+    days[known] = parsed[known].astype(np.int64)
+    return days
+
+
+class AnswerColumns:
+    """Stored results flattened to one row per answer, as NumPy columns.
+
+    Row columns: ``user``, ``exam`` (index into ``exams``), ``question``
+    (index in the exam's pool, so bank papers line up), ``choice`` (original
+    option index), ``correct`` and ``sitting`` (the result the answer belongs
+    to). Sitting columns: ``sitting_user``, ``sitting_exam``,
+    ``sitting_score`` (as stored), ``sitting_day`` (days since 1970-01-01,
+    -1 if unknown) and ``sitting_answers``. Results
+    of exams no longer in the catalog, and answers to questions that have
+    since been removed, are left out.
+    """
+    __slots__ = ("exams", "item_offset", "keys", "user", "exam", "question", "choice", "correct", "sitting",
+                 "sitting_user", "sitting_exam", "sitting_score", "sitting_day", "sitting_answers", "skipped")
+
+    def __init__(self, exams: Sequence[CompiledExam], user, exam, question, choice, sitting,
+                 sitting_exam, sitting_user=None, sitting_score=None, sitting_day=None, skipped: int = 0):
+        self.exams = list(exams)
+        sizes = np.fromiter((len(e.questions) for e in self.exams), dtype=np.int64, count=len(self.exams))
+        # Items of all exams numbered consecutively: item = item_offset[exam] + question
+        self.item_offset = np.concatenate(([0], np.cumsum(sizes)))
+        # Answer key of every item
+        self.keys = np.concatenate([np.frombuffer(e.answer_key, dtype=np.int16) for e in self.exams] or [np.empty(0, np.int16)])
+        keep = (question >= 0) & (question < sizes[exam])
+        # Removed questions (no key) have nothing to analyse
+        keep[keep] = self.keys[self.item_offset[exam[keep]] + question[keep]] >= 0
+        self.user = user[keep]
+        self.exam = exam[keep]
+        self.question = question[keep]
+        self.choice = choice[keep]
+        self.sitting = sitting[keep]
+        self.sitting_exam = sitting_exam
+        self.sitting_user = sitting_user if sitting_user is not None else np.zeros(len(sitting_exam), np.int64)
+        self.sitting_score = sitting_score if sitting_score is not None else np.zeros(len(sitting_exam), np.float32)
+        self.sitting_day = sitting_day if sitting_day is not None else np.full(len(sitting_exam), -1, np.int32)
+        self.sitting_answers = np.bincount(self.sitting, minlength=len(sitting_exam))
+        self.skipped = skipped
+        self.correct = self.choice == self.keys[self.item]
+
+    @property
+    def item(self) -> np.ndarray:
+        return self.item_offset[self.exam] + self.question
+
+    @property
+    def rows(self) -> int:
+        return len(self.user)
+
+    @property
+    def sittings(self) -> int:
+        return len(self.sitting_exam)
+
+    @classmethod
+    def from_results(cls, results: Dict[int, List[Dict]], catalog=None) -> "AnswerColumns":
+        """Flatten ``{user_id: [result, ...]}`` (``load_exam_results``) into columns.
+
+        The only Python-level loop is one pass over the results; answers are
+        appended list-wise and every per-row column is built with NumPy.
+        """
+        catalog = catalog or get_catalog()
+        codes: Dict[Tuple[str, str], int] = {}
+        exams: List[CompiledExam] = []
+        users, exam_codes, lengths, questions, choices, scores, dates = [], [], [], [], [], [], []
+        skipped = 0
+        for user_id, user_results in results.items():
+            for result in user_results:
+                key = (str(result.get("grade_id")), result.get("subject_id"))
+                code = codes.get(key)
+                if code is None:
+                    exam = catalog.get_compiled(*key)
+                    if exam is None:
+                        skipped += 1
+                        continue
+                    code = codes[key] = len(exams)
+                    exams.append(exam)
+                answers = result.get("answers") or []
+                paper = result.get("paper")
+                if paper:
+                    drawn = paper.get("questions", [])
+                    n = min(len(answers), len(drawn))
+                    questions.extend(drawn[:n])
+                else:
+                    n = len(answers)
+                    questions.extend(range(n))
+                choices.extend(answers[:n] if n < len(answers) else answers)
+                users.append(int(user_id))
+                exam_codes.append(code)
+                lengths.append(n)
+                scores.append(result.get("score", 0))
+                dates.append(result.get("date") or "")
+
+        lengths = np.asarray(lengths, dtype=np.int64)
+        sitting_exam = np.asarray(exam_codes, dtype=np.int32)
+        sitting_user = np.asarray(users, dtype=np.int64)
+        return cls(
+            exams,
+            user=np.repeat(sitting_user, lengths),
+            exam=np.repeat(sitting_exam, lengths),
+            question=np.asarray(questions, dtype=np.int64),
+            choice=np.asarray(choices, dtype=np.int16),
+            sitting=np.repeat(np.arange(len(lengths), dtype=np.int64), lengths),
+            sitting_exam=sitting_exam,
+            sitting_user=sitting_user,
+            sitting_score=np.asarray(scores, dtype=np.float32),
+            sitting_day=result_days(dates),
+            skipped=skipped,
+        )
+
+
+class ItemAnalysis:
+    """Per-item and per-subject statistics computed from ``AnswerColumns``.
+
+    Per item: responses, difficulty (share correct), discrimination (the
+    point-biserial correlation of the item with the rest of the sitting's
+    score, so an item does not correlate with itself) and how often each
+    option was chosen. Per subject: sittings, mean/std and a histogram of
+    scores in 10-point bins. Everything is a handful of ``np.bincount`` calls
+    over the row columns.
+    """
+
+    def __init__(self, columns: AnswerColumns):
+        self.columns = columns
+        n_items = int(columns.item_offset[-1])
+        item = columns.item
+        y = columns.correct.astype(np.float64)
+        sitting_correct = np.bincount(columns.sitting, weights=y, minlength=columns.sittings)
+        x = sitting_correct[columns.sitting] - y
+
+        n = np.bincount(item, minlength=n_items).astype(np.float64)
+        sy = np.bincount(item, weights=y, minlength=n_items)
+        sx = np.bincount(item, weights=x, minlength=n_items)
+        sxx = np.bincount(item, weights=x * x, minlength=n_items)
+        sxy = np.bincount(item, weights=x * y, minlength=n_items)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.responses = n.astype(np.int64)
+            self.difficulty = np.where(n > 0, sy / n, np.nan)
+            # Pearson r with a 0/1 variable (y*y == y)
+            var = (n * sxx - sx * sx) * (n * sy - sy * sy)
+            self.discrimination = np.where(var > 0, (n * sxy - sx * sy) / np.sqrt(var), np.nan)
+
+        self.width = max((len(q.options) for e in columns.exams for q in e.questions), default=1)
+        valid = (columns.choice >= 0) & (columns.choice < self.width)
+        self.option_counts = np.bincount(
+            item[valid] * self.width + columns.choice[valid], minlength=n_items * self.width
+        ).reshape(n_items, self.width)
+
+        n_exams = len(columns.exams)
+        answered = columns.sitting_answers
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(answered > 0, sitting_correct / answered * 100, 0.0)
+        bins = np.minimum((scores // 10).astype(np.int64), SCORE_BINS - 1)
+        self.sittings = np.bincount(columns.sitting_exam, minlength=n_exams)
+        self.histogram = np.bincount(
+            columns.sitting_exam.astype(np.int64) * SCORE_BINS + bins, minlength=n_exams * SCORE_BINS
+        ).reshape(n_exams, SCORE_BINS)
+        total = np.bincount(columns.sitting_exam, weights=scores, minlength=n_exams)
+        total_sq = np.bincount(columns.sitting_exam, weights=scores * scores, minlength=n_exams)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = np.where(self.sittings > 0, total / self.sittings, np.nan)
+            self.std = np.sqrt(np.maximum(np.where(self.sittings > 0, total_sq / self.sittings, np.nan) - self.mean ** 2, 0))
+
+    def flags(self, min_responses: int = MIN_RESPONSES) -> Dict[str, np.ndarray]:
+        """Item ids per problem: too easy, too hard, weakly discriminating, possibly miskeyed.
+
+        An item looks miskeyed when it correlates negatively with the rest of
+        the score and a wrong option is chosen more often than the key.
+        """
+        enough = self.responses >= min_responses
+        keys = self.columns.keys.astype(np.int64)
+        in_range = (keys >= 0) & (keys < self.width)
+        key_count = np.where(in_range, self.option_counts[np.arange(len(keys)), np.clip(keys, 0, self.width - 1)], 0)
+        distractors = self.option_counts.copy()
+        distractors[np.arange(len(keys))[in_range], keys[in_range]] = -1
+        with np.errstate(invalid='ignore'):
+            return {
+                "too_easy": np.flatnonzero(enough & (self.difficulty >= TOO_EASY)),
+                "too_hard": np.flatnonzero(enough & (self.difficulty <= TOO_HARD)),
+                "low_discrimination": np.flatnonzero(enough & (self.discrimination < LOW_DISCRIMINATION)),
+                "miskeyed": np.flatnonzero(enough & (self.discrimination < 0) & (distractors.max(axis=1) > key_count)),
+            }
+
+    def locate(self, item: int) -> Tuple[CompiledExam, int]:
+        """The exam and question index of an item id."""
+        code = int(np.searchsorted(self.columns.item_offset, item, side='right')) - 1
+        return self.columns.exams[code], int(item - self.columns.item_offset[code])
+
+    def item_dict(self, item: int) -> Dict:
+        exam, question = self.locate(item)
+        d, r = self.difficulty[item], self.discrimination[item]
+        return {
+            "grade_id": exam.grade_id,
+            "subject_id": exam.subject_id,
+            "question": question,
+            "text": exam.questions[question].text,
+            "key": exam.questions[question].correct,
+            "responses": int(self.responses[item]),
+            "difficulty": None if np.isnan(d) else round(float(d), 4),
+            "discrimination": None if np.isnan(r) else round(float(r), 4),
+            "options": self.option_counts[item, :len(exam.questions[question].options)].tolist(),
+        }
+
+    def report(self, min_responses: int = MIN_RESPONSES, items: bool = True) -> Dict:
+        flags = self.flags(min_responses)
+        subjects = []
+        for code, exam in enumerate(self.columns.exams):
+            subject = {
+                "grade_id": exam.grade_id,
+                "subject_id": exam.subject_id,
+                "title": exam.full_title,
+                "sittings": int(self.sittings[code]),
+                "mean_score": None if np.isnan(self.mean[code]) else round(float(self.mean[code]), 2),
+                "std_score": None if np.isnan(self.std[code]) else round(float(self.std[code]), 2),
+                "histogram": self.histogram[code].tolist(),
+            }
+            if items:
+                first, last = int(self.columns.item_offset[code]), int(self.columns.item_offset[code + 1])
+                subject["items"] = [self.item_dict(i) for i in range(first, last)]
+            subjects.append(subject)
+        return {
+            "rows": self.columns.rows,
+            "sittings": self.columns.sittings,
+            "skipped_results": self.columns.skipped,
+            "min_responses": min_responses,
+            "flags": {name: [self.item_dict(int(i)) for i in ids] for name, ids in flags.items()},
+            "subjects": subjects,
+        }
+
+
+def analyze_results(results: Dict[int, List[Dict]], grade_id: Optional[str] = None,
+                    subject_id: Optional[str] = None) -> ItemAnalysis:
+    """Item analysis of ``results``, optionally limited to one grade and/or subject."""
+    if grade_id is not None or subject_id is not None:
+        results = {
+            uid: [r for r in rs if (grade_id is None or str(r.get("grade_id")) == grade_id)
+                  and (subject_id is None or r.get("subject_id") == subject_id)]
+            for uid, rs in results.items()
+        }
+    return ItemAnalysis(AnswerColumns.from_results(results))
+
+
+def analyze_all(grade_id: Optional[str] = None, subject_id: Optional[str] = None,
+                min_responses: int = MIN_RESPONSES, items: bool = True) -> Dict:
+    """Item analysis of every stored result, from whichever results store is in use."""
+    started = time.perf_counter()
+    results = load_exam_results()
+    loaded = time.perf_counter()
+    report = analyze_results(results, grade_id, subject_id).report(min_responses, items)
+    report["load_seconds"] = round(loaded - started, 3)
+    report["analysis_seconds"] = round(time.perf_counter() - loaded, 3)
+    logger.info(
+        "Item analysis: %d answers in %d sittings, %.2fs load + %.2fs analysis",
+        report["rows"], report["sittings"], report["load_seconds"], report["analysis_seconds"]
+    )
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Item analysis (difficulty, discrimination, distractors) of stored results.")
+    parser.add_argument("--grade", help="only this grade number")
+    parser.add_argument("--subject", help="only this subject id")
+    parser.add_argument("--min-responses", type=int, default=MIN_RESPONSES, help="responses an item needs to be flagged")
+    parser.add_argument("--summary", action="store_true", help="leave out the per-item table")
+    args = parser.parse_args()
+    print(json.dumps(analyze_all(args.grade, args.subject, args.min_responses, not args.summary),
+                     indent=2, ensure_ascii=False))
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Global send-rate limiter: ``rate`` tokens per second, bursts up to ``capacity``.
+
+    ``pause`` stops every caller until a deadline, which is how a flood-control
+    ``RetryAfter`` from Telegram is honoured for the whole bot.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastReport:
+    """Outcome counters of one broadcast."""
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.blocked: List[int] = []
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + len(self.blocked)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": len(self.blocked),
+            "retried": self.retried,
+            "elapsed_sec": round(self.elapsed, 2),
+            "msg_per_sec": round(self.throughput, 1),
+        }
+
+
+async def broadcast(
+    bot,
+    chat_ids: Iterable[int],
+    text: str,
+    *,
+    name: str = "broadcast",
+    parse_mode: Optional[str] = 'HTML',
+    reply_markup=None,
+    rate: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    max_attempts: int = 3,
+    on_blocked: Optional[Callable[[List[int]], Awaitable[None]]] = None,
+    on_progress: Optional[Callable[[BroadcastReport], Awaitable[None]]] = None,
+    progress_every: float = 10.0,
+) -> BroadcastReport:
+    """Send ``text`` to every chat in ``chat_ids`` within Telegram's rate limits.
+
+    Sends are spread over ``concurrency`` workers that share one token bucket
+    of ``rate`` messages per second (BROADCAST_RATE, default 25, below the
+    ~30 msg/s global limit). Each chat receives a single message, so the
+    per-chat limit cannot be hit. A ``RetryAfter`` pauses the whole bucket and
+    requeues the chat; timeouts and network errors are requeued up to
+    ``max_attempts`` times. Chats that blocked the bot or no longer exist are
+    collected and handed to ``on_blocked`` once at the end for pruning.
+    """
+    rate = rate or float(os.getenv("BROADCAST_RATE", "25"))
+    concurrency = concurrency or int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+    queue: asyncio.Queue = asyncio.Queue()
+    for chat_id in chat_ids:
+        queue.put_nowait((chat_id, 1))
+    report = BroadcastReport(name, queue.qsize())
+    bucket = TokenBucket(rate)
+
+    async def worker():
+        while True:
+            chat_id, attempt = await queue.get()
+            try:
+                await bucket.acquire()
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode, reply_markup=reply_markup)
+                report.sent += 1
+            except RetryAfter as e:
+                logger.warning("%s: flood control, pausing %s s", name, e.retry_after)
+                bucket.pause(float(e.retry_after))
+                report.retried += 1
+                queue.put_nowait((chat_id, attempt))
+            except Forbidden:
+                report.blocked.append(chat_id)
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    report.blocked.append(chat_id)
+                else:
+                    logger.error("%s: failed to send to %s: %s", name, chat_id, e)
+                    report.failed += 1
+            except NetworkError as e:
+                # Includes TimedOut; the request may or may not have gone through
+                if attempt < max_attempts:
+                    report.retried += 1
+                    queue.put_nowait((chat_id, attempt + 1))
+                else:
+                    logger.error("%s: giving up on %s after %d attempts: %s", name, chat_id, attempt, e)
+                    report.failed += 1
+            except Exception as e:
+                logger.error("%s: failed to send to %s: %s", name, chat_id, e)
+                report.failed += 1
+            finally:
+                queue.task_done()
+
+    async def progress():
+        while True:
+            await asyncio.sleep(progress_every)
+            logger.info(
+                "%s: %d/%d done, %d sent, %.1f msg/s",
+                name, report.done, report.total, report.sent, report.throughput
+            )
+            if on_progress is not None:
+                await on_progress(report)
+
+    logger.info("%s: sending to %d chats at %.0f msg/s with %d workers", name, report.total, rate, concurrency)
+    tasks = [asyncio.create_task(worker()) for _ in range(min(concurrency, max(1, report.total)))]
+    tasks.append(asyncio.create_task(progress()))
+    try:
+        # Requeued chats are put back before task_done, so join() covers retries
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        report.finished = time.monotonic()
+
+    if report.blocked and on_blocked is not None:
+        try:
+            await on_blocked(report.blocked)
+        except Exception as e:
+            logger.error("%s: error pruning blocked users: %s", name, e)
+    logger.info(
+        "%s finished: %d sent, %d blocked, %d failed, %d retries in %.1f s (%.1f msg/s)",
+        name, report.sent, len(report.blocked), report.failed, report.retried, report.elapsed, report.throughput
+    )
+    return report
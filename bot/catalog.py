@@ -0,0 +1,297 @@
+import hashlib
+import json
+import logging
+import operator
+import os
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import Future
+from typing import Dict, Optional, Sequence, Tuple
+
+from bot.ingest import ARTIFACT_FORMAT
+from bot.render import exam_intro, render_question_body
+from bot.storage import EXAM_CATALOG_PATH, EXAM_DB_PATH, io_executor, validate_exam_database
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledQuestion:
+    """One question in a compact, read-only form.
+
+    ``html`` is the question text escaped and length-checked for the question
+    screen, rendered once when the exam is compiled.
+    """
+    __slots__ = ("text", "options", "correct", "explanation", "html")
+
+    def __init__(self, text: str, options: Tuple[str, ...], correct: int, explanation: str):
+        self.text = text
+        self.options = options
+        self.correct = correct
+        self.explanation = explanation
+        self.html = ""
+
+
+# Answer-key value of a removed question: no answer, given or skipped, equals it
+NO_KEY = -3
+# Stands in for a question that failed validation, keeping the others' positions
+REMOVED_QUESTION = CompiledQuestion("សំណួរនេះត្រូវបានដកចេញពីការប្រឡង។", (), NO_KEY, "—")
+REMOVED_QUESTION.html = REMOVED_QUESTION.text
+
+
+class CompiledExam:
+    """A subject compiled at load time: question records plus an answer-key array.
+
+    A subject with ``sample_size`` (or ``shuffle_options``) is a question bank:
+    each sitting draws its own paper from ``questions`` (see bot/paper.py).
+
+    A question the catalog validation rejected is stored as ``null`` and
+    compiled to ``REMOVED_QUESTION``, so stored answers, which refer to
+    questions by position, still line up. ``available`` lists the others.
+
+    ``intro`` is the escaped screen shown before the exam starts.
+    """
+    __slots__ = ("grade_id", "subject_id", "grade_title", "title", "description",
+                 "duration", "questions", "available", "answer_key", "sample_size", "shuffle_options", "intro")
+
+    def __init__(self, grade_id: str, subject_id: str, grade_data: Dict, subject_data: Dict):
+        self.grade_id = grade_id
+        self.subject_id = subject_id
+        self.grade_title = grade_data.get('title', 'ថ្នាក់មិនស្គាល់')
+        self.title = subject_data.get('title', 'ការប្រឡងគ្មានចំណងជើង')
+        self.description = subject_data.get('description', 'គ្មានការពិពណ៌នា')
+        self.duration = subject_data.get('duration', 'N/A')
+        self.sample_size = max(0, int(subject_data.get('sample_size') or 0))
+        self.shuffle_options = bool(subject_data.get('shuffle_options', False))
+        self.questions = tuple(
+            REMOVED_QUESTION if q is None else CompiledQuestion(
+                q.get('question', ''),
+                tuple(q.get('options', ())),
+                int(q.get('correct', -1)),
+                q.get('explanation', 'គ្មានការពន្យល់'),
+            )
+            for q in subject_data.get('questions', [])
+        )
+        self.available = tuple(i for i, q in enumerate(self.questions) if q is not REMOVED_QUESTION)
+        self.answer_key = array('h', (q.correct for q in self.questions))
+        total = len(self.questions)
+        for i in self.available:
+            self.questions[i].html = render_question_body(self.questions[i].text, total, f"{grade_id}/{subject_id} question {i + 1}")
+        self.intro = exam_intro(self.title, self.grade_title, self.description, self.duration, self.paper_length)
+
+    @property
+    def full_title(self) -> str:
+        return f"{self.grade_title} - {self.title}"
+
+    @property
+    def bank_mode(self) -> bool:
+        return bool(self.sample_size or self.shuffle_options)
+
+    @property
+    def has_removed(self) -> bool:
+        return len(self.available) != len(self.questions)
+
+    @property
+    def paper_length(self) -> int:
+        """How many questions one sitting answers."""
+        return min(self.sample_size, len(self.available)) if self.sample_size else len(self.available)
+
+    def score(self, answers: Sequence[int]) -> Tuple[int, int, float]:
+        """Return ``(correct, total, score %)`` for a submission.
+
+        ``total`` is the answers given to questions that have a key: a
+        removed question counts neither way, so removing one never lowers a
+        score.
+        """
+        key = self.answer_key
+        correct = sum(map(operator.eq, answers, key))
+        answered = key[:len(answers)]
+        total = len(answered) - answered.count(NO_KEY)
+        return correct, total, (correct / total * 100) if total > 0 else 0
+
+
+def short_code(subject_id: str, length: int = 4) -> str:
+    """Stable base-36 short id of a subject for compact callback data."""
+    n = zlib.crc32(subject_id.encode('utf-8'))
+    digits = []
+    while n:
+        n, r = divmod(n, 36)
+        digits.append("0123456789abcdefghijklmnopqrstuvwxyz"[r])
+    return "".join(digits)[:length] or "0"
+
+
+class _CatalogSnapshot:
+    """Immutable view of one loaded version of the exam database."""
+    __slots__ = ("data", "index", "compiled", "version", "digest", "codes", "subjects_by_code")
+
+    def __init__(self, data: Dict[str, Dict], version: int, digest: Optional[str]):
+        self.data = data
+        self.version = version
+        self.digest = digest
+        # (grade_id, subject_id) -> (grade_data, subject_data), grade_id without the 'grade_' prefix
+        self.index: Dict[Tuple[str, str], Tuple[Dict, Dict]] = {}
+        self.compiled: Dict[Tuple[str, str], CompiledExam] = {}
+        # Short subject ids, unique within a grade; a colliding subject keeps its full id
+        self.codes: Dict[Tuple[str, str], str] = {}
+        self.subjects_by_code: Dict[Tuple[str, str], str] = {}
+        for db_grade_id, grade_data in data.items():
+            grade_id = db_grade_id.replace('grade_', '', 1)
+            for subject_id, subject_data in grade_data.get('subjects', {}).items():
+                self.index[(grade_id, subject_id)] = (grade_data, subject_data)
+                self.compiled[(grade_id, subject_id)] = CompiledExam(grade_id, subject_id, grade_data, subject_data)
+                code = short_code(subject_id)
+                if (grade_id, code) in self.subjects_by_code:
+                    logger.warning("Short id %s of %s/%s is taken, using the full id", code, grade_id, subject_id)
+                    code = subject_id
+                self.codes[(grade_id, subject_id)] = code
+                self.subjects_by_code[(grade_id, code)] = subject_id
+
+
+class ExamCatalog:
+    """Process-wide exam database, loaded once and swapped when the file changes.
+
+    The file's mtime is checked at most every ``check_interval`` seconds; a
+    changed mtime triggers a re-read on an I/O thread, and the content hash
+    decides whether the catalog is actually swapped. A file that fails to load
+    is not read again until its mtime changes.
+    """
+
+    def __init__(self, path: str = EXAM_DB_PATH, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = _CatalogSnapshot({}, 0, None)
+        self._mtime = None
+        self._last_check = 0.0
+        self._attempted = False
+        self._pending: Optional[Future] = None
+        self._lock = threading.Lock()
+        self.load_time = 0.0
+        self.reload_count = 0
+        self.loaded_at = None
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the exam file. Returns True if a new catalog was swapped in."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._attempted = True
+            started = time.perf_counter()
+            try:
+                if not os.path.exists(self.path):
+                    logger.warning("Exam database %s not found, catalog is empty", self.path)
+                    raw, self._mtime = b"{}", None
+                else:
+                    # Recorded before parsing so a broken file is retried only once it changes
+                    self._mtime = os.stat(self.path).st_mtime_ns
+                    with open(self.path, 'rb') as f:
+                        raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+                if digest == self._snapshot.digest and not force:
+                    return False
+                data = json.loads(raw)
+                if isinstance(data, dict) and "catalog_format" in data:
+                    # Built and validated offline by bot/ingest.py
+                    if data["catalog_format"] != ARTIFACT_FORMAT:
+                        raise ValueError(f"catalog format {data['catalog_format']!r}, expected {ARTIFACT_FORMAT!r}; "
+                                         "rebuild it with `python -m bot.ingest`")
+                    data = data["grades"]
+                else:
+                    data = validate_exam_database(data)
+            except Exception as e:
+                logger.error("Error reloading exam catalog, keeping version %d: %s", self.version, e)
+                return False
+
+            self._snapshot = _CatalogSnapshot(data, self._snapshot.version + 1, digest)
+            self.load_time = time.perf_counter() - started
+            self.reload_count += 1
+            self.loaded_at = time.time()
+            logger.info(
+                "Loaded exam catalog v%d (%d grades, %d exams) in %.1f ms",
+                self.version, len(data), len(self._snapshot.index), self.load_time * 1000
+            )
+            return True
+
+    def reload_in_background(self) -> Future:
+        """Reload on an I/O thread; lookups keep the current version until the swap."""
+        pending = self._pending
+        if pending is None or pending.done():
+            pending = self._pending = io_executor().submit(self.reload)
+        return pending
+
+    def _current(self) -> _CatalogSnapshot:
+        if not self._attempted:
+            self.reload()  # nothing to serve yet
+        elif time.monotonic() - self._last_check >= self.check_interval:
+            self._last_check = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self.reload_in_background()
+        return self._snapshot
+
+    def grades(self) -> Dict[str, Dict]:
+        """All grades keyed by their database id (``grade_<n>``)."""
+        return self._current().data
+
+    def get_grade(self, grade_id: str) -> Optional[Dict]:
+        if not grade_id.startswith('grade_'):
+            grade_id = f'grade_{grade_id}'
+        return self._current().data.get(grade_id)
+
+    def get_exam(self, grade_id: str, subject_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Return ``(grade_data, subject_data)`` for a grade number and subject id."""
+        return self._current().index.get((str(grade_id), subject_id), (None, None))
+
+    def get_compiled(self, grade_id: str, subject_id: str) -> Optional[CompiledExam]:
+        """Return the compiled form of an exam, or None if it does not exist."""
+        return self._current().compiled.get((str(grade_id), subject_id))
+
+    def subject_code(self, grade_id: str, subject_id: str) -> str:
+        """Short id of a subject for callback data (the subject id itself if unknown)."""
+        return self._current().codes.get((str(grade_id), subject_id), subject_id)
+
+    def resolve_subject(self, grade_id: str, code: str) -> str:
+        """Subject id for a short id; unknown codes are returned as-is."""
+        return self._current().subjects_by_code.get((str(grade_id), code), code)
+
+    def compiled_exams(self) -> Dict[Tuple[str, str], CompiledExam]:
+        return self._current().compiled
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "path": self.path,
+            "grades": len(snapshot.data),
+            "exams": len(snapshot.index),
+            "load_time_ms": round(self.load_time * 1000, 2),
+            "reload_count": self.reload_count,
+            "loaded_at": self.loaded_at,
+        }
+
+
+_catalog: Optional[ExamCatalog] = None
+
+
+def get_catalog() -> ExamCatalog:
+    """Return the shared exam catalog, creating it on first use."""
+    global _catalog
+    if _catalog is None:
+        _catalog = ExamCatalog(catalog_path(), float(os.getenv("CATALOG_CHECK_INTERVAL", "5")))
+    return _catalog
+
+
+def catalog_path() -> str:
+    """The ingested artifact if there is one, else the raw exam database."""
+    if not os.path.exists(EXAM_CATALOG_PATH):
+        return EXAM_DB_PATH
+    if os.path.exists(EXAM_DB_PATH) and os.path.getmtime(EXAM_DB_PATH) > os.path.getmtime(EXAM_CATALOG_PATH):
+        logger.warning("%s is newer than %s; run `python -m bot.ingest` to rebuild the catalog",
+                       EXAM_DB_PATH, EXAM_CATALOG_PATH)
+    return EXAM_CATALOG_PATH
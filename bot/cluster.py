@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from telegram import Bot
+
+from bot.webhook import SECRET_HEADER, GracefulServer, register_webhook, secret_matches, webhook_secret
+
+logger = logging.getLogger(__name__)
+
+# Update fields whose payload names the acting user under "from" (or "user")
+_USER_FIELDS = ("from", "user")
+
+
+def worker_for(user_id: int, workers: int) -> int:
+    """The worker that owns ``user_id``: stable for a given worker count."""
+    # Multiplicative hash; the high bits keep this independent of the reminder slot (low bits)
+    return ((int(user_id) * 2654435761 % 2**32) >> 16) % workers
+
+
+def local_worker() -> Optional[tuple]:
+    """``(index, count)`` when running as a cluster worker, else None."""
+    if os.getenv("CLUSTER_WORKER") is None:
+        return None
+    return int(os.environ["CLUSTER_WORKER"]), int(os.environ["CLUSTER_WORKERS"])
+
+
+def owns_user(user_id: int) -> bool:
+    """Whether this process handles ``user_id`` (always true outside cluster mode)."""
+    worker = local_worker()
+    return worker is None or worker_for(user_id, worker[1]) == worker[0]
+
+
+def local_sessions(sessions: Dict[int, Dict]) -> Dict[int, Dict]:
+    """The sessions of the users this process owns."""
+    if local_worker() is None:
+        return sessions
+    return {uid: s for uid, s in sessions.items() if owns_user(int(uid))}
+
+
+def update_user_id(data: Dict) -> Optional[int]:
+    """The acting user of a raw update (what PTB calls ``effective_user``), if any."""
+    for key, payload in data.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for field in _USER_FIELDS:
+            user = payload.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return int(user["id"])
+        chat = payload.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return None
+
+
+class Worker:
+    """One bot process serving its share of users on a local port."""
+
+    def __init__(self, index: int, count: int, port: int, env: Dict[str, str]):
+        self.index = index
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/worker"
+        self.env = dict(env, BOT_MODE="worker", CLUSTER_WORKER=str(index), CLUSTER_WORKERS=str(count),
+                        WEBHOOK_LISTEN="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_PATH="worker")
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+
+    def start(self):
+        main_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+        self.process = subprocess.Popen([sys.executable, main_py], env=self.env)
+        logger.info("Started worker %d (pid %d) on port %d", self.index, self.process.pid, self.port)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.alive:
+            self.process.send_signal(signal.SIGINT)
+
+    def wait(self, timeout: float):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("Worker %d did not stop in %.0fs, killing it", self.index, timeout)
+            self.process.kill()
+            self.process.wait()
+
+
+class ClusterIngress:
+    """Receives Telegram's webhook and forwards each update to the worker owning its user.
+
+    Updates without a user go to worker 0. A worker's answer is passed back
+    unchanged, so a busy worker's 503 makes Telegram redeliver, and a dead
+    worker is also answered 503 until it has been restarted.
+    """
+
+    def __init__(self, workers: List[Worker], secret_token: str, internal_secret: str):
+        self.workers = workers
+        self.secret_token = secret_token
+        self.internal_secret = internal_secret
+        self.client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=None))
+        self.forwarded: Counter = Counter()
+        self.unavailable = 0
+        self.unauthorized = 0
+
+    async def handle(self, request: Request) -> Response:
+        if not secret_matches(request.headers.get(SECRET_HEADER), self.secret_token):
+            self.unauthorized += 1
+            return Response(status_code=403)
+        body = await request.body()
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError):
+            return Response(status_code=400)
+        worker = self.workers[worker_for(user_id, len(self.workers)) if user_id is not None else 0]
+        try:
+            response = await self.client.post(worker.url, content=body, headers={
+                SECRET_HEADER: self.internal_secret, "Content-Type": "application/json",
+            })
+        except httpx.HTTPError as e:
+            self.unavailable += 1
+            logger.warning("Worker %d unavailable: %s", worker.index, e)
+            return Response(status_code=503, headers={"Retry-After": "1"})
+        self.forwarded[worker.index] += 1
+        headers = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else None
+        return Response(response.content, status_code=response.status_code, media_type="application/json", headers=headers)
+
+    async def healthy(self, timeout: float) -> bool:
+        """Wait until every worker answers its health check."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for worker in self.workers:
+            while True:
+                try:
+                    if (await self.client.get(f"http://127.0.0.1:{worker.port}/healthz")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if not worker.alive or loop.time() > deadline:
+                    return False
+                await asyncio.sleep(0.2)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "workers": [
+                {"index": w.index, "alive": w.alive, "restarts": w.restarts, "forwarded": self.forwarded[w.index]}
+                for w in self.workers
+            ],
+            "unavailable": self.unavailable,
+            "unauthorized": self.unauthorized,
+        }
+
+    def create_app(self, path: str) -> FastAPI:
+        app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+        app.add_api_route(path, self.handle, methods=["POST"])
+
+        @app.get("/healthz")
+        async def healthz():
+            return self.stats()
+
+        return app
+
+
+async def _supervise(workers: List[Worker], stopping: asyncio.Event):
+    """Restart workers that exit while the cluster is running."""
+    while not stopping.is_set():
+        await asyncio.sleep(1)
+        for worker in workers:
+            if not worker.alive and not stopping.is_set():
+                logger.error("Worker %d exited with code %s, restarting", worker.index, worker.process.returncode)
+                worker.restarts += 1
+                worker.start()
+
+
+def check_shared_storage():
+    """Workers share storage, which only the SQLite backend supports across processes."""
+    if os.getenv("STORAGE_BACKEND", "json").lower() != "sqlite":
+        raise RuntimeError("BOT_MODE=cluster needs STORAGE_BACKEND=sqlite")
+    if os.getenv("RESULTS_BACKEND", "").lower() == "log":
+        raise RuntimeError("BOT_MODE=cluster cannot use RESULTS_BACKEND=log (a single-process log)")
+
+
+async def run_cluster(bot_token: str):
+    """Run the ingress and CLUSTER_WORKERS worker processes until interrupted."""
+    from bot.storage import count_all_results
+
+    check_shared_storage()
+    # Open the shared store here once so the workers do not race to migrate the JSON files
+    count_all_results()
+
+    public_url = os.getenv("WEBHOOK_URL")
+    if not public_url:
+        raise RuntimeError("WEBHOOK_URL environment variable is missing!")
+    count = max(1, int(os.getenv("CLUSTER_WORKERS", str(os.cpu_count() or 1))))
+    base_port = int(os.getenv("CLUSTER_BASE_PORT", "8100"))
+    internal_secret = secrets.token_urlsafe(32)
+    # Telegram's per-bot send limit is shared, so each worker broadcasts at its share of the rate
+    env = dict(os.environ, WEBHOOK_SECRET=internal_secret,
+               BROADCAST_RATE=str(float(os.getenv("BROADCAST_RATE", "25")) / count))
+    workers = [Worker(i, count, base_port + i, env) for i in range(count)]
+
+    secret = webhook_secret()
+    ingress = ClusterIngress(workers, secret, internal_secret)
+    path = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+    server = GracefulServer(uvicorn.Config(
+        ingress.create_app(path),
+        host=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        log_level="warning",
+        lifespan="off",
+    ))
+
+    stopping = asyncio.Event()
+    supervisor = None
+    for worker in workers:
+        worker.start()
+    try:
+        if not await ingress.healthy(float(os.getenv("CLUSTER_START_TIMEOUT", "60"))):
+            raise RuntimeError("cluster workers did not come up")
+        supervisor = asyncio.create_task(_supervise(workers, stopping))
+
+        api_url = os.getenv("TELEGRAM_API_URL")
+        bot = Bot(bot_token, base_url=f"{api_url.rstrip('/')}/bot" if api_url else "https://api.telegram.org/bot")
+        async with bot:
+            await register_webhook(bot, public_url.rstrip("/") + path, secret)
+        logger.info("Cluster ingress on port %d forwarding to %d workers", server.config.port, count)
+        await server.serve()
+    finally:
+        stopping.set()
+        if supervisor is not None:
+            supervisor.cancel()
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.wait(timeout=30)
+        await ingress.client.aclose()
+        logger.info("Cluster stopped: %s", ingress.stats())
@@ -4,9 +4,17 @@ from dotenv import load_dotenv
 import os
 from bot.handlers import (
     start_command, help_command, clear_command, profile_command, results_command,
-    button_handler, error_handler, create_exam_conversation_handler
+    button_handler, error_handler, reload_catalog_command, leaderboard_command,
+    rescore_command, itemstats_command, broadcast_command, reminders_command, routes_command
 )
-from bot.scheduler import setup_scheduler, scheduler
+from bot.catalog import get_catalog
+from bot.markup import markup_cache
+from bot.storage import session_cache, io_executor, shutdown_io_executor, ensure_user_stats, ensure_leaderboards, save_user_stats, aload_user_sessions
+from bot.timers import exam_timers
+from bot.metrics import loop_lag_monitor
+from bot.scheduler import build_reminder_index, setup_scheduler, scheduler
+from bot.webhook import TrackingUpdateProcessor, run_webhook
+from bot.cluster import local_sessions, local_worker, run_cluster
 import logging
 import asyncio
 
@@ -14,6 +22,26 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+def register_handlers(application: Application):
+    """Register every command, the callback router and the error handler."""
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("clear", clear_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("results", results_command))
+    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    application.add_handler(CommandHandler("reload_catalog", reload_catalog_command))
+    application.add_handler(CommandHandler("rescore", rescore_command))
+    application.add_handler(CommandHandler("itemstats", itemstats_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("reminders", reminders_command))
+    application.add_handler(CommandHandler("routes", routes_command))
+    # Every button goes through the callback router
+    application.add_handler(CallbackQueryHandler(button_handler))
+
+    # Error handler
+    application.add_error_handler(error_handler)
+
 async def main():
     """Main function to set up and run the bot."""
     bot_token = os.getenv("BOT_TOKEN")
@@ -21,25 +49,36 @@ async def main():
         logger.error("BOT_TOKEN environment variable is missing!")
         return
 
+    # BOT_MODE=polling (default), webhook, or cluster (an ingress plus worker processes,
+    # each started with BOT_MODE=worker); see bot/webhook.py and bot/cluster.py
+    mode = os.getenv("BOT_MODE", "polling").lower()
+    if mode not in ("polling", "webhook", "cluster", "worker"):
+        logger.error("Unknown BOT_MODE %r, expected polling, webhook or cluster", mode)
+        return
+    if mode == "cluster":
+        try:
+            await run_cluster(bot_token)
+        except RuntimeError as e:
+            logger.error("Error running cluster: %s", e)
+        return
+
     global application
-    application = (
-        Application.builder()
-        .token(bot_token)
-        .concurrent_updates(True)
-        .build()
-    )
+    builder = Application.builder().token(bot_token)
+    # TELEGRAM_API_URL points the bot at another Bot API server (a local one, or bench/fake_telegram.py)
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if api_url:
+        builder = builder.base_url(api_url.rstrip("/") + "/bot").base_file_url(api_url.rstrip("/") + "/file/bot")
+    if mode in ("webhook", "worker"):
+        builder = builder.concurrent_updates(TrackingUpdateProcessor(int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))))
+    else:
+        builder = builder.concurrent_updates(True)
+    application = builder.build()
 
-    # Register handlers
-    application.add_handler(create_exam_conversation_handler())
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("clear", clear_command))
-    application.add_handler(CommandHandler("profile", profile_command))
-    application.add_handler(CommandHandler("results", results_command))
-    application.add_handler(CallbackQueryHandler(button_handler))
+    # Load the exam catalog once up front and pre-render its screens; handlers read them from memory
+    get_catalog().reload()
+    markup_cache.grades_menu()
 
-    # Error handler
-    application.add_error_handler(error_handler)
+    register_handlers(application)
 
     # Set bot commands (Khmer translated)
     bot_commands = [
@@ -47,17 +86,20 @@ async def main():
         BotCommand("help", "❓ ជំនួយ និង មជ្ឈមណ្ឌលគាំទ្រ"),
         BotCommand("profile", "👤 មើលប្រវត្តិរូប និងស្ថិតិរបស់អ្នក"),
         BotCommand("results", "📊 មើលលទ្ធផលការប្រឡងរបស់អ្នក"),
+        BotCommand("leaderboard", "🏆 តារាងពិន្ទុ និងចំណាត់ថ្នាក់របស់អ្នក"),
         BotCommand("clear", "🧹 សម្អាតសន្ទនា និងកំណត់ឡើងវិញសម័យ"),
     ]
-    await application.bot.set_my_commands(bot_commands)
+    # In a cluster only the first worker sets the bot's profile
+    if mode != "worker" or local_worker()[0] == 0:
+        await application.bot.set_my_commands(bot_commands)
 
-    # Set bot description in Khmer
-    await application.bot.set_my_description(
-        "🎓 ប្រព័ន្ធការប្រឡងសាលា​គ្រប់គ្រង - ធ្វើការប្រឡងផ្ទាល់ខ្លួន, តាមដានមុខងារ និងបង្កើនចំណេះដឹងរបស់អ្នកដោយការផ្តល់មតិយោបល់ភ្លាមៗ!"
-    )
-    await application.bot.set_my_short_description(
-        "🎓 ប្រព័ន្ធការប្រឡងសាលាគ្រប់គ្រងផ្ទាល់ខ្លួន"
-    )
+        # Set bot description in Khmer
+        await application.bot.set_my_description(
+            "🎓 ប្រព័ន្ធការប្រឡងសាលា​គ្រប់គ្រង - ធ្វើការប្រឡងផ្ទាល់ខ្លួន, តាមដានមុខងារ និងបង្កើនចំណេះដឹងរបស់អ្នកដោយការផ្តល់មតិយោបល់ភ្លាមៗ!"
+        )
+        await application.bot.set_my_short_description(
+            "🎓 ប្រព័ន្ធការប្រឡងសាលាគ្រប់គ្រងផ្ទាល់ខ្លួន"
+        )
 
     # Set up scheduler
     try:
@@ -74,17 +116,36 @@ async def main():
     logger.info("📊 ការប្រឡងដែលមានស្រាប់ត្រូវបានផ្ទុករួចរាល់")
     logger.info("🔧 មុខងារ៖ UI អភិវឌ្ឍន៍, មតិយោបល់ពេលពិត, ការតាមដានមុខងារ")
 
+    session_cache.flush_interval = int(os.getenv("SESSION_FLUSH_INTERVAL_MS", "300")) / 1000
+    session_cache.max_dirty = int(os.getenv("SESSION_FLUSH_MAX_DIRTY", "200"))
+    await session_cache.start(io_executor())
+    await asyncio.get_running_loop().run_in_executor(io_executor(), ensure_user_stats)
+    await asyncio.get_running_loop().run_in_executor(io_executor(), ensure_leaderboards)
+    sessions = local_sessions(await aload_user_sessions())
+    build_reminder_index(sessions)
+    exam_timers.attach(application.job_queue)
+    exam_timers.rebuild(sessions)
+    loop_lag_monitor.report_every = float(os.getenv("LOOP_LAG_REPORT_SECONDS", "60"))
+    loop_lag_monitor.start()
+
     try:
         await application.initialize()  # Explicitly initialize the application
-        await application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+        if mode in ("webhook", "worker"):
+            await run_webhook(application, register=mode == "webhook")
+        else:
+            await application.run_polling(
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES
+            )
     except Exception as e:
         logger.error("Error running bot: %s", e)
     finally:
+        await loop_lag_monitor.stop()
+        await session_cache.stop()  # Final flush of pending session writes
+        save_user_stats()
+        shutdown_io_executor()
         if scheduler is not None:
-            await scheduler.shutdown(wait=False)  # Await scheduler shutdown
+            scheduler.shutdown(wait=False)
             logger.info("🛑 Scheduler stopped")
         await application.shutdown()  # Ensure application shutdown
         logger.info("🛑 ប្រព័ន្ធបញ្ចប់ដំណើរការ")
@@ -1,60 +1,37 @@
 import logging
+import os
 from datetime import datetime
+from typing import Dict, Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ConversationHandler, ContextTypes
 
-from .storage import load_exam_database, get_user_session, load_user_sessions, save_user_sessions, load_exam_results, save_exam_results
+from .catalog import get_catalog
+from .paper import draw_paper, load_paper
+from .storage import aget_user_session, aupdate_user_session, aadd_exam_result, aget_user_result, user_lock
+from .reminders import reminder_index
+from .timers import exam_timers
+from .markup import markup_cache
+from .render import question_screen, result_screen, review_page
+from .router import cb_review
 
 logger = logging.getLogger(__name__)
 
 # Conversation states
 SELECTING_GRADE, SELECTING_SUBJECT, PREPARING_EXAM, TAKING_EXAM = range(4)
 
-async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Start an exam session based on callback data in Khmer."""
+async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, grade_id: str, subject_id: str):
+    """Start an exam session for a grade number and subject id in Khmer."""
     query = update.callback_query
     await query.answer()
 
-    # Step 1: Validate and parse callback data
-    try:
-        logger.info("Processing callback: %s", query.data)
-        if not query.data.startswith("exam_"):
-            raise ValueError(f"Invalid prefix in callback: {query.data}")
-
-        payload = query.data[len("exam_"):]  # Remove 'exam_' prefix
-        parts = payload.split("_")
-
-        if parts[0].isdigit():
-            grade_id = parts[0]
-            subject_id = "_".join(parts[1:])
-        elif parts[0].lower() == "grade" and len(parts) >= 3 and parts[1].isdigit():
-            grade_id = parts[1]
-            subject_id = "_".join(parts[2:])
-        else:
-            raise ValueError(f"Unexpected grade format in callback: {query.data}")
-
-        db_grade_id = f"grade_{grade_id}"
-        logger.info("Parsed grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
-    except AttributeError as e:
-        logger.error("Callback data is invalid or missing: %s", str(e))
-        await query.message.reply_text(
-            f"⚠️ កំហុសប្រព័ន្ធ៖ ទិន្នន័យហៅត្រឡប់មិនត្រឹមត្រូវ។ សូមព្យាយាមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
-    except (IndexError, ValueError) as e:
-        logger.error("Invalid callback format: %s, error: %s", query.data, str(e))
-        await query.message.reply_text(
-            f"⚠️ ការជ្រើសរើសការប្រឡងមិនត្រឹមត្រូវ៖ {query.data}។ សូមព្យាឯមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
+    # Step 1: Identify the exam (parsed from the callback data by the router)
+    db_grade_id = f"grade_{grade_id}"
+    logger.info("Parsed grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
 
     # Step 2: Load exam database
     try:
-        exam_db = load_exam_database()
-        logger.info("Available grades: %s", list(exam_db.keys()))
-        if not exam_db:
+        catalog = get_catalog()
+        if not catalog.grades():
             logger.error("Exam database is empty")
             await query.message.reply_text(
                 f"⚠️ កំហុសប្រព័ន្ធ៖ គ្មានការប្រឡងអាចប្រើបានទេ។ សូមព្យាយាមម្តងទៀតនៅពេលក្រោយ។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
@@ -70,7 +47,7 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return SELECTING_GRADE
 
     # Step 3: Validate grade and subject
-    grade_data = exam_db.get(db_grade_id)
+    grade_data = catalog.get_grade(grade_id)
     if not grade_data:
         logger.error("Grade %s not found in exam database", db_grade_id)
         await query.message.reply_text(
@@ -79,7 +56,7 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return SELECTING_GRADE
 
-    exam_data = grade_data.get('subjects', {}).get(subject_id)
+    _, exam_data = catalog.get_exam(grade_id, subject_id)
     if not exam_data:
         logger.error("Exam not found for grade %s, subject %s", db_grade_id, subject_id)
         await query.message.reply_text(
@@ -90,57 +67,48 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Step 4: Manage user session
     user_id = update.effective_user.id
-    try:
-        session = get_user_session(user_id)
-        logger.debug("Current session for user %s: %s", user_id, session)
-        if session.get("exam_active", False):
+    async with user_lock(user_id):
+        try:
+            session = await aget_user_session(user_id)
+            logger.debug("Current session for user %s: %s", user_id, session)
+            if session.get("exam_active", False):
+                await query.message.reply_text(
+                    f"⚠️ អ្នកកំពុងប្រឡងរួចហើយ។ សូមបញ្ចប់ ឬបញ្ឈប់ការប្រឡងជាមុនសិន។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
+                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
+                )
+                return SELECTING_GRADE
+
+            # Question banks: the session keeps only the paper's seed and question indices
+            exam = catalog.get_compiled(grade_id, subject_id)
+            paper = draw_paper(exam)
+            session.update({
+                "current_grade": grade_id,
+                "current_subject": subject_id,
+                "current_question": 0,
+                "answers": [],
+                "paper": paper.to_dict(),
+                "start_time": datetime.now().timestamp(),
+                "last_active": datetime.now().timestamp(),
+                "exam_active": True
+            })
+
+            await aupdate_user_session(user_id, session)
+            reminder_index.exam_started(user_id)
+            exam_timers.schedule(user_id, session)
+            logger.info("Updated session for user %s: %s", user_id, session)
+        except Exception as e:
+            logger.error("Session management error for user %s: %s", user_id, str(e))
             await query.message.reply_text(
-                f"⚠️ អ្នកកំពុងប្រឡងរួចហើយ។ សូមបញ្ចប់ ឬបញ្ឈប់ការប្រឡងជាមុនសិន។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
+                f"⚠️ កំហុសប្រព័ន្ធ៖ មិនអាចចាប់ផ្តើមវគ្គប្រឡងបានទេ។ សូមព្យាយាមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
             )
             return SELECTING_GRADE
 
-        session.update({
-            "current_grade": grade_id,
-            "current_subject": subject_id,
-            "current_question": 0,
-            "answers": [],
-            "start_time": datetime.now().timestamp(),
-            "exam_active": True
-        })
-
-        sessions = load_user_sessions()
-        sessions[user_id] = session
-        save_user_sessions(sessions)
-        logger.info("Updated session for user %s: %s", user_id, session)
-    except Exception as e:
-        logger.error("Session management error for user %s: %s", user_id, str(e))
-        await query.message.reply_text(
-            f"⚠️ កំហុសប្រព័ន្ធ៖ មិនអាចចាប់ផ្តើមវគ្គប្រឡងបានទេ។ សូមព្យាយាមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
-
-    # Step 5: Display exam details
-    duration = exam_data.get('duration', 'N/A')
-    description = exam_data.get('description', 'គ្មានការពិពណ៌នា')
-    grade_title = grade_data.get('title', 'ថ្នាក់មិនស្គាល់')
-    text = (
-        f"📝 <b>ការប្រឡង៖ {exam_data.get('title', 'ការប្រឡងគ្មានចំណងជើង')}</b>\n"
-        f"📚 <b>ថ្នាក់៖ {grade_title}</b>\n\n"
-        f"ℹ️ <b>ការពិពណ៌នា៖</b> {description}\n"
-        f"⏱️ <b>រយៈពេល៖</b> {duration} នាទី\n"
-        f"❓ <b>សំណួរ៖</b> {len(exam_data.get('questions', []))}\n\n"
-        f"តើអ្នកត្រៀមខ្លួនចាប់ផ្តើមការប្រឡងហើយឬនៅ?"
-    )
-
-    keyboard = [
-        [InlineKeyboardButton("✅ ចាប់ផ្តើមការប្រឡង", callback_data=f'begin_{grade_id}_{subject_id}')],
-        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
-    ]
+    # Step 5: Display exam details (rendered and escaped when the catalog was loaded)
+    text = exam.intro
 
     try:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+        await query.edit_message_text(text, reply_markup=markup_cache.exam_intro(grade_id, subject_id), parse_mode='HTML')
     except Exception as e:
         logger.error("Error displaying exam %s for user %s: %s", subject_id, user_id, str(e))
         await query.message.reply_text(
@@ -152,14 +120,17 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PREPARING_EXAM
 
 async def display_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Display the current question in the exam in Khmer."""
+    """Display the current question in the exam in Khmer.
+
+    Answers the query, unless it hands over to ``end_exam`` which does.
+    """
     query = update.callback_query
-    await query.answer()
 
     user_id = update.effective_user.id
-    session = get_user_session(user_id)
+    session = await aget_user_session(user_id)
     
     if not session.get("exam_active", False):
+        await query.answer()
         await query.message.reply_text(
             f"⚠️ គ្មានការប្រឡងសកម្ម។ សូមចាប់ផ្តើមការប្រឡងថ្មី។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
@@ -171,41 +142,32 @@ async def display_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db_grade_id = f'grade_{grade_id}'
     logger.info("Displaying question for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
     
-    exam_db = load_exam_database()
-    logger.info("Available grades: %s", list(exam_db.keys()))
-    exam_data = exam_db.get(db_grade_id, {}).get('subjects', {}).get(subject_id)
+    exam = get_catalog().get_compiled(grade_id, subject_id)
     
-    if not exam_data:
+    if not exam:
         logger.error("Exam data not found for grade %s, subject %s", db_grade_id, subject_id)
+        await query.answer()
         await query.message.reply_text(
             f"⚠️ មិនអាចរកឃើញទិន្នន័យការប្រឡងសម្រាប់ថ្នាក់ '{grade_id}' និងមុខវិជ្ជា '{subject_id}'។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
         )
         return SELECTING_GRADE
 
-    questions = exam_data.get('questions', [])
+    paper = load_paper(exam, session)
     current_question_idx = session["current_question"]
     
-    if current_question_idx >= len(questions):
+    if current_question_idx >= paper.total:
         return await end_exam(update, context, "បញ្ចប់")
-    
-    question_data = questions[current_question_idx]
-    question_number = current_question_idx + 1
-    total_questions = len(questions)
-    
-    text = (
-        f"❓ <b>សំណួរទី {question_number}/{total_questions}</b>\n\n"
-        f"{question_data['question']}\n\n"
-        f"ជ្រើសរើសចម្លើយ៖"
+
+    await query.answer()
+    text = question_screen(paper.question(current_question_idx).html, current_question_idx + 1, paper.total)
+    keyboard = markup_cache.question_keyboard(
+        grade_id, subject_id, current_question_idx,
+        paper.question_index(current_question_idx), paper.option_order(current_question_idx)
     )
     
-    keyboard = [
-        [InlineKeyboardButton(f"{chr(65+i)}. {opt}", callback_data=f'answer_{i}') for i, opt in enumerate(question_data['options'])]
-    ]
-    keyboard.append([InlineKeyboardButton("🏁 បញ្ចប់ការប្រឡង", callback_data='end_exam')])
-    
     try:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+        await query.edit_message_text(text, reply_markup=keyboard, parse_mode='HTML')
     except Exception as e:
         logger.error("Error displaying question %d for user %s: %s", current_question_idx, user_id, e)
         await query.message.reply_text(
@@ -215,148 +177,157 @@ async def display_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return TAKING_EXAM
 
-async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle user's answer and move to the next question in Khmer."""
-    query = update.callback_query
-    await query.answer()
+async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, position: Optional[int], answer_idx: int):
+    """Record the option chosen at paper ``position`` and move to the next question in Khmer.
 
-    user_id = update.effective_user.id
-    session = get_user_session(user_id)
-    
-    if not session.get("exam_active", False):
-        await query.message.reply_text(
-            f"⚠️ គ្មានការប្រឡងសកម្ម។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
-    
-    grade_id = session.get("current_grade")
-    subject_id = session.get("current_subject")
-    db_grade_id = f'grade_{grade_id}'
-    logger.info("Handling answer for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
-    
-    exam_db = load_exam_database()
-    logger.info("Available grades: %s", list(exam_db.keys()))
-    exam_data = exam_db.get(db_grade_id, {}).get('subjects', {}).get(subject_id)
-    
-    if not exam_data:
-        logger.error("Exam data not found for grade %s, subject %s", db_grade_id, subject_id)
-        await query.message.reply_text(
-            f"⚠️ មិនអាចរកឃើញទិន្នន័យការប្រឡងសម្រាប់ថ្នាក់ '{grade_id}' និងមុខវិជ្ជា '{subject_id}'។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
-    
-    current_question_idx = session["current_question"]
-    questions = exam_data.get('questions', [])
-    
-    if current_question_idx >= len(questions):
-        return await end_exam(update, context, "បញ្ចប់")
-    
-    try:
-        answer_idx = int(query.data.replace('answer_', ''))
-        session["answers"].append(answer_idx)
-        session["current_question"] += 1
-    except (IndexError, ValueError):
-        logger.error("Invalid answer callback data: %s", query.data)
-        await query.message.reply_text(
-            f"⚠️ ចម្លើយមិនត្រឹមត្រូវ�। សូមព្យាឯមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]"
-        )
-        return TAKING_EXAM
+    A tap whose position is not the current question (a double tap, or a
+    button on an older message) is answered and dropped. A button from
+    before positions were encoded (``position`` None) shows the current
+    question again instead of guessing which one it answers.
 
-    sessions = load_user_sessions()
-    sessions[user_id] = session
-    save_user_sessions(sessions)
-    
-    return await display_question(update, context)
-
-async def end_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, reason: str = "បញ្ចប់"):
-    """End the exam and display results in Khmer."""
+    The query is answered by ``display_question``/``end_exam`` on the way out;
+    Telegram accepts only one answer per query.
+    """
     query = update.callback_query
-    if query:
-        await query.answer()
 
     user_id = update.effective_user.id
-    session = get_user_session(user_id)
+    # Serialize double taps: one answer at a time per user
+    async with user_lock(user_id):
+        session = await aget_user_session(user_id)
     
-    if not session.get("exam_active", False):
-        if query:
+        if not session.get("exam_active", False):
+            await query.answer()
             await query.message.reply_text(
                 f"⚠️ គ្មានការប្រឡងសកម្ម។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
             )
-        return ConversationHandler.END
+            return SELECTING_GRADE
     
-    grade_id = session.get("current_grade")
-    subject_id = session.get("current_subject")
-    db_grade_id = f'grade_{grade_id}'
-    logger.info("Ending exam for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
+        grade_id = session.get("current_grade")
+        subject_id = session.get("current_subject")
+        db_grade_id = f'grade_{grade_id}'
+        logger.info("Handling answer for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
     
-    exam_db = load_exam_database()
-    logger.info("Available grades: %s", list(exam_db.keys()))
-    grade_data = exam_db.get(db_grade_id, {})
-    exam_data = grade_data.get('subjects', {}).get(subject_id)
+        exam = get_catalog().get_compiled(grade_id, subject_id)
     
-    if not exam_data:
-        if query:
+        if not exam:
             logger.error("Exam data not found for grade %s, subject %s", db_grade_id, subject_id)
+            await query.answer()
             await query.message.reply_text(
                 f"⚠️ មិនអាចរកឃើញទិន្នន័យការប្រឡងសម្រាប់ថ្នាក់ '{grade_id}' និងមុខវិជ្ជា '{subject_id}'។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
             )
-        return ConversationHandler.END
-    
-    questions = exam_data.get('questions', [])
-    answers = session["answers"]
-    
-    correct = sum(1 for i, ans in enumerate(answers) if i < len(questions) and ans == questions[i]["correct"])
-    total = len(answers)
-    score = (correct / total * 100) if total > 0 else 0
-    
-    results = load_exam_results()
-    if user_id not in results:
-        results[user_id] = []
-    
-    result = {
-        "grade_id": grade_id,
-        "subject_id": subject_id,
-        "exam_title": f"{grade_data.get('title', 'ថ្នាក់មិនស្គាល់')} - {exam_data.get('title', 'ការប្រឡងគ្មានចំណងជើង')}",
-        "score": score,
-        "correct": correct,
-        "total": total,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "answers": answers
-    }
-    results[user_id].append(result)
-    save_exam_results(results)
-    
-    session.update({
-        "current_grade": None,
-        "current_subject": None,
-        "current_question": 0,
-        "answers": [],
-        "start_time": None,
-        "exam_active": False
-    })
-    
-    sessions = load_user_sessions()
-    sessions[user_id] = session
-    save_user_sessions(sessions)
+            return SELECTING_GRADE
     
-    text = (
-        f"🏁 <b>ការប្រឡងបញ្ចប់</b>\n\n"
-        f"📝 <b>ការប្រឡង៖</b> {result['exam_title']}\n"
-        f"🎯 <b>ពិន្ទុ៖</b> {score:.1f}% ({correct}/{total} ត្រឹមត្រូវ)\n"
-        f"📅 <b>កាលបរិច្ឆេទ៖</b> {result['date']}\n\n"
-        f"ហេតុផលនៃការបញ្ចប់៖ {reason}\n"
-        f"តើអ្នកចង់ពិនិត្យចម្លើយរបស់អ្នក ឬត្រឡប់ទៅម៉ឺនុយដើមទេ?"
-    )
+        paper = load_paper(exam, session)
+        current_question_idx = session["current_question"]
+        if position is not None and position != current_question_idx:
+            logger.debug("Stale answer tap for position %d from user %s (now at %d)", position, user_id, current_question_idx)
+            await query.answer("⚠️ សំណួរនេះបានឆ្លើយរួចហើយ")
+            return TAKING_EXAM
+        finished = current_question_idx >= paper.total
+        if not finished and position is not None:
+            # Answers are kept as original option indices, whatever order they were shown in
+            session["answers"].append(paper.to_original(current_question_idx, answer_idx))
+            session["current_question"] += 1
+
+            await aupdate_user_session(user_id, session)
+
+    if finished:
+        return await end_exam(update, context, "បញ្ចប់")
+    return await display_question(update, context)
+
+async def end_exam(update: Optional[Update], context: ContextTypes.DEFAULT_TYPE, reason: str = "បញ្ចប់",
+                   user_id: Optional[int] = None, started_at: Optional[float] = None):
+    """End the exam and display results in Khmer.
+
+    Without an update (the exam timer) the user is given by ``user_id`` and the
+    results are sent as a new message. ``started_at`` ends the exam only if it
+    is still the one that started then.
+    """
+    query = update.callback_query if update else None
+    if query:
+        await query.answer()
+
+    if user_id is None:
+        user_id = update.effective_user.id
+    async with user_lock(user_id):
+        session = await aget_user_session(user_id)
+
+        if started_at is not None and (not session.get("exam_active") or session.get("start_time") != started_at):
+            logger.debug("Timer for user %s outlived its exam, ignoring", user_id)
+            return ConversationHandler.END
+
+        if not session.get("exam_active", False):
+            if query:
+                await query.message.reply_text(
+                    f"⚠️ គ្មានការប្រឡងសកម្ម។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
+                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
+                )
+            return ConversationHandler.END
+    
+        grade_id = session.get("current_grade")
+        subject_id = session.get("current_subject")
+        db_grade_id = f'grade_{grade_id}'
+        logger.info("Ending exam for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
+    
+        exam = get_catalog().get_compiled(grade_id, subject_id)
+        answers = session["answers"]
+
+        if started_at is not None and (not exam or not answers):
+            # The timer always closes the exam, but stores a result only if there is one to score
+            logger.info("Exam %s/%s of user %s timed out with %d answers, no result stored",
+                        grade_id, subject_id, user_id, len(answers))
+            await _close_exam(user_id, session)
+            await context.bot.send_message(
+                user_id,
+                f"🏁 <b>ការប្រឡងបញ្ចប់</b>\n\nហេតុផលនៃការបញ្ចប់៖ {reason}\nគ្មានលទ្ធផលត្រូវបានរក្សាទុកទេ។",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]]),
+                parse_mode='HTML'
+            )
+            return ConversationHandler.END
+
+        if not exam:
+            if query:
+                logger.error("Exam data not found for grade %s, subject %s", db_grade_id, subject_id)
+                await query.message.reply_text(
+                    f"⚠️ មិនអាចរកឃើញទិន្នន័យការប្រឡងសម្រាប់ថ្នាក់ '{grade_id}' និងមុខវិជ្ជា '{subject_id}'។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
+                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
+                )
+            return ConversationHandler.END
+
+        paper = load_paper(exam, session)
+        correct, total, score = paper.score(answers)
+    
+        result = {
+            "grade_id": grade_id,
+            "subject_id": subject_id,
+            "exam_title": exam.full_title,
+            "score": score,
+            "correct": correct,
+            "total": total,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "answers": answers
+        }
+        if update is not None:
+            # Shown on the leaderboards
+            result["name"] = update.effective_user.first_name
+        if paper.indices is not None:
+            result["paper"] = paper.to_dict()
+        result_idx = await aadd_exam_result(user_id, result)
+        await _close_exam(user_id, session)
+    
+    text = result_screen(result, reason)
     
     keyboard = [
-        [InlineKeyboardButton("📋 ពិនិត្យចម្លើយ", callback_data=f'review_{len(results[user_id])-1}')],
+        [InlineKeyboardButton("📋 ពិនិត្យចម្លើយ", callback_data=cb_review(result_idx))],
         [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
     ]
     
+    if query is None:
+        await context.bot.send_message(user_id, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+        return ConversationHandler.END
+
     try:
         await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
     except Exception as e:
@@ -368,22 +339,34 @@ async def end_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, reason: s
     
     return ConversationHandler.END
 
-async def review_exam_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Display detailed exam results with explanations in Khmer."""
+async def _close_exam(user_id: int, session: Dict):
+    """Clear the user's exam from their session (under their lock) and drop its timer."""
+    session.update({
+        "current_grade": None,
+        "current_subject": None,
+        "current_question": 0,
+        "answers": [],
+        "paper": None,
+        "start_time": None,
+        "last_active": datetime.now().timestamp(),
+        "exam_active": False
+    })
+
+    await aupdate_user_session(user_id, session)
+    reminder_index.exam_finished(user_id)
+    exam_timers.cancel(user_id)
+
+async def review_exam_details(update: Update, context: ContextTypes.DEFAULT_TYPE, result_idx: int, page: int = 0):
+    """Display one page of a past exam's answers and explanations in Khmer.
+
+    Pages are rendered on demand; the buttons carry only the result index and page.
+    """
     query = update.callback_query
     await query.answer()
     user_id = update.effective_user.id
-    try:
-        result_idx = int(query.data.replace('review_', ''))
-    except (IndexError, ValueError):
-        logger.error("Invalid review callback data: %s", query.data)
-        await query.message.reply_text(
-            f"⚠️ សំណើពិនិត្យឡើងវិញមិនត្រឹមត្រូវ។ [Error ID: ERR_{int(datetime.now().timestamp())}]"
-        )
-        return ConversationHandler.END
     
-    results = load_exam_results()
-    if user_id not in results or result_idx >= len(results[user_id]):
+    result = await aget_user_result(user_id, result_idx) if result_idx >= 0 else None
+    if result is None:
         logger.error("Result not found for user %s, result_idx %d", user_id, result_idx)
         await query.message.reply_text(
             f"⚠️ មិនអាចរកឃើញលទ្ធផល។ សូមព្យាឯមម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
@@ -391,18 +374,14 @@ async def review_exam_details(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return ConversationHandler.END
     
-    result = results[user_id][result_idx]
     grade_id = result.get("grade_id")
     subject_id = result.get("subject_id")
     db_grade_id = f'grade_{grade_id}'
-    logger.info("Reviewing exam for grade_id: %s, db_grade_id: %s, subject_id: %s", grade_id, db_grade_id, subject_id)
+    logger.info("Reviewing exam for grade_id: %s, db_grade_id: %s, subject_id: %s, page %d", grade_id, db_grade_id, subject_id, page)
     
-    exam_db = load_exam_database()
-    logger.info("Available grades: %s", list(exam_db.keys()))
-    grade_data = exam_db.get(db_grade_id, {})
-    exam_data = grade_data.get('subjects', {}).get(subject_id)
+    exam = get_catalog().get_compiled(grade_id, subject_id)
 
-    if not exam_data:
+    if not exam:
         logger.error("Exam data not found for grade %s, subject %s", db_grade_id, subject_id)
         await query.message.reply_text(
             f"⚠️ មិនអាចរកឃើញទិន្នន័យការប្រឡងសម្រាប់ថ្នាក់ '{grade_id}' និងមុខវិជ្ជា '{subject_id}'�। [Error ID: ERR_{int(datetime.now().timestamp())}]",
@@ -410,28 +389,17 @@ async def review_exam_details(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return ConversationHandler.END
     
-    questions = exam_data.get('questions', [])
-    answers = result["answers"]
-    
-    text = (
-        f"📋 <b>ពិនិត្យការប្រឡង៖ {result['exam_title']}</b>\n\n"
-        f"🎯 <b>ពិន្ទុ៖</b> {result['score']:.1f}% ({result['correct']}/{result['total']} ត្រឹមត្រូវ)\n"
-        f"📅 <b>កាលបរិច្ឆេទ៖</b> {result['date']}\n\n"
-        f"<b>លម្អិតចម្លើយ៖</b>\n"
-    )
-    
-    for i, (q, ans) in enumerate(zip(questions, answers)):
-        correct = q["correct"]
-        status = "✅ ត្រឹមត្រូវ" if ans == correct else "❌ មិនត្រឹមត្រូវ"
-        text += (
-            f"❓ <b>សំណួរទី {i+1}:</b> {q['question']}\n"
-            f"📝 <b>ចម្លើយរបស់អ្នក៖</b> {q['options'][ans]}\n"
-            f"✅ <b>ចម្លើយត្រឹមត្រូវ៖</b> {q['options'][correct]}\n"
-            f"ℹ️ <b>ការពន្យល់៖</b> {q.get('explanation', 'គ្មានការពន្យល់')}\n"
-            f"{status}\n\n"
-        )
-    
-    keyboard = [
+    page_size = int(os.getenv("REVIEW_PAGE_SIZE", "5"))
+    text, pages = review_page(load_paper(exam, result), result, page, page_size)
+    page = min(max(page, 0), pages - 1)
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("⬅️ មុន", callback_data=cb_review(result_idx, page - 1)))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("បន្ទាប់ ➡️", callback_data=cb_review(result_idx, page + 1)))
+    keyboard = [nav] if nav else []
+    keyboard += [
         [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')],
         [InlineKeyboardButton("🎯 ធ្វើការប្រឡងមួយទៀត", callback_data='take_exam')]
     ]
@@ -445,4 +413,4 @@ async def review_exam_details(update: Update, context: ContextTypes.DEFAULT_TYPE
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]])
         )
     
-    return ConversationHandler.END
\ No newline at end of file
+    return ConversationHandler.END
@@ -1,27 +1,38 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, ConversationHandler
+from telegram.ext import ContextTypes
 from bot.ui import send_main_menu, take_exam_menu, show_subjects_menu
-from bot.exam import start_exam, display_question, handle_answer, end_exam, review_exam_details, SELECTING_GRADE, SELECTING_SUBJECT, PREPARING_EXAM, TAKING_EXAM
-from bot.storage import load_exam_results, get_user_session, load_user_sessions, save_user_sessions, load_lessons
+from bot.exam import start_exam, display_question, handle_answer, end_exam, review_exam_details
+from bot.router import CallbackRouter, cb_review, parse_answer, parse_exam, parse_grade, parse_legacy_exam, parse_review
+from bot.storage import aget_standing, aget_recent_results, aget_user_stats, aget_user_session, aload_user_sessions, aupdate_user_session, new_user_session, load_lessons, user_lock, io_executor
+from bot.catalog import get_catalog
+from bot.markup import markup_cache
+from bot.broadcast import broadcast
+from bot.scheduler import prune_blocked_users, reminder_overview
+from bot.reminders import reminder_index
+from bot.timers import exam_timers
+import asyncio
+import html
 import logging
+import os
 from datetime import datetime
 import time
 
 
 logger = logging.getLogger(__name__)
 lessons_db = load_lessons()
+markup_cache.set_lessons(lessons_db)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced start command with user registration."""
     user = update.effective_user
     logger.info("ប្រព័ន្ធការប្រឡងបានចាប់ផ្តើមដោយអ្នកប្រើ %s (%s)", user.id, user.username or user.first_name)
     
-    results = load_exam_results()
-    if user.id not in results:
-        results[user.id] = []
-        from bot.storage import save_exam_results
-        save_exam_results(results)
-        
+    async with user_lock(user.id):
+        session = await aget_user_session(user.id)
+        session["last_active"] = time.time()
+        await aupdate_user_session(user.id, session)
+    reminder_index.touch(user.id)
+
     return await send_main_menu(update, context)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -73,18 +84,13 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_id = update.message.message_id
     user_id = update.effective_user.id
 
-    sessions = load_user_sessions()
-    if user_id in sessions:
-        sessions[user_id] = {
-            "current_exam": None,
-            "current_question": 0,
-            "answers": [],
-            "start_time": None,
-            "exam_active": False
-        }
-        from bot.storage import save_user_sessions
-        save_user_sessions(sessions)
-    
+    async with user_lock(user_id):
+        session = new_user_session()
+        session["last_active"] = time.time()
+        await aupdate_user_session(user_id, session)
+    reminder_index.cleared(user_id)
+    exam_timers.cancel(user_id)
+
     context.user_data.clear()
     logger.info("សម្អាតទិន្នន័យសម័យសម្រាប់អ្នកប្រើ %s", user_id)
 
@@ -105,13 +111,13 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Quick profile command."""
     user = update.effective_user
     user_id = user.id
-    results = load_exam_results()
+    stats = await aget_user_stats(user_id)
     
-    if results:
-        avg_score = sum(r["score"] for r in results.get(user_id, [])) / len(results.get(user_id, [])) if results.get(user_id, []) else 0
-        best_score = max((r["score"] for r in results.get(user_id, [])), default=0)
-        total_exams = len(results.get(user_id, []))
-        subjects_taken = len(set(r["exam_id"] for r in results.get(user_id, [])))
+    if stats:
+        avg_score = stats.average
+        best_score = stats.best
+        total_exams = stats.count
+        subjects_taken = len(stats.subjects)
     else:
         avg_score = best_score = total_exams = subjects_taken = 0
     
@@ -136,16 +142,19 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')]
     ]
     
-    await update.callback_query.edit_message_text(
-        text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML'
-    )
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML'
+        )
+    else:
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
 async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Quick results command."""
     user_id = update.effective_user.id
-    results = load_exam_results().get(user_id, [])
+    stats = await aget_user_stats(user_id)
     
-    if not results:
+    if not stats:
         text = (
             "📊 <b>លទ្ធផលការប្រឡងរបស់អ្នក</b>\n\n"
             "🔍 មិនមានលទ្ធផលការប្រឡង។\n"
@@ -157,10 +166,10 @@ async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')]
         ]
     else:
-        total_exams = len(results)
-        avg_score = sum(r["score"] for r in results) / total_exams
-        best_score = max(r["score"] for r in results)
-        recent_results = results[-5:]
+        total_exams = stats.count
+        avg_score = stats.average
+        best_score = stats.best
+        recent_results = list(stats.recent)
         
         text = (
             f"📊 <b>ផ្ទាំងគ្រប់គ្រងលទ្ធផលការប្រឡងរបស់អ្នក</b>\n\n"
@@ -168,20 +177,19 @@ async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• ចំនួនការប្រឡងសរុប: <b>{total_exams}</b>\n"
             f"• ពិន្ទុមធ្យម: <b>{avg_score:.1f}%</b>\n"
             f"• ពិន្ទុល្អបំផុត: <b>{best_score:.1f}%</b>\n"
-            f"• ការប្រឡងចុងក្រោយ: {results[-1]['date'][:10]}\n\n"
+            f"• ការប្រឡងចុងក្រោយ: {recent_results[-1]['date'][:10]}\n\n"
             f"📈 <b>លទ្ធផលថ្មីៗ:</b>\n"
         )
         
         for i, result in enumerate(recent_results):
             date = result["date"][:10]
-            text += f"• {result['exam_title']}: <b>{result['score']:.1f}%</b> ({date})\n"
+            text += f"• {html.escape(result['exam_title'], quote=False)}: <b>{result['score']:.1f}%</b> ({date})\n"
         
         keyboard = []
-        for i, result in enumerate(results[-3:]):
-            idx = len(results) - len(results[-3:]) + i
+        for result in recent_results[-3:]:
             keyboard.append([InlineKeyboardButton(
                 f"📋 ពិនិត្យឡើងវិញ: {result['exam_title'][:20]}...", 
-                callback_data=f'review_{idx}'
+                callback_data=cb_review(result['idx'])
             )])
         
         keyboard.extend([
@@ -199,107 +207,377 @@ async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error("កំហុសក្នុងការបង្ហាញលទ្ធផល: %s", e)
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Enhanced button handler for all UI interactions."""
-    query = update.callback_query
-    await query.answer()
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Top students of a grade/subject and the caller's own rank.
 
-    if not query.data:
+    ``/leaderboard <grade> <subject>``; without arguments, the subject of the
+    caller's latest exam.
+    """
+    user_id = update.effective_user.id
+    if len(context.args or ()) >= 2:
+        grade_id, subject_id = context.args[0], context.args[1]
+    else:
+        recent = await aget_recent_results(user_id, 1)
+        if not recent or not recent[-1].get("subject_id"):
+            await update.message.reply_text(
+                "🏆 សូមធ្វើការប្រឡងមួយជាមុនសិន ឬប្រើ: /leaderboard <ថ្នាក់> <មុខវិជ្ជា>",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🎯 ធ្វើការប្រឡង", callback_data='take_exam')]])
+            )
+            return
+        grade_id, subject_id = str(recent[-1].get("grade_id")), recent[-1]["subject_id"]
+
+    exam = get_catalog().get_compiled(grade_id, subject_id)
+    standing = await aget_standing(grade_id, subject_id, user_id, int(os.getenv("LEADERBOARD_SIZE", "10")))
+    if exam is None or standing is None:
+        await update.message.reply_text("🏆 មិនទាន់មានលទ្ធផលសម្រាប់ការប្រឡងនេះទេ។")
         return
 
-    try:
-        if query.data == 'main_menu':
-            return await send_main_menu(update, context)
-        elif query.data == 'take_exam':
-            return await take_exam_menu(update, context)
-        elif query.data == 'view_results':
-            return await results_command(update, context)
-        elif query.data == 'help':
-            return await help_command(update, context)
-        elif query.data == 'exam_schedule':
-            text = (
-                "⏰ <b>ព័ត៌មានកាលវិភាគការប្រឡង</b>\n\n"
-                "📅 <b>ការប្រឡងខាងមុខ:</b>\n"
-                "• ថ្នាក់ទី ១: មានស្រាប់\n"
-                "• ថ្នាក់ទី ២: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៣: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៤: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៥: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៦: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៧: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៨: មានស្រាប់\n"
-                "• ថ្នាក់ទី ៩: មានស្រាប់\n"
-                "• ថ្នាក់ទី ១០: មានស្រាប់\n"
-                "• ថ្នាក់ទី ១៧: មានស្រាប់\n"
-                "• ថ្នាក់ទី ១២: មានស្រាប់\n\n"
-                "🕐 <b>ម៉ោងដំណើរការ:</b>\n"
-                "• ច័ន្ទ - សុក្រ: ២៤ ម៉ោង\n"
-                "• សៅរ៍ - អាទិត្យ: ២៤ ម៉ោង\n\n"
-                "⚡ ការប្រឡងទាំងអស់អាចធ្វើបានគ្រប់ពេល!"
-            )
-            keyboard = [
-                [InlineKeyboardButton("🎯 ធ្វើការប្រឡងឥឡូវនេះ", callback_data='take_exam')],
-                [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
-            ]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-        elif query.data.startswith('exam_'):
-            return await start_exam(update, context)
-        elif query.data.startswith('begin_'):
-            session = get_user_session(update.effective_user.id)
-            session["start_time"] = time.time()
-            sessions = load_user_sessions()
-            sessions[update.effective_user.id] = session
-            save_user_sessions(sessions)
-            return await display_question(update, context)
-        elif query.data.startswith('answer_'):
-            return await handle_answer(update, context)
-        elif query.data == 'end_exam':
-            return await end_exam(update, context, "ended")
-        elif query.data == 'study_materials':
-            text = (
-                "📚 <b>ជ្រើសរើសថ្នាក់រៀនសម្រាប់ធនធានសិក្សា</b>\n\n"
-                "សូមជ្រើសរើសថ្នាក់រៀន៖"
-            )
-            keyboard = []
-            for grade_num in sorted(lessons_db):
-                grade_title = lessons_db[grade_num].get("title", f"ថ្នាក់ទី {grade_num}")
-                keyboard.append([InlineKeyboardButton(grade_title, callback_data=f'study_grade_{grade_num}')])
-            keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')])
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-        elif query.data == 'profile':
-            return await profile_command(update, context)
-        elif query.data == 'settings':
-            text = (
-                "⚙️ <b>ការកំណត់ និងចំណង់ចំណូលចិត្ត</b>\n\n"
-                "🔧 <b>ការកំណត់ការប្រឡង:</b>\n"
-                "• ការជូនដំណឹង: ✅ បើក\n"
-                "• សម្លេង: ✅ បើក\n"
-                "• ដាក់សំណើរដោយស្វ័យប្រវត្តិពេលពេលវេលាសម័យ: ✅ បើក\n"
-                "• បង្ហាញការពន្យល់: ✅ បើក\n\n"
-                "🌍 <b>ភាសា និងតំបន់:</b>\n"
-                "• ភាសា: ភាសាខ្មែរ\n"
-                "• ម៉ោងតំបន់: កំណត់ដោយស្វ័យប្រវត្តិ\n\n"
-                "📊 <b>ការកំណត់ភាពឯកជន:</b>\n"
-                "• ចែករំលែកលទ្ធផល: 🔒 ឯកជន\n"
-                "• វិភាគសមត្ថភាព: ✅ បើក"
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    text = f"🏆 <b>តារាងពិន្ទុ៖ {html.escape(exam.full_title, quote=False)}</b>\n\n"
+    for rank, uid, name, score in standing["top"]:
+        you = " 👈" if uid == user_id else ""
+        text += f"{medals.get(rank, f'{rank}.')} {html.escape(name, quote=False)} — <b>{score:.1f}%</b>{you}\n"
+    text += f"\n👥 សិស្សសរុប: {standing['students']}\n"
+    if standing["rank"] is not None:
+        text += f"📍 ចំណាត់ថ្នាក់របស់អ្នក: <b>#{standing['rank']}</b> ({standing['score']:.1f}%)"
+    else:
+        text += "📍 អ្នកមិនទាន់បានធ្វើការប្រឡងនេះទេ។"
+    await update.message.reply_text(text, parse_mode='HTML')
+
+def is_admin(user_id: int) -> bool:
+    """Check the caller against the comma-separated ADMIN_IDS environment variable."""
+    admin_ids = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()}
+    return user_id in admin_ids
+
+async def reload_catalog_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: reload the exam and lesson catalogs and report their stats."""
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ reload catalog", update.effective_user.id)
+        return
+
+    global lessons_db
+    catalog = get_catalog()
+    # Reading, hashing and compiling a large catalog would stall every other update
+    loop = asyncio.get_running_loop()
+    swapped = await loop.run_in_executor(io_executor(), catalog.reload)
+    stats = catalog.stats()
+    lessons_db = await loop.run_in_executor(io_executor(), load_lessons)
+    markup_cache.set_lessons(lessons_db)
+    markup_cache.grades_menu()  # rebuild the keyboards for the new version up front
+    text = (
+        f"🔄 <b>Exam catalog</b>\n\n"
+        f"• Reloaded: {'✅' if swapped else '➖ unchanged'}\n"
+        f"• Version: <b>{stats['version']}</b> ({html.escape(stats['path'])})\n"
+        f"• Grades / exams: {stats['grades']} / {stats['exams']}\n"
+        f"• Load time: {stats['load_time_ms']} ms\n"
+        f"• Reload count: {stats['reload_count']}\n"
+        f"• Lesson grades: {len(lessons_db)}\n"
+        f"• Cached keyboards: {markup_cache.stats()['cached']}"
+    )
+    await update.message.reply_text(text, parse_mode='HTML')
+
+async def rescore_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: re-score all stored results against the current answer keys.
+
+    ``/rescore dry`` reports what would change without saving.
+    """
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ rescore", update.effective_user.id)
+        return
+
+    from bot.scoring import rescore_all
+    dry_run = bool(context.args) and context.args[0].lower() == "dry"
+    stats = await asyncio.get_running_loop().run_in_executor(io_executor(), rescore_all, dry_run)
+    text = (
+        f"🧮 <b>Re-score{' (dry run)' if dry_run else ''}</b>\n\n"
+        f"• Exams: {stats['exams']}\n"
+        f"• Results re-scored: {stats['rescored']}\n"
+        f"• Scores changed: <b>{stats['changed']}</b>\n"
+        f"• Skipped (legacy/unknown exam): {stats['skipped']}"
+    )
+    await update.message.reply_text(text, parse_mode='HTML')
+
+async def itemstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: item analysis of all stored results.
+
+    ``/itemstats [grade] [subject]`` limits it to one grade and/or subject and
+    lists the questions that look too easy, too hard, weak or miskeyed.
+    """
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ itemstats", update.effective_user.id)
+        return
+
+    from bot.analytics import analyze_all
+    grade_id = context.args[0] if context.args else None
+    subject_id = context.args[1] if len(context.args or ()) > 1 else None
+    report = await asyncio.get_running_loop().run_in_executor(
+        io_executor(), lambda: analyze_all(grade_id, subject_id, items=False)
+    )
+    scope = f" ({html.escape(grade_id)}/{html.escape(subject_id or '*')})" if grade_id else ""
+    text = (
+        f"🔬 <b>Item analysis</b>{scope}\n\n"
+        f"• Answers / sittings: {report['rows']} / {report['sittings']}\n"
+        f"• Time: {report['load_seconds']} s load + {report['analysis_seconds']} s analysis\n"
+        f"• Items need ≥ {report['min_responses']} responses to be flagged\n"
+    )
+    labels = {"miskeyed": "Possibly miskeyed", "too_hard": "Too hard", "too_easy": "Too easy",
+              "low_discrimination": "Low discrimination"}
+    for name, label in labels.items():
+        items = report["flags"][name]
+        text += f"\n<b>{label}:</b> {len(items)}\n"
+        for item in sorted(items, key=lambda i: i["discrimination"] if i["discrimination"] is not None else 0)[:5]:
+            text += (
+                f"  • {html.escape(item['grade_id'])}/{html.escape(item['subject_id'])} Q{item['question'] + 1}: "
+                f"p={item['difficulty']}, r={item['discrimination']}, options {item['options']} (key {chr(65 + item['key'])})\n"
             )
-            keyboard = [
-                [InlineKeyboardButton("🔔 ការកំណត់ការជូនដំណឹង", callback_data='notifications')],
-                [InlineKeyboardButton("🌐 ការកំណត់ភាសា", callback_data='language')],
-                [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
-            ]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-        elif query.data.startswith('review_'):
-            return await review_exam_details(update, context)
-        else:
-            return await send_main_menu(update, context)
+    await update.message.reply_text(text, parse_mode='HTML')
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: ``/broadcast <text>`` sends an announcement to every known user.
+
+    The broadcast runs in the background; the admin gets a summary when it finishes.
+    """
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ broadcast", update.effective_user.id)
+        return
+
+    text = update.message.text.partition(' ')[2].strip()
+    if not text:
+        await update.message.reply_text("ប្រើ: /broadcast <សារ>")
+        return
+
+    sessions = await aload_user_sessions()
+    chat_id = update.effective_chat.id
+
+    async def run():
+        report = await broadcast(
+            context.bot, [int(uid) for uid in sessions], text,
+            name="announcement", on_blocked=prune_blocked_users
+        )
+        stats = report.to_dict()
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=(
+                f"📣 <b>Broadcast finished</b>\n\n"
+                f"• Sent: {stats['sent']}/{stats['total']}\n"
+                f"• Blocked (pruned): {stats['blocked']}\n"
+                f"• Failed: {stats['failed']}\n"
+                f"• Retries: {stats['retried']}\n"
+                f"• Time: {stats['elapsed_sec']} s ({stats['msg_per_sec']} msg/s)"
+            ),
+            parse_mode='HTML'
+        )
+
+    context.application.create_task(run())
+    await update.message.reply_text(f"📣 កំពុងផ្ញើទៅអ្នកប្រើ {len(sessions)} នាក់...")
+
+async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: show the reminder schedule and when the caller is next due."""
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ reminders", update.effective_user.id)
+        return
+
+    overview = reminder_overview(update.effective_user.id)
+    fmt = lambda ts: datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "—"
+    upcoming = "\n".join(f"  {fmt(tick['time'])} (slot {tick['slot']})" for tick in overview["upcoming"])
+    text = (
+        f"⏰ <b>Reminder schedule</b>\n\n"
+        f"• Interval: {overview['interval_minutes']:.0f} min in {overview['slots']} slots\n"
+        f"• Last slot sent: {fmt(overview['last_tick_time'])}\n"
+        f"• Job next run: {fmt(overview['job_next_run'])}\n"
+        f"• Users indexed / unfinished exams: {overview['users']} / {overview['pending']}\n"
+        f"• Your next slot: {fmt(overview['user_next_fire'])}\n\n"
+        f"Upcoming:\n{upcoming}"
+    )
+    await update.message.reply_text(text, parse_mode='HTML')
+
+async def exam_schedule_screen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Exam schedule information."""
+    text = (
+        "⏰ <b>ព័ត៌មានកាលវិភាគការប្រឡង</b>\n\n"
+        "📅 <b>ការប្រឡងខាងមុខ:</b>\n"
+        "• ថ្នាក់ទី ១: មានស្រាប់\n"
+        "• ថ្នាក់ទី ២: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៣: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៤: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៥: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៦: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៧: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៨: មានស្រាប់\n"
+        "• ថ្នាក់ទី ៩: មានស្រាប់\n"
+        "• ថ្នាក់ទី ១០: មានស្រាប់\n"
+        "• ថ្នាក់ទី ១៧: មានស្រាប់\n"
+        "• ថ្នាក់ទី ១២: មានស្រាប់\n\n"
+        "🕐 <b>ម៉ោងដំណើរការ:</b>\n"
+        "• ច័ន្ទ - សុក្រ: ២៤ ម៉ោង\n"
+        "• សៅរ៍ - អាទិត្យ: ២៤ ម៉ោង\n\n"
+        "⚡ ការប្រឡងទាំងអស់អាចធ្វើបានគ្រប់ពេល!"
+    )
+    keyboard = [
+        [InlineKeyboardButton("🎯 ធ្វើការប្រឡងឥឡូវនេះ", callback_data='take_exam')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
+    ]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+async def begin_exam(update: Update, context: ContextTypes.DEFAULT_TYPE, grade_id: str, subject_id: str):
+    """Start the exam clock and show the first question."""
+    async with user_lock(update.effective_user.id):
+        session = await aget_user_session(update.effective_user.id)
+        session["start_time"] = time.time()
+        await aupdate_user_session(update.effective_user.id, session)
+        # The clock restarts when the first question is shown
+        exam_timers.schedule(update.effective_user.id, session)
+    return await display_question(update, context)
+
+async def study_materials_screen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Lesson grades to pick study resources from."""
+    text = (
+        "📚 <b>ជ្រើសរើសថ្នាក់រៀនសម្រាប់ធនធានសិក្សា</b>\n\n"
+        "សូមជ្រើសរើសថ្នាក់រៀន៖"
+    )
+    await update.callback_query.edit_message_text(text, reply_markup=markup_cache.study_menu(), parse_mode='HTML')
+
+async def study_grade_screen(update: Update, context: ContextTypes.DEFAULT_TYPE, grade_num: str):
+    """Study resources of one lesson grade."""
+    lesson = lessons_db.get(grade_num)
+    if not lesson:
+        text = "⚠️ មិនមានធនធានសិក្សាសម្រាប់ថ្នាក់នេះទេ។"
+    else:
+        resources = "\n".join(f"• {html.escape(r)}" for r in lesson.get("resources", [])) or "• —"
+        external = "\n".join(f"• {html.escape(r)}" for r in lesson.get("external", [])) or "• —"
+        text = (
+            f"📚 <b>{html.escape(lesson.get('title', f'ថ្នាក់ទី {grade_num}'))} - ធនធានសិក្សា</b>\n\n"
+            f"📖 <b>ឯកសារសិក្សា:</b>\n{resources}\n\n"
+            f"🌐 <b>ធនធានខាងក្រៅ:</b>\n{external}"
+        )
+    keyboard = [
+        [InlineKeyboardButton("🎯 ធ្វើការប្រឡង", callback_data='take_exam')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅសម្ភារៈសិក្សា", callback_data='study_materials')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
+    ]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+def _on_off(enabled: bool) -> str:
+    return "✅ បើក" if enabled else "❌ បិទ"
+
+async def settings_screen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Settings overview."""
+    session = await aget_user_session(update.effective_user.id)
+    text = (
+        "⚙️ <b>ការកំណត់ និងចំណង់ចំណូលចិត្ត</b>\n\n"
+        "🔧 <b>ការកំណត់ការប្រឡង:</b>\n"
+        f"• ការជូនដំណឹង: {_on_off(session.get('notifications', True))}\n"
+        "• សម្លេង: ✅ បើក\n"
+        "• ដាក់សំណើរដោយស្វ័យប្រវត្តិពេលពេលវេលាសម័យ: ✅ បើក\n"
+        "• បង្ហាញការពន្យល់: ✅ បើក\n\n"
+        "🌍 <b>ភាសា និងតំបន់:</b>\n"
+        "• ភាសា: ភាសាខ្មែរ\n"
+        "• ម៉ោងតំបន់: កំណត់ដោយស្វ័យប្រវត្តិ\n\n"
+        "📊 <b>ការកំណត់ភាពឯកជន:</b>\n"
+        "• ចែករំលែកលទ្ធផល: 🔒 ឯកជន\n"
+        "• វិភាគសមត្ថភាព: ✅ បើក"
+    )
+    keyboard = [
+        [InlineKeyboardButton("🔔 ការកំណត់ការជូនដំណឹង", callback_data='notifications')],
+        [InlineKeyboardButton("🌐 ការកំណត់ភាសា", callback_data='language')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
+    ]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+async def notifications_screen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reminder opt-in/out."""
+    session = await aget_user_session(update.effective_user.id)
+    enabled = session.get("notifications", True)
+    text = (
+        "🔔 <b>ការកំណត់ការជូនដំណឹង</b>\n\n"
+        f"• ការរំលឹកការប្រឡង: {_on_off(enabled)}\n\n"
+        "ការរំលឹកត្រូវបានផ្ញើនៅពេលអ្នកមានការប្រឡងមិនទាន់បញ្ចប់ ឬមិនបានសកម្មយូរ។"
+    )
+    keyboard = [
+        [InlineKeyboardButton("🔕 បិទការរំលឹក" if enabled else "🔔 បើកការរំលឹក", callback_data='notifications_toggle')],
+        [InlineKeyboardButton("⬅️ ត្រឡប់ទៅការកំណត់", callback_data='settings')]
+    ]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+async def toggle_notifications(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Flip the reminder opt-in and show the notifications screen again."""
+    user_id = update.effective_user.id
+    async with user_lock(user_id):
+        session = await aget_user_session(user_id)
+        session["notifications"] = not session.get("notifications", True)
+        await aupdate_user_session(user_id, session)
+    reminder_index.set_muted(user_id, not session["notifications"])
+    return await notifications_screen(update, context)
+
+async def language_screen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Language settings; Khmer is the only interface language for now."""
+    text = (
+        "🌐 <b>ការកំណត់ភាសា</b>\n\n"
+        "• ភាសាបច្ចុប្បន្ន: 🇰🇭 ភាសាខ្មែរ\n\n"
+        "ភាសាផ្សេងទៀតនឹងមាននាពេលខាងមុខ។"
+    )
+    keyboard = [[InlineKeyboardButton("⬅️ ត្រឡប់ទៅការកំណត់", callback_data='settings')]]
+    await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+def create_callback_router() -> CallbackRouter:
+    """Every callback route: static screens by exact match, parameterized ones by prefix.
+
+    Legacy (v0) prefixes stay registered so buttons in messages sent before
+    the compact encoding keep working.
+    """
+    router = CallbackRouter(fallback=send_main_menu)
+    router.exact('main_menu', send_main_menu)
+    router.exact('take_exam', take_exam_menu)
+    router.exact('view_results', results_command)
+    router.exact('help', help_command)
+    router.exact('profile', profile_command)
+    router.exact('exam_schedule', exam_schedule_screen)
+    router.exact('study_materials', study_materials_screen)
+    router.exact('settings', settings_screen)
+    router.exact('notifications', notifications_screen)
+    router.exact('notifications_toggle', toggle_notifications)
+    router.exact('language', language_screen)
+    router.exact('end_exam', lambda u, c: end_exam(u, c, "ended"), answers=True)
+
+    router.prefix('g:', show_subjects_menu, parse_grade, name='grade', answers=True)
+    router.prefix('e:', start_exam, parse_exam, name='exam', answers=True)
+    router.prefix('b:', begin_exam, parse_exam, name='begin', answers=True)
+    router.prefix('a:', handle_answer, parse_answer, name='answer', answers=True)
+    router.prefix('r:', review_exam_details, parse_review, name='review', answers=True)
+    router.prefix('s:', study_grade_screen, lambda p: (p,), name='study_grade')
+
+    router.prefix('grade_', show_subjects_menu, parse_grade, name='grade_v0', answers=True)
+    router.prefix('exam_', start_exam, parse_legacy_exam, name='exam_v0', answers=True)
+    router.prefix('begin_', begin_exam, parse_legacy_exam, name='begin_v0', answers=True)
+    router.prefix('answer_', handle_answer, parse_answer, name='answer_v0', answers=True)
+    router.prefix('review_', review_exam_details, lambda p: parse_review(p, '_'), name='review_v0', answers=True)
+    router.prefix('study_grade_', study_grade_screen, lambda p: (p,), name='study_grade_v0')
+    return router
+
+callback_router = create_callback_router()
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Single entry point for every button: dispatches through the callback router."""
+    query = update.callback_query
+    try:
+        return await callback_router.dispatch(update, context)
     except Exception as e:
-        logger.error("កំហុសនៅ button_handler: %s", e)
+        logger.error("កំហុសនៅ button_handler (%s): %s", query.data, e)
         await query.message.reply_text(
             "⚠️ មានកំហុសកើតឡើង។ សូមព្យាយាមម្តងទៀត។",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 មុខងារមេនុយ", callback_data='main_menu')]])
         )
 
+async def routes_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: per-route callback hit counters."""
+    if not is_admin(update.effective_user.id):
+        logger.warning("អ្នកប្រើ %s មិនមានសិទ្ធិ routes", update.effective_user.id)
+        return
+
+    hits = callback_router.stats()
+    lines = "\n".join(f"• {html.escape(name)}: {count}" for name, count in hits.items()) or "• —"
+    await update.message.reply_text(f"🧭 <b>Callback routes</b>\n\n{lines}", parse_mode='HTML')
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Enhanced error handler with better user experience."""
     error_id = f"ERR_{int(time.time())}"
@@ -335,30 +613,3 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
     except Exception:
         logger.error("បរាជ័យក្នុងការផ្ញើសារកំហុសសម្រាប់កំហុស %s", error_id)
-
-def create_exam_conversation_handler():
-    return ConversationHandler(
-        entry_points=[
-            CallbackQueryHandler(take_exam_menu, pattern='^take_exam$')
-        ],
-        states={
-            SELECTING_GRADE: [
-                CallbackQueryHandler(show_subjects_menu, pattern="^grade_"),
-            ],
-            SELECTING_SUBJECT: [
-                CallbackQueryHandler(start_exam, pattern="^exam_"),
-                CallbackQueryHandler(take_exam_menu, pattern="^take_exam$"),
-            ],
-            PREPARING_EXAM: [
-                CallbackQueryHandler(display_question, pattern="^begin_"),
-            ],
-            TAKING_EXAM: [
-                CallbackQueryHandler(handle_answer, pattern="^answer_"),
-                CallbackQueryHandler(lambda u, c: end_exam(u, c, "ended"), pattern="^end_exam$"),
-            ],
-        },
-        fallbacks=[
-            CallbackQueryHandler(send_main_menu, pattern="^main_menu$"),
-        ],
-        allow_reentry=True,
-    )
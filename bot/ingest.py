@@ -0,0 +1,585 @@
+"""Offline ingestion of the exam catalog.
+
+    python -m bot.ingest [data/exam_data.json] [--output data/exam_catalog.json] [--report errors.json]
+
+Stream-parses the source catalog, validating each question as soon as it has
+been read against the precompiled schema below, and writes the valid grades,
+subjects and questions to a compact artifact that the bot loads at startup
+without validating again (see ``bot.catalog.get_catalog``). Every problem is
+reported with its JSON path. Invalid subjects are left out of the artifact;
+an invalid question becomes ``null``, so the questions after it keep their
+index (stored answers refer to questions by position, see bot/paper.py).
+With ``--strict`` no artifact is written at all if anything is invalid.
+
+Memory stays bounded by the largest subject, not by the size of the file.
+"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from bot.render import BUTTON_ROW_LIMIT, BUTTON_TEXT_LIMIT, MESSAGE_LIMIT, QUESTION_FOOTER, question_head, text_length, visible_length
+
+logger = logging.getLogger(__name__)
+
+# Marks a file as an ingested artifact; bump when its layout changes
+ARTIFACT_FORMAT = "exam-catalog/1"
+# Longest question text that fits on the question screen of any exam
+QUESTION_TEXT_LIMIT = MESSAGE_LIMIT - visible_length(question_head(99999, 99999) + QUESTION_FOOTER)
+
+Problems = List[Tuple[str, str]]
+Validator = Callable[[object, str, Problems], bool]
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def child_path(path: str, key) -> str:
+    """JSON path of a member (``$.a.b``, ``$.a["b c"]``) or array element (``$.a[3]``)."""
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    return f"{path}.{key}" if _IDENTIFIER.match(key) else f"{path}[{json.dumps(key, ensure_ascii=False)}]"
+
+
+class Field:
+    """Declarative constraints on one value; compiled to a validator by ``compile_field``."""
+    __slots__ = ("types", "required", "min_length", "max_length", "min_items", "max_items",
+                 "minimum", "items")
+
+    def __init__(self, types, required: bool = True, min_length: Optional[int] = None,
+                 max_length: Optional[int] = None, min_items: Optional[int] = None,
+                 max_items: Optional[int] = None, minimum: Optional[float] = None,
+                 items: Optional["Field"] = None):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_items = min_items
+        self.max_items = max_items
+        self.minimum = minimum
+        self.items = items
+
+
+def _type_name(types: Tuple[type, ...]) -> str:
+    names = {str: "a string", int: "an integer", float: "a number", bool: "true/false", list: "an array", dict: "an object"}
+    return " or ".join(names.get(t, t.__name__) for t in types)
+
+
+def compile_field(field: Field) -> Validator:
+    """Build the validator of one field once; it appends ``(path, message)`` problems.
+
+    Only the checks a field declares end up in its validator.
+    """
+    checks: List[Validator] = []
+    types = field.types
+    numeric = int in types or float in types
+
+    def check_type(value, path, problems):
+        # bool is an int subclass but never a valid number here
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            problems.append((path, f"expected {_type_name(types)}, got {json.dumps(value, ensure_ascii=False)[:40]}"))
+            return False
+        return True
+    checks.append(check_type)
+
+    if field.min_length is not None or field.max_length is not None:
+        low, high = field.min_length or 0, field.max_length
+
+        def check_length(value, path, problems):
+            length = text_length(value.strip())
+            if length < low:
+                problems.append((path, "must not be empty" if low == 1 else f"shorter than {low} characters"))
+                return False
+            if high is not None and length > high:
+                problems.append((path, f"{length} characters, the limit is {high}"))
+                return False
+            return True
+        checks.append(check_length)
+
+    if field.min_items is not None or field.max_items is not None:
+        low, high = field.min_items or 0, field.max_items
+
+        def check_items_count(value, path, problems):
+            if len(value) < low:
+                problems.append((path, f"{len(value)} items, at least {low} needed"))
+                return False
+            if high is not None and len(value) > high:
+                problems.append((path, f"{len(value)} items, at most {high} allowed"))
+                return False
+            return True
+        checks.append(check_items_count)
+
+    if field.minimum is not None and numeric:
+        minimum = field.minimum
+
+        def check_minimum(value, path, problems):
+            if value < minimum:
+                problems.append((path, f"must be at least {minimum}"))
+                return False
+            return True
+        checks.append(check_minimum)
+
+    if field.items is not None:
+        item_validator = compile_field(field.items)
+
+        def check_items(value, path, problems):
+            ok = True
+            for i, item in enumerate(value):
+                ok = item_validator(item, child_path(path, i), problems) and ok
+            return ok
+        checks.append(check_items)
+
+    def validate(value, path, problems):
+        for check in checks:
+            if not check(value, path, problems):
+                return False
+        return True
+    return validate
+
+
+def compile_object(fields: Dict[str, Field], rules: Tuple[Callable[[Dict, str, Problems, Problems], bool], ...] = ()) -> Callable:
+    """Validator of an object with ``fields`` plus cross-field ``rules``.
+
+    Returns ``validate(obj, path, errors, warnings, skip=()) -> bool``; unknown
+    members are warnings, everything else an error. Members in ``skip`` are
+    checked by the caller (the streamed ``questions`` and ``subjects``).
+    """
+    validators = {name: (field.required, compile_field(field)) for name, field in fields.items()}
+    required = [name for name, field in fields.items() if field.required]
+
+    def validate(obj, path, errors, warnings, skip=()):
+        if not isinstance(obj, dict):
+            errors.append((path, "expected an object"))
+            return False
+        ok = True
+        for name in required:
+            if name not in obj and name not in skip:
+                errors.append((child_path(path, name), "is required"))
+                ok = False
+        for name, value in obj.items():
+            entry = validators.get(name)
+            if entry is None:
+                warnings.append((child_path(path, name), "unknown field, left out"))
+            elif name not in skip:
+                ok = entry[1](value, child_path(path, name), errors) and ok
+        if ok:
+            for rule in rules:
+                ok = rule(obj, path, errors, warnings) and ok
+        return ok
+    return validate
+
+
+def _correct_in_range(question: Dict, path: str, errors: Problems, warnings: Problems) -> bool:
+    if not 0 <= question["correct"] < len(question["options"]):
+        errors.append((child_path(path, "correct"),
+                         f"{question['correct']} is not an option index (0-{len(question['options']) - 1})"))
+        return False
+    return True
+
+
+def _distinct_options(question: Dict, path: str, errors: Problems, warnings: Problems) -> bool:
+    # Ambiguous for students but harmless to the bot, so only a warning
+    seen = set()
+    for i, option in enumerate(question["options"]):
+        if option.strip() in seen:
+            warnings.append((child_path(child_path(path, "options"), i), "duplicate option"))
+        seen.add(option.strip())
+    return True
+
+
+# Option buttons read "A. <option>" and all sit in one keyboard row
+OPTION_TEXT_LIMIT = BUTTON_TEXT_LIMIT - len("A. ")
+
+validate_question = compile_object({
+    "question": Field(str, min_length=1, max_length=QUESTION_TEXT_LIMIT),
+    "options": Field(list, min_items=2, max_items=BUTTON_ROW_LIMIT,
+                     items=Field(str, min_length=1, max_length=OPTION_TEXT_LIMIT)),
+    "correct": Field(int, minimum=0),
+    "explanation": Field(str, required=False, max_length=QUESTION_TEXT_LIMIT),
+}, rules=(_correct_in_range, _distinct_options))
+
+validate_subject = compile_object({
+    # The subject button reads "<title> (<duration> នាទី)"
+    "title": Field(str, min_length=1, max_length=BUTTON_TEXT_LIMIT - 12),
+    "description": Field(str, max_length=1024),
+    "duration": Field((int, float), minimum=1),
+    "questions": Field(list, min_items=1),
+    "sample_size": Field(int, required=False, minimum=0),
+    "shuffle_options": Field(bool, required=False),
+})
+
+validate_grade = compile_object({
+    "title": Field(str, required=False, min_length=1, max_length=BUTTON_TEXT_LIMIT),
+    "subjects": Field(dict),
+})
+
+QUESTION_FIELDS = ("question", "options", "correct", "explanation")
+SUBJECT_FIELDS = ("title", "description", "duration", "sample_size", "shuffle_options")
+
+
+def _pick(obj: Dict, fields) -> Dict:
+    return {k: obj[k] for k in fields if k in obj}
+
+
+def valid_count(questions: List[Optional[Dict]]) -> int:
+    return sum(q is not None for q in questions)
+
+
+def _finish_subject(subject: Dict, questions: List[Optional[Dict]], path: str, errors: Problems, warnings: Problems) -> Optional[Dict]:
+    """The cleaned subject, given its already-validated questions (None where invalid), or None if it is unusable."""
+    fields_ok = validate_subject(subject, path, errors, warnings, skip=("questions",))
+    if "questions" not in subject:
+        errors.append((child_path(path, "questions"), "is required"))
+        return None
+    valid = valid_count(questions)
+    if not valid:
+        errors.append((child_path(path, "questions"), "no valid questions"))
+        return None
+    if not fields_ok:
+        return None
+    if subject.get("sample_size", 0) > valid:
+        errors.append((child_path(path, "sample_size"), f"larger than the {valid} valid questions"))
+        return None
+    return dict(_pick(subject, SUBJECT_FIELDS), questions=questions)
+
+
+def validate_catalog(data) -> Tuple[Dict[str, Dict], Problems, Problems]:
+    """Validate an already-parsed catalog; returns ``(valid part, errors, warnings)``."""
+    errors: Problems = []
+    warnings: Problems = []
+    clean: Dict[str, Dict] = {}
+    if not isinstance(data, dict):
+        return clean, [("$", "expected an object of grades")], warnings
+    for grade_id, grade in data.items():
+        grade_path = child_path("$", grade_id)
+        if not isinstance(grade, dict):
+            errors.append((grade_path, "expected an object"))
+            continue
+        title_ok = validate_grade(grade, grade_path, errors, warnings, skip=("subjects",))
+        if "subjects" not in grade:
+            errors.append((child_path(grade_path, "subjects"), "is required"))
+            continue
+        subjects_path = child_path(grade_path, "subjects")
+        if not isinstance(grade["subjects"], dict):
+            errors.append((subjects_path, "expected an object"))
+            continue
+        subjects = {}
+        for subject_id, subject in grade["subjects"].items():
+            path = child_path(subjects_path, subject_id)
+            if not isinstance(subject, dict):
+                errors.append((path, "expected an object"))
+                continue
+            questions = []
+            if isinstance(subject.get("questions"), list):
+                for i, question in enumerate(subject["questions"]):
+                    valid = validate_question(question, child_path(child_path(path, "questions"), i), errors, warnings)
+                    questions.append(_pick(question, QUESTION_FIELDS) if valid else None)
+            elif "questions" in subject:
+                errors.append((child_path(path, "questions"), "expected an array"))
+                continue
+            cleaned = _finish_subject(subject, questions, path, errors, warnings)
+            if cleaned is not None:
+                subjects[subject_id] = cleaned
+        if subjects:
+            clean[grade_id] = dict(_pick(grade, ("title",)) if title_ok else {}, subjects=subjects)
+    return clean, errors, warnings
+
+
+class IngestError(Exception):
+    """The source is not well-formed JSON (or not shaped like a catalog at all)."""
+
+
+class _Stream:
+    """Incremental reader of one JSON document.
+
+    Containers are walked token by token (``members``/``elements``); each
+    leaf or small sub-document is decoded whole with ``raw_decode``, reading
+    more of the file only when it runs past the buffer.
+    """
+    _WS = " \t\r\n"
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json = json.JSONDecoder()
+        self.digest = hashlib.sha1()
+        self.buf = ""
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        raw = self.f.read(self.chunk_size)
+        self.digest.update(raw)
+        text = self.decoder.decode(raw, final=not raw)
+        if not raw:
+            self.eof = True
+        self.consumed += self.pos
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self._WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            self.fail(f"expected {char!r}")
+        self.pos += 1
+
+    def fail(self, message: str, pos: Optional[int] = None):
+        pos = self.pos if pos is None else pos
+        found = self.buf[pos:pos + 20]
+        raise IngestError(f"{message} (character {self.consumed + pos}, found {found!r})")
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Most likely the value runs past the buffer; only at EOF is it really invalid
+                if self._fill():
+                    continue
+                self.fail(e.msg, e.pos)
+            # A number (or literal) ending at the buffer end may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object at the cursor; the caller consumes each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self.fail("expected a member name")
+            key = self.value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                self.pos -= 1
+                self.fail("expected ',' or '}'")
+
+    def elements(self) -> Iterator[int]:
+        """Indices of the array at the cursor; the caller consumes each element."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                self.pos -= 1
+                self.fail("expected ',' or ']'")
+
+
+class _ArtifactWriter:
+    """Writes the artifact as it is ingested: one subject at a time."""
+
+    def __init__(self, f):
+        self.f = f
+        self.grade_open = False
+        self.first_grade = True
+        self.first_subject = True
+        self.f.write('{"grades":{')
+
+    def subject(self, grade_id: str, subject_id: str, subject: Dict):
+        if not self.grade_open:
+            self.f.write(("" if self.first_grade else ",") + json.dumps(grade_id, ensure_ascii=False) + ':{"subjects":{')
+            self.grade_open, self.first_grade, self.first_subject = True, False, True
+        self.f.write(("" if self.first_subject else ",") + json.dumps(subject_id, ensure_ascii=False) + ":"
+                     + json.dumps(subject, ensure_ascii=False, separators=(",", ":")))
+        self.first_subject = False
+
+    def end_grade(self, grade: Dict):
+        if self.grade_open:
+            self.f.write("}")
+            for key, value in grade.items():
+                self.f.write("," + json.dumps(key) + ":" + json.dumps(value, ensure_ascii=False))
+            self.f.write("}")
+            self.grade_open = False
+
+    def close(self, header: Dict):
+        self.f.write("}")
+        for key, value in header.items():
+            self.f.write("," + json.dumps(key) + ":" + json.dumps(value, ensure_ascii=False))
+        self.f.write("}")
+
+
+def _ingest_subject(stream: _Stream, path: str, errors: Problems, warnings: Problems) -> Tuple[Optional[Dict], int]:
+    """Read one subject object, validating each question as it is parsed."""
+    subject: Dict = {}
+    questions: List[Optional[Dict]] = []
+    read = 0
+    for key in stream.members():
+        if key != "questions":
+            subject[key] = stream.value()
+            continue
+        subject["questions"] = True
+        questions_path = child_path(path, "questions")
+        if stream.peek() != "[":
+            errors.append((questions_path, "expected an array"))
+            stream.value()
+            continue
+        for i in stream.elements():
+            question = stream.value()
+            read += 1
+            valid = validate_question(question, child_path(questions_path, i), errors, warnings)
+            questions.append(_pick(question, QUESTION_FIELDS) if valid else None)
+    return _finish_subject(subject, questions, path, errors, warnings), read
+
+
+def ingest(source: str, output: Optional[str], strict: bool = False, chunk_size: int = 1 << 20) -> Dict:
+    """Stream-validate ``source`` and write the artifact to ``output`` (None: validate only).
+
+    Returns the report: counts, ``errors`` and ``warnings`` as ``{"path", "message"}``.
+    The artifact replaces ``output`` atomically, and only once the whole
+    source has been read; with ``strict`` it is not written if anything is wrong.
+    """
+    started = time.perf_counter()
+    errors: Problems = []
+    warnings: Problems = []
+    counts = {"grades": 0, "subjects": 0, "questions_read": 0, "questions": 0}
+
+    tmp_path = None
+    out = None
+    if output:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output) or ".", prefix=os.path.basename(output), suffix=".tmp")
+        out = os.fdopen(fd, "w", encoding="utf-8")
+    writer = _ArtifactWriter(out) if out else None
+    fatal = None
+    try:
+        with open(source, "rb") as f:
+            stream = _Stream(f, chunk_size)
+            try:
+                if stream.peek() != "{":
+                    raise IngestError("the catalog must be an object of grades")
+                for grade_id in stream.members():
+                    grade_path = child_path("$", grade_id)
+                    if stream.peek() != "{":
+                        errors.append((grade_path, "expected an object"))
+                        stream.value()
+                        continue
+                    grade: Dict = {}
+                    has_subjects = False
+                    kept = 0
+                    for key in stream.members():
+                        if key != "subjects":
+                            grade[key] = stream.value()
+                            continue
+                        has_subjects = True
+                        subjects_path = child_path(grade_path, "subjects")
+                        if stream.peek() != "{":
+                            errors.append((subjects_path, "expected an object"))
+                            stream.value()
+                            continue
+                        for subject_id in stream.members():
+                            path = child_path(subjects_path, subject_id)
+                            if stream.peek() != "{":
+                                errors.append((path, "expected an object"))
+                                stream.value()
+                                continue
+                            subject, read = _ingest_subject(stream, path, errors, warnings)
+                            counts["questions_read"] += read
+                            if subject is not None:
+                                kept += 1
+                                counts["subjects"] += 1
+                                counts["questions"] += valid_count(subject["questions"])
+                                if writer:
+                                    writer.subject(grade_id, subject_id, subject)
+                    if not has_subjects:
+                        errors.append((child_path(grade_path, "subjects"), "is required"))
+                    # The title may follow the subjects, so a bad one only drops the title
+                    title_ok = validate_grade(grade, grade_path, errors, warnings, skip=("subjects",))
+                    if writer:
+                        writer.end_grade(_pick(grade, ("title",)) if title_ok else {})
+                    counts["grades"] += bool(kept)
+                if stream.peek() != "":
+                    stream.fail("unexpected data after the catalog")
+            except IngestError as e:
+                fatal = str(e)
+                errors.append(("$", fatal))
+            digest = stream.digest.hexdigest()
+
+        write = writer is not None and fatal is None and not (strict and errors)
+        if write:
+            writer.close({"catalog_format": ARTIFACT_FORMAT, "source": os.path.basename(source),
+                          "source_sha1": digest, "ingested_at": time.time(), "counts": counts})
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+            os.replace(tmp_path, output)
+            tmp_path = None
+    finally:
+        if out is not None and not out.closed:
+            out.close()
+        if tmp_path is not None:
+            os.unlink(tmp_path)
+
+    logger.info("Ingested %s: %d/%d questions valid, %d errors, %d warnings, artifact %s",
+                source, counts["questions"], counts["questions_read"], len(errors), len(warnings),
+                output if write else "not written")
+    return {
+        "source": source,
+        "output": output if write else None,
+        **counts,
+        "seconds": round(time.perf_counter() - started, 3),
+        "errors": [{"path": p, "message": m} for p, m in errors],
+        "warnings": [{"path": p, "message": m} for p, m in warnings],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from bot.storage import EXAM_CATALOG_PATH, EXAM_DB_PATH
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Validate the exam catalog and build the artifact the bot loads.")
+    parser.add_argument("source", nargs="?", default=EXAM_DB_PATH)
+    parser.add_argument("--output", default=EXAM_CATALOG_PATH, help="artifact to write (default: %(default)s)")
+    parser.add_argument("--check", action="store_true", help="only validate, write no artifact")
+    parser.add_argument("--strict", action="store_true", help="write no artifact if anything is invalid")
+    parser.add_argument("--report", help="write the full JSON report to this file")
+    args = parser.parse_args()
+
+    report = ingest(args.source, None if args.check else args.output, strict=args.strict)
+    for problem in report["errors"]:
+        print(f"error: {problem['path']}: {problem['message']}", file=sys.stderr)
+    for problem in report["warnings"]:
+        print(f"warning: {problem['path']}: {problem['message']}", file=sys.stderr)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    summary = {k: v for k, v in report.items() if k not in ("errors", "warnings")}
+    summary.update(errors=len(report["errors"]), warnings=len(report["warnings"]))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    sys.exit(1 if report["errors"] else 0)
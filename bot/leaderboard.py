@@ -0,0 +1,184 @@
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Scores are bucketed to 0.01%: 10001 buckets cover 0.00% .. 100.00%
+SCORE_BUCKETS = 10001
+
+
+def score_bucket(score: float) -> int:
+    return min(max(int(round(float(score) * 100)), 0), SCORE_BUCKETS - 1)
+
+
+class Fenwick:
+    """Binary indexed tree of counts: O(log n) add, prefix count and k-th lookup."""
+    __slots__ = ("tree", "size", "total", "_top_bit")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+        self._top_bit = 1 << (size.bit_length() - 1)
+
+    def add(self, index: int, delta: int):
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Count in positions ``0..index``."""
+        count = 0
+        i = index + 1
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def find(self, k: int) -> int:
+        """Smallest position whose prefix count reaches ``k`` (1-based)."""
+        pos = 0
+        bit = self._top_bit
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+
+class Leaderboard:
+    """Best score per student on one exam, ranked.
+
+    A Fenwick tree counts students per score bucket, so recording a result
+    and looking up a rank are O(log n) in the number of buckets, and the
+    top k are read bucket by bucket from the top. Tied students share a
+    rank and are listed in the order they reached the score.
+    """
+    __slots__ = ("counts", "best", "buckets")
+
+    def __init__(self):
+        self.counts = Fenwick(SCORE_BUCKETS)
+        self.best: Dict[int, int] = {}
+        # bucket -> students in it, in the order they got there
+        self.buckets: Dict[int, Dict[int, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self.best)
+
+    def record(self, user_id: int, score: float) -> bool:
+        """Keep ``score`` if it is the student's best; returns whether it was."""
+        bucket = score_bucket(score)
+        old = self.best.get(user_id)
+        if old is not None and old >= bucket:
+            return False
+        if old is not None:
+            self.counts.add(old, -1)
+            del self.buckets[old][user_id]
+            if not self.buckets[old]:
+                del self.buckets[old]
+        self.counts.add(bucket, 1)
+        self.buckets.setdefault(bucket, {})[user_id] = None
+        self.best[user_id] = bucket
+        return True
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank of the student (1 + students with a better score), or None."""
+        bucket = self.best.get(user_id)
+        if bucket is None:
+            return None
+        return self.counts.total - self.counts.prefix(bucket) + 1
+
+    def score(self, user_id: int) -> Optional[float]:
+        bucket = self.best.get(user_id)
+        return bucket / 100 if bucket is not None else None
+
+    def _descending(self) -> Iterator[int]:
+        """Occupied buckets from the best score down, one Fenwick lookup each."""
+        remaining = self.counts.total
+        while remaining > 0:
+            bucket = self.counts.find(remaining)
+            yield bucket
+            remaining -= len(self.buckets[bucket])
+
+    def top(self, k: int) -> List[Tuple[int, int, float]]:
+        """The best ``k`` students as ``(rank, user_id, score)``."""
+        entries = []
+        for bucket in self._descending():
+            rank = len(entries) + 1
+            for user_id in self.buckets[bucket]:
+                if len(entries) >= k:
+                    return entries
+                entries.append((rank, user_id, bucket / 100))
+        return entries
+
+
+def board_key(result: Dict) -> Optional[Tuple[str, str]]:
+    if not result.get("subject_id"):
+        return None
+    return str(result.get("grade_id")), result["subject_id"]
+
+
+class Leaderboards:
+    """One ``Leaderboard`` per grade/subject, updated as results are recorded.
+
+    Nothing is persisted: ``rebuild`` replays every stored result at startup,
+    O(log n) each. Student names come from the results (``"name"``).
+    """
+
+    def __init__(self):
+        self._boards: Dict[Tuple[str, str], Leaderboard] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.built = False
+
+    def _record(self, boards: Dict, user_id: int, result: Dict):
+        key = board_key(result)
+        if key is None:
+            return
+        board = boards.get(key)
+        if board is None:
+            board = boards[key] = Leaderboard()
+        board.record(user_id, result.get("score", 0))
+        if result.get("name"):
+            self._names[user_id] = result["name"]
+
+    def record(self, user_id: int, result: Dict):
+        with self._lock:
+            self._record(self._boards, int(user_id), result)
+
+    def rebuild(self, results: Dict[int, List[Dict]]):
+        boards: Dict[Tuple[str, str], Leaderboard] = {}
+        count = 0
+        with self._lock:
+            for user_id, user_results in results.items():
+                for result in user_results:
+                    self._record(boards, int(user_id), result)
+                    count += 1
+            self._boards = boards
+            self.built = True
+        logger.info("Built %d leaderboards from %d results", len(boards), count)
+
+    def standing(self, grade_id: str, subject_id: str, user_id: int, k: int) -> Optional[Dict]:
+        """Top ``k`` of a board plus the caller's rank and best score, or None if the board is empty."""
+        with self._lock:
+            board = self._boards.get((str(grade_id), subject_id))
+            if board is None or not len(board):
+                return None
+            return {
+                "top": [(rank, uid, self.name(uid), score) for rank, uid, score in board.top(k)],
+                "students": len(board),
+                "rank": board.rank(user_id),
+                "score": board.score(user_id),
+            }
+
+    def name(self, user_id: int) -> str:
+        name = self._names.get(user_id)
+        return name if name else f"សិស្ស #{str(user_id)[-4:]}"
+
+    def stats(self) -> Dict:
+        return {"boards": len(self._boards), "students": sum(len(b) for b in self._boards.values())}
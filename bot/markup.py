@@ -0,0 +1,201 @@
+import logging
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.catalog import get_catalog
+from bot.paper import REMOVED
+from bot.render import check_callback_data
+from bot.router import cb_answer, cb_begin, cb_exam, cb_grade, cb_study
+
+logger = logging.getLogger(__name__)
+
+
+def build_main_menu() -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton("🎓 ចូលប្រឡង", callback_data='take_exam'),
+            InlineKeyboardButton("📊 មើលលទ្ធផល", callback_data='view_results')
+        ],
+        [
+            InlineKeyboardButton("📚 សម្ភារៈសិក្សា", callback_data='study_materials'),
+            InlineKeyboardButton("⏰ កាលវិភាគប្រឡង", callback_data='exam_schedule')
+        ],
+        [
+            InlineKeyboardButton("👤 ប្រវត្តិរូប", callback_data='profile'),
+            InlineKeyboardButton("❓ ជំនួយ និងការគាំទ្រ", callback_data='help')
+        ],
+        [InlineKeyboardButton("⚙️ ការកំណត់", callback_data='settings')]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+class MarkupCache:
+    """Inline keyboards built once per catalog/lesson version and shared by every render.
+
+    ``InlineKeyboardMarkup`` objects are immutable, so one instance can be sent
+    to any number of users. Catalog-derived keyboards are dropped whenever the
+    exam catalog's version changes; the study menu is dropped by ``set_lessons``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.main_menu = build_main_menu()
+        self._catalog_version: Optional[int] = None
+        self._grades: Optional[InlineKeyboardMarkup] = None
+        self._subjects: Dict[str, Optional[InlineKeyboardMarkup]] = {}
+        self._intro: Dict[Tuple[str, str], InlineKeyboardMarkup] = {}
+        self._questions: Dict[Tuple[str, str, int, int], InlineKeyboardMarkup] = {}
+        self._lessons: Dict[str, Dict] = {}
+        self._study: Optional[InlineKeyboardMarkup] = None
+        self.hits = 0
+        self.builds = 0
+        self.invalidations = 0
+
+    def _sync(self):
+        """Drop catalog keyboards if the catalog has moved to a new version."""
+        catalog = get_catalog()
+        catalog.grades()  # runs the catalog's own change check
+        if catalog.version != self._catalog_version:
+            with self._lock:
+                if catalog.version != self._catalog_version:
+                    if self._catalog_version is not None:
+                        self.invalidations += 1
+                        logger.info("Exam catalog is now v%d, rebuilding keyboards", catalog.version)
+                    self._grades = None
+                    self._subjects = {}
+                    self._intro = {}
+                    self._questions = {}
+                    self._catalog_version = catalog.version
+            self._prerender(catalog)
+
+    def _prerender(self, catalog):
+        """Build every question keyboard of a new catalog version up front.
+
+        Question banks are left to build lazily: a sitting only sees a sample.
+        """
+        for (grade_id, subject_id), exam in catalog.compiled_exams().items():
+            check_callback_data(cb_exam(grade_id, subject_id))
+            check_callback_data(cb_begin(grade_id, subject_id))
+            if exam.bank_mode:
+                continue
+            # A fixed paper shows the available questions in order
+            for position, idx in enumerate(exam.available):
+                self.question_keyboard(grade_id, subject_id, position, idx)
+
+    def _cached(self, table: Dict, key, build):
+        markup = table.get(key)
+        if markup is None and key not in table:
+            markup = table[key] = build()
+            self.builds += 1
+        else:
+            self.hits += 1
+        return markup
+
+    def grades_menu(self) -> InlineKeyboardMarkup:
+        self._sync()
+        if self._grades is None:
+            keyboard = []
+            for grade_id, grade_data in get_catalog().grades().items():
+                clean_grade_id = grade_id.replace('grade_', '')
+                button_text = grade_data.get('title', 'ថ្នាក់គ្មានចំណងជើង')
+                keyboard.append([InlineKeyboardButton(button_text, callback_data=cb_grade(clean_grade_id))])
+            keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')])
+            self._grades = InlineKeyboardMarkup(keyboard)
+            self.builds += 1
+        else:
+            self.hits += 1
+        return self._grades
+
+    def subjects_menu(self, grade_id: str) -> Optional[InlineKeyboardMarkup]:
+        """Subject buttons for a grade number, or None if it has no subjects."""
+        self._sync()
+
+        def build():
+            grade_data = get_catalog().get_grade(grade_id)
+            if not grade_data or not grade_data.get('subjects'):
+                return None
+            keyboard = []
+            for subject_id, subject_data in grade_data['subjects'].items():
+                button_text = f"{subject_data.get('title', 'មុខវិជ្ជាគ្មានចំណងជើង')} ({subject_data.get('duration', 'N/A')} នាទី)"
+                keyboard.append([InlineKeyboardButton(button_text, callback_data=cb_exam(grade_id, subject_id))])
+            keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅថ្នាក់", callback_data='take_exam')])
+            return InlineKeyboardMarkup(keyboard)
+        return self._cached(self._subjects, grade_id, build)
+
+    def exam_intro(self, grade_id: str, subject_id: str) -> InlineKeyboardMarkup:
+        self._sync()
+        return self._cached(self._intro, (grade_id, subject_id), lambda: InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ ចាប់ផ្តើមការប្រឡង", callback_data=cb_begin(grade_id, subject_id))],
+            [InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')]
+        ]))
+
+    def question_keyboard(self, grade_id: str, subject_id: str, position: int, idx: int,
+                          order: Optional[Sequence[int]] = None) -> Optional[InlineKeyboardMarkup]:
+        """Answer buttons for question ``idx`` of an exam shown at paper ``position``,
+        or None if it does not exist.
+
+        Every button carries ``position``, so a tap on an older message cannot
+        answer a later question. ``order`` lists the original option indices
+        in the order to show them (a shuffled paper); button ``i`` then answers
+        ``i`` and the caller maps it back. Shuffled keyboards are per sitting,
+        so they are not cached. ``REMOVED`` (a drawn question that left the
+        pool) gets a skip button.
+        """
+        self._sync()
+
+        def build():
+            exam = get_catalog().get_compiled(grade_id, subject_id)
+            if exam is not None and idx == REMOVED:
+                # The drawn question left the pool: let the student move on
+                return InlineKeyboardMarkup([
+                    [InlineKeyboardButton("⏭️ រំលងសំណួរនេះ", callback_data=cb_answer(position, REMOVED))],
+                    [InlineKeyboardButton("🏁 បញ្ចប់ការប្រឡង", callback_data='end_exam')],
+                ])
+            if exam is None or not 0 <= idx < len(exam.questions):
+                return None
+            options = exam.questions[idx].options
+            shown = [options[i] for i in order] if order is not None else options
+            keyboard = [
+                [InlineKeyboardButton(f"{chr(65+i)}. {opt}", callback_data=cb_answer(position, i))
+                 for i, opt in enumerate(shown)]
+            ]
+            keyboard.append([InlineKeyboardButton("🏁 បញ្ចប់ការប្រឡង", callback_data='end_exam')])
+            return InlineKeyboardMarkup(keyboard)
+        if order is not None:
+            self.builds += 1
+            return build()
+        return self._cached(self._questions, (grade_id, subject_id, position, idx), build)
+
+    def set_lessons(self, lessons: Dict[str, Dict]):
+        """Swap in a (re)loaded lesson catalog and drop the keyboards built from the old one."""
+        with self._lock:
+            self._lessons = lessons
+            self._study = None
+
+    def study_menu(self) -> InlineKeyboardMarkup:
+        if self._study is None:
+            keyboard = []
+            for grade_num in sorted(self._lessons, key=lambda g: (not g.isdigit(), int(g) if g.isdigit() else 0, g)):
+                grade_title = self._lessons[grade_num].get("title", f"ថ្នាក់ទី {grade_num}")
+                keyboard.append([InlineKeyboardButton(grade_title, callback_data=cb_study(grade_num))])
+            keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅម៉ឺនុយ", callback_data='main_menu')])
+            self._study = InlineKeyboardMarkup(keyboard)
+            self.builds += 1
+        else:
+            self.hits += 1
+        return self._study
+
+    def stats(self) -> Dict:
+        return {
+            "catalog_version": self._catalog_version,
+            "cached": 1 + (self._grades is not None) + len(self._subjects) + len(self._intro)
+                      + len(self._questions) + (self._study is not None),
+            "hits": self.hits,
+            "builds": self.builds,
+            "invalidations": self.invalidations,
+        }
+
+
+markup_cache = MarkupCache()
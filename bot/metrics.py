@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (0 for an empty sequence)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how late a ``sleep(interval)`` actually wakes up.
+
+    Any handler that blocks the loop (synchronous file I/O, heavy JSON work)
+    shows up directly as lag for every other update being processed.
+    """
+
+    def __init__(self, interval: float = 0.05, window: int = 2000, report_every: float = 60.0):
+        self.interval = interval
+        self.report_every = report_every
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(0.0, now - started - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self.report_every and now - last_report >= self.report_every:
+                last_report = now
+                stats = self.stats()
+                logger.info(
+                    "Event loop lag: p50 %.1f ms, p99 %.1f ms, max %.1f ms",
+                    stats["p50_ms"], stats["p99_ms"], stats["max_ms"]
+                )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self):
+        self.samples.clear()
+        self.max_lag = 0.0
+
+    def stats(self) -> Dict:
+        samples = list(self.samples)
+        return {
+            "samples": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
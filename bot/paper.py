@@ -0,0 +1,124 @@
+import random
+import secrets
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bot.catalog import REMOVED_QUESTION, CompiledExam, CompiledQuestion
+
+# Pool index of a drawn question that is no longer in the pool (or was removed from it)
+REMOVED = -1
+
+
+def sample_indices(rng: random.Random, n: int, k: int) -> List[int]:
+    """``k`` distinct indices out of ``range(n)`` in random order, in O(k) time and space.
+
+    Floyd's algorithm picks the set, a shuffle of the k picks fixes the order.
+    """
+    k = min(k, n)
+    chosen = set()
+    picks = []
+    for j in range(n - k, n):
+        t = rng.randrange(j + 1)
+        pick = j if t in chosen else t
+        chosen.add(pick)
+        picks.append(pick)
+    rng.shuffle(picks)
+    return picks
+
+
+class ExamPaper:
+    """The questions one sitting sees, in its order and with its option order.
+
+    A bank-mode exam draws ``sample_size`` questions from its pool and may
+    shuffle each question's options. Everything is derived from ``seed`` and
+    the drawn ``indices``, which are all the session keeps (``to_dict``), so
+    the paper can be rebuilt on every update in O(k). Answers are stored as
+    original option indices, so scoring and review never need the shuffle.
+    A fixed exam is the identity paper: no seed, every question, in order
+    (or, once questions were removed from it, the remaining ones in order).
+
+    ``indices`` are kept as drawn, even if the pool has since shrunk: a
+    position whose question is gone maps to ``REMOVED``, so every answer stays
+    paired with the question it was given for. ``REMOVED`` positions are left
+    out of the score.
+    """
+    __slots__ = ("exam", "seed", "indices")
+
+    def __init__(self, exam: CompiledExam, seed: Optional[int] = None, indices: Optional[Sequence[int]] = None):
+        self.exam = exam
+        self.seed = seed
+        self.indices = tuple(indices) if indices is not None else None
+
+    @property
+    def total(self) -> int:
+        return len(self.indices) if self.indices is not None else len(self.exam.questions)
+
+    def question_index(self, position: int) -> int:
+        """Index in the exam's pool of the question at ``position`` on this paper, or ``REMOVED``."""
+        index = self.indices[position] if self.indices is not None else position
+        questions = self.exam.questions
+        return index if 0 <= index < len(questions) and questions[index] is not REMOVED_QUESTION else REMOVED
+
+    def question(self, position: int) -> CompiledQuestion:
+        index = self.question_index(position)
+        return self.exam.questions[index] if index != REMOVED else REMOVED_QUESTION
+
+    def option_order(self, position: int) -> Optional[Tuple[int, ...]]:
+        """Original option indices in the order shown, or None if options are not shuffled."""
+        if self.seed is None or not self.exam.shuffle_options:
+            return None
+        index = self.question_index(position)
+        if index == REMOVED:
+            return None
+        # One stream per (seed, question): the order does not depend on the other draws
+        rng = random.Random(self.seed * 1_000_003 + index)
+        return tuple(rng.sample(range(len(self.exam.questions[index].options)), len(self.exam.questions[index].options)))
+
+    def to_original(self, position: int, shown: int) -> int:
+        """The original option index of the button ``shown`` at ``position``."""
+        order = self.option_order(position)
+        if order is None or not 0 <= shown < len(order):
+            return shown
+        return order[shown]
+
+    def score(self, answers: Sequence[int]) -> Tuple[int, int, float]:
+        if self.indices is None:
+            return self.exam.score(answers)
+        key = self.exam.answer_key
+        correct = total = 0
+        for position, answer in zip(range(self.total), answers):
+            index = self.question_index(position)
+            if index == REMOVED:
+                continue  # like CompiledExam.score, a question without a key does not count
+            total += 1
+            if key[index] == answer:
+                correct += 1
+        return correct, total, (correct / total * 100) if total > 0 else 0
+
+    def to_dict(self) -> Optional[Dict]:
+        if self.indices is None:
+            return None
+        return {"seed": self.seed, "questions": list(self.indices)}
+
+
+def draw_paper(exam: CompiledExam, seed: Optional[int] = None) -> ExamPaper:
+    """A new paper for one sitting of ``exam``; the identity paper for fixed exams.
+
+    Removed questions are never drawn.
+    """
+    if not exam.bank_mode:
+        return ExamPaper(exam, None, exam.available) if exam.has_removed else ExamPaper(exam)
+    if seed is None:
+        seed = secrets.randbits(31)
+    picks = sample_indices(random.Random(seed), len(exam.available), exam.paper_length)
+    return ExamPaper(exam, seed, [exam.available[i] for i in picks])
+
+
+def load_paper(exam: CompiledExam, record: Dict) -> ExamPaper:
+    """Rebuild the paper stored in a session or result under ``"paper"``.
+
+    Indices no longer in the pool (the bank shrank) are kept; they read as ``REMOVED``.
+    """
+    paper = record.get("paper")
+    if not paper:
+        return ExamPaper(exam)
+    return ExamPaper(exam, paper.get("seed"), paper.get("questions", []))
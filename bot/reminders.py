@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def session_activity(session: Dict) -> float:
+    """Last activity time recorded in a session, 0 if it has none."""
+    return float(session.get("last_active") or session.get("start_time") or 0)
+
+
+class ReminderIndex:
+    """Who should get a reminder, maintained as sessions change.
+
+    Users are bucketed by their reminder slot (``user_slot``), so a tick only
+    looks at the buckets of the slots it serves. Per slot, ``_pending`` holds
+    users with an unfinished exam and ``_due`` maps every known user to the
+    last time they were active or reminded, kept in ascending order by moving
+    a user to the end whenever they are touched, so the users idle for N days
+    are always a prefix of it. Both lookups therefore cost time proportional
+    to the number of targets, not the user base.
+
+    Reminder times are also kept in ``_reminded`` so they can be persisted;
+    sessions only record activity, and a restart must not forget who was
+    just reminded.
+    """
+
+    def __init__(self, slots: int = 1):
+        self._lock = threading.Lock()
+        self.slots = max(1, slots)
+        self._pending: Dict[int, Set[int]] = {}
+        # Users who turned reminders off in their notification settings
+        self._muted = set()
+        self._due: "Dict[int, OrderedDict[int, float]]" = {}
+        self._reminded: Dict[int, float] = {}
+        self.built = False
+
+    def build(self, sessions: Dict[int, Dict], reminded: Optional[Dict[int, float]] = None, slots: Optional[int] = None):
+        """Rebuild the index from the stored sessions and saved reminder times (once, at startup)."""
+        slots = max(1, slots) if slots is not None else self.slots
+        reminded = {int(uid): float(ts) for uid, ts in (reminded or {}).items()}
+        due: "Dict[int, OrderedDict[int, float]]" = {}
+        pending: Dict[int, Set[int]] = {}
+        for uid, ts in sorted(
+            ((int(uid), max(session_activity(s), reminded.get(int(uid), 0.0))) for uid, s in sessions.items()),
+            key=lambda item: item[1]
+        ):
+            due.setdefault(user_slot(uid, slots), OrderedDict())[uid] = ts
+        for uid, s in sessions.items():
+            if s.get("exam_active"):
+                pending.setdefault(user_slot(int(uid), slots), set()).add(int(uid))
+        muted = {int(uid) for uid, s in sessions.items() if s.get("notifications") is False}
+        with self._lock:
+            self.slots = slots
+            self._due = due
+            self._pending = pending
+            self._muted = muted
+            self._reminded = {uid: ts for uid, ts in reminded.items() if uid in due.get(user_slot(uid, slots), ())}
+            self.built = True
+        logger.info("Reminder index: %d users in %d slots, %d with an unfinished exam",
+                    len(sessions), slots, sum(map(len, pending.values())))
+
+    def _touch(self, user_id: int, ts: Optional[float]):
+        bucket = self._due.setdefault(user_slot(user_id, self.slots), OrderedDict())
+        bucket[user_id] = ts if ts is not None else time.time()
+        bucket.move_to_end(user_id)
+
+    def touch(self, user_id: int, ts: Optional[float] = None):
+        with self._lock:
+            self._touch(user_id, ts)
+
+    def exam_started(self, user_id: int, ts: Optional[float] = None):
+        with self._lock:
+            self._pending.setdefault(user_slot(user_id, self.slots), set()).add(user_id)
+            self._touch(user_id, ts)
+
+    def exam_finished(self, user_id: int, ts: Optional[float] = None):
+        with self._lock:
+            self._pending.get(user_slot(user_id, self.slots), set()).discard(user_id)
+            self._touch(user_id, ts)
+
+    cleared = exam_finished
+
+    def set_muted(self, user_id: int, muted: bool):
+        with self._lock:
+            if muted:
+                self._muted.add(user_id)
+            else:
+                self._muted.discard(user_id)
+
+    def forget(self, user_id: int):
+        with self._lock:
+            slot = user_slot(user_id, self.slots)
+            self._pending.get(slot, set()).discard(user_id)
+            self._muted.discard(user_id)
+            self._due.get(slot, {}).pop(user_id, None)
+            self._reminded.pop(user_id, None)
+
+    def pending_users(self, slots: Iterable[int]) -> List[int]:
+        """Users of ``slots`` with an unfinished exam."""
+        with self._lock:
+            return [uid for slot in slots for uid in self._pending.get(slot, ()) if uid not in self._muted]
+
+    def inactive_users(self, slots: Iterable[int], days: float, now: Optional[float] = None) -> List[int]:
+        """Users of ``slots`` neither active nor reminded in the last ``days`` days."""
+        cutoff = (now if now is not None else time.time()) - days * 86400
+        users = []
+        with self._lock:
+            for slot in slots:
+                for user_id, ts in self._due.get(slot, {}).items():
+                    if ts >= cutoff:
+                        break
+                    if user_id not in self._muted:
+                        users.append(user_id)
+        return users
+
+    def snooze(self, user_ids: List[int], ts: Optional[float] = None):
+        """Mark users as just reminded so they are not picked again for N days."""
+        ts = ts if ts is not None else time.time()
+        with self._lock:
+            for user_id in user_ids:
+                if user_id in self._due.get(user_slot(user_id, self.slots), ()):
+                    self._touch(user_id, ts)
+                    self._reminded[user_id] = ts
+
+    def reminded_since(self, cutoff: float) -> Dict[int, float]:
+        """Reminder times after ``cutoff``, pruning the older ones (which no longer hold anyone back)."""
+        with self._lock:
+            self._reminded = {uid: ts for uid, ts in self._reminded.items() if ts >= cutoff}
+            return dict(self._reminded)
+
+    def stats(self) -> Dict:
+        return {
+            "users": sum(map(len, self._due.values())),
+            "pending": sum(map(len, self._pending.values())),
+            "muted": len(self._muted),
+        }
+
+
+def user_slot(user_id: int, slots: int) -> int:
+    """Stable slot of a user within the reminder interval (multiplicative hash)."""
+    return (int(user_id) * 2654435761 % 2**32) % slots
+
+
+class ReminderSchedule:
+    """Spreads reminders over the interval in ``slots`` wall-clock aligned ticks.
+
+    Tick ``t`` covers ``[t * slot_seconds, (t + 1) * slot_seconds)`` and serves
+    the users whose ``user_slot`` is ``t % slots``, so each user is reminded
+    once per interval and the sends of a cycle are spread evenly across it.
+    Ticks are derived from the wall clock, not from process start, and the
+    last processed tick is persisted: after a restart the missed ticks (at
+    most one full cycle) are caught up once, and nothing else is re-sent.
+    """
+
+    def __init__(self, interval_seconds: float, slots: int):
+        self.interval = interval_seconds
+        self.slots = max(1, slots)
+        self.slot_seconds = interval_seconds / self.slots
+        self.last_tick: Optional[int] = None
+
+    def tick_at(self, ts: float) -> int:
+        return int(ts // self.slot_seconds)
+
+    def due_slots(self, now: Optional[float] = None) -> Tuple[int, Set[int]]:
+        """The current tick and the slots due at it, including missed ones."""
+        current = self.tick_at(now if now is not None else time.time())
+        if self.last_tick is None:
+            first = current
+        else:
+            first = max(self.last_tick + 1, current - self.slots + 1)
+        return current, {t % self.slots for t in range(first, current + 1)}
+
+    def mark_done(self, tick: int):
+        self.last_tick = max(tick, self.last_tick if self.last_tick is not None else tick)
+
+    def next_tick_time(self, now: Optional[float] = None) -> float:
+        return (self.tick_at(now if now is not None else time.time()) + 1) * self.slot_seconds
+
+    def next_fire_for(self, user_id: int, now: Optional[float] = None) -> float:
+        """When ``user_id`` is next due for a reminder."""
+        current = self.tick_at(now if now is not None else time.time())
+        ahead = (user_slot(user_id, self.slots) - current) % self.slots or self.slots
+        return (current + ahead) * self.slot_seconds
+
+    def upcoming(self, count: int = 5, now: Optional[float] = None) -> List[Dict]:
+        """The next ``count`` ticks as ``{"time", "slot"}``."""
+        current = self.tick_at(now if now is not None else time.time())
+        return [{"time": t * self.slot_seconds, "slot": t % self.slots} for t in range(current + 1, current + 1 + count)]
+
+    def to_dict(self) -> Dict:
+        return {"interval": self.interval, "slots": self.slots, "last_tick": self.last_tick}
+
+    def restore(self, state: Dict):
+        """Resume from saved state; a changed interval or slot count starts fresh."""
+        if state.get("interval") == self.interval and state.get("slots") == self.slots:
+            self.last_tick = state.get("last_tick")
+        elif state:
+            logger.info("Reminder schedule changed, not catching up missed slots")
+
+
+reminder_index = ReminderIndex()
@@ -0,0 +1,134 @@
+import html
+import logging
+import re
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits: message text after entity parsing (UTF-16 code units), callback_data bytes
+MESSAGE_LIMIT = 4096
+CALLBACK_DATA_LIMIT = 64
+# Inline keyboards: buttons per row, and the longest button label we allow
+BUTTON_ROW_LIMIT = 8
+BUTTON_TEXT_LIMIT = 64
+
+QUESTION_HEAD = "❓ <b>សំណួរទី "
+QUESTION_FOOTER = "\n\nជ្រើសរើសចម្លើយ៖"
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def text_length(text: str) -> int:
+    """Length of plain text as Telegram counts it (UTF-16 code units)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def visible_length(html_text: str) -> int:
+    """Length of an HTML message once Telegram strips the tags and entities."""
+    return text_length(html.unescape(_TAG_RE.sub("", html_text)))
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """Cut plain text to ``limit`` UTF-16 units, ending with an ellipsis if cut."""
+    if text_length(text) <= limit:
+        return text
+    cut = text.encode('utf-16-le')[:max(0, limit - 1) * 2].decode('utf-16-le', errors='ignore')
+    return cut + "…"
+
+
+def escape_within(text: str, limit: int, what: str = "text") -> str:
+    """HTML-escape plain text, truncating it first so it shows at most ``limit`` units.
+
+    Truncation happens before escaping, so an entity like ``&lt;`` is never cut.
+    """
+    if text_length(text) > limit:
+        logger.warning("%s is %d characters, truncating to %d: %.40s…", what, text_length(text), limit, text)
+        text = truncate_text(text, limit)
+    return html.escape(text, quote=False)
+
+
+def question_head(number: int, total: int) -> str:
+    return f"{QUESTION_HEAD}{number}/{total}</b>\n\n"
+
+
+def render_question_body(text: str, total: int, what: str = "question") -> str:
+    """Escaped question text sized so the full question screen fits in one message."""
+    budget = MESSAGE_LIMIT - visible_length(question_head(total, total) + QUESTION_FOOTER)
+    return escape_within(text, budget, what)
+
+
+def question_screen(body: str, number: int, total: int) -> str:
+    """The question screen: only the counter is filled in per render."""
+    return question_head(number, total) + body + QUESTION_FOOTER
+
+
+def exam_intro(title: str, grade_title: str, description: str, duration, questions: int) -> str:
+    """The screen shown before an exam starts, with the catalog texts escaped."""
+    return (
+        f"📝 <b>ការប្រឡង៖ {html.escape(str(title), quote=False)}</b>\n"
+        f"📚 <b>ថ្នាក់៖ {html.escape(str(grade_title), quote=False)}</b>\n\n"
+        f"ℹ️ <b>ការពិពណ៌នា៖</b> {html.escape(str(description), quote=False)}\n"
+        f"⏱️ <b>រយៈពេល៖</b> {html.escape(str(duration), quote=False)} នាទី\n"
+        f"❓ <b>សំណួរ៖</b> {questions}\n\n"
+        f"តើអ្នកត្រៀមខ្លួនចាប់ផ្តើមការប្រឡងហើយឬនៅ?"
+    )
+
+
+def result_screen(result: Dict, reason: str) -> str:
+    """The screen shown when an exam ends."""
+    return (
+        f"🏁 <b>ការប្រឡងបញ្ចប់</b>\n\n"
+        f"📝 <b>ការប្រឡង៖</b> {html.escape(result['exam_title'], quote=False)}\n"
+        f"🎯 <b>ពិន្ទុ៖</b> {result['score']:.1f}% ({result['correct']}/{result['total']} ត្រឹមត្រូវ)\n"
+        f"📅 <b>កាលបរិច្ឆេទ៖</b> {result['date']}\n\n"
+        f"ហេតុផលនៃការបញ្ចប់៖ {reason}\n"
+        f"តើអ្នកចង់ពិនិត្យចម្លើយរបស់អ្នក ឬត្រឡប់ទៅម៉ឺនុយដើមទេ?"
+    )
+
+
+def check_callback_data(data: str) -> bool:
+    """Whether ``data`` fits Telegram's callback_data limit; logs it if it does not."""
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        logger.warning("callback_data over %d bytes: %s", CALLBACK_DATA_LIMIT, data)
+        return False
+    return True
+
+
+def review_page(paper, result: Dict, page: int, page_size: int) -> Tuple[str, int]:
+    """Render page ``page`` of an exam review and return it with the page count.
+
+    ``paper`` is the sitting's ExamPaper. Only the questions on the requested
+    page are rendered, each escaped and capped so the page fits in one message.
+    """
+    answers = result.get("answers", [])
+    reviewed = min(len(answers), paper.total)
+    pages = max(1, -(-reviewed // page_size))
+    page = min(max(page, 0), pages - 1)
+
+    text = (
+        f"📋 <b>ពិនិត្យការប្រឡង៖ {html.escape(result.get('exam_title', ''), quote=False)}</b>\n\n"
+        f"🎯 <b>ពិន្ទុ៖</b> {result.get('score', 0):.1f}% ({result.get('correct', 0)}/{result.get('total', 0)} ត្រឹមត្រូវ)\n"
+        f"📅 <b>កាលបរិច្ឆេទ៖</b> {result.get('date', '')}\n\n"
+        f"<b>លម្អិតចម្លើយ៖</b> ទំព័រ {page + 1}/{pages}\n"
+    )
+    # Each entry gets an equal share of what the header leaves, split between its four texts
+    budget = (MESSAGE_LIMIT - visible_length(text)) // page_size - 120
+    part = max(16, budget // 4)
+
+    def fit(value: str) -> str:
+        return html.escape(truncate_text(str(value), part), quote=False)
+
+    for i in range(page * page_size, min(reviewed, (page + 1) * page_size)):
+        q = paper.question(i)
+        ans = answers[i]
+        your_answer = q.options[ans] if 0 <= ans < len(q.options) else "—"
+        correct_answer = q.options[q.correct] if 0 <= q.correct < len(q.options) else "—"
+        status = "✅ ត្រឹមត្រូវ" if ans == q.correct else "❌ មិនត្រឹមត្រូវ"
+        text += (
+            f"\n❓ <b>សំណួរទី {i+1}:</b> {fit(q.text)}\n"
+            f"📝 <b>ចម្លើយរបស់អ្នក៖</b> {fit(your_answer)}\n"
+            f"✅ <b>ចម្លើយត្រឹមត្រូវ៖</b> {fit(correct_answer)}\n"
+            f"ℹ️ <b>ការពន្យល់៖</b> {fit(q.explanation)}\n"
+            f"{status}\n"
+        )
+    return text, pages
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import struct
+import threading
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One index record per result: user_id, byte offset of the result's line in the log
+_INDEX_RECORD = struct.Struct("<qq")
+
+
+class ResultsLog:
+    """Append-only JSONL log of exam results with a per-user offset index.
+
+    Each result is one line ``{"user_id": ..., "result": {...}}`` in the log.
+    The index file holds one fixed-size (user_id, offset) record per line and
+    is loaded into per-user offset arrays, so appending is O(1) and reading a
+    user's n-th or last few results is a seek per record.
+
+    A result is updated by appending its new version with ``"replaces"``
+    pointing at the line it supersedes, and repointing its index record.
+    """
+
+    def __init__(self, log_path: str, index_path: str):
+        self.log_path = log_path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._offsets: Dict[int, array] = {}
+        self._log_size = 0
+        for path in (log_path, index_path):
+            if not os.path.exists(path):
+                open(path, 'ab').close()
+        self._load_index()
+
+    def _load_index(self):
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % _INDEX_RECORD.size
+        offsets: Dict[int, array] = {}
+        end = 0
+        for user_id, offset in _INDEX_RECORD.iter_unpack(data[:usable]):
+            offsets.setdefault(user_id, array('q')).append(offset)
+            end = max(end, offset)
+        self._offsets = offsets
+
+        log_size = os.path.getsize(self.log_path)
+        if usable != len(data) or (usable and end >= log_size):
+            logger.warning("Results index %s is inconsistent with the log, rebuilding", self.index_path)
+            self.rebuild_index()
+            return
+        if usable:
+            with open(self.log_path, 'rb') as f:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+        self._log_size = end
+        if end < log_size:
+            # Records appended after the last index write (crash between the two writes)
+            self._index_tail(end)
+
+    def _scan(self, start: int = 0) -> Iterator[Tuple[int, int, Dict, Optional[int]]]:
+        """Yield (offset, user_id, result, replaced offset or None) for each complete record from ``start``."""
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                    yield offset, int(record["user_id"]), record["result"], record.get("replaces")
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error("Skipping corrupt results record at offset %d: %s", offset, e)
+                offset += len(line)
+
+    def _versions(self) -> Iterator[Tuple[int, int, int, Dict]]:
+        """Yield (user_id, idx, offset, result) for every record in the log.
+
+        An update yields the ``(user_id, idx)`` of the result it replaces
+        again, so the last version of each result wins.
+        """
+        where: Dict[int, Tuple[int, int]] = {}
+        counts: Dict[int, int] = {}
+        for offset, user_id, result, replaces in self._scan(0):
+            if replaces is not None and replaces in where:
+                user_id, idx = where.pop(replaces)
+            else:
+                idx = counts.get(user_id, 0)
+                counts[user_id] = idx + 1
+            where[offset] = (user_id, idx)
+            yield user_id, idx, offset, result
+
+    def _index_tail(self, start: int):
+        records = []
+        end = start
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+        tail = list(self._scan(start))
+        if any(replaces is not None for *_, replaces in tail):
+            # An update whose index records were not repointed yet
+            self.rebuild_index()
+            return
+        for offset, user_id, _, _ in tail:
+            records.append(_INDEX_RECORD.pack(user_id, offset))
+            self._offsets.setdefault(user_id, array('q')).append(offset)
+        self._truncate_log(end)
+        with open(self.index_path, 'ab') as f:
+            f.write(b"".join(records))
+        logger.info("Indexed %d results appended after the last index write", len(records))
+
+    def _truncate_log(self, end: int):
+        if os.path.getsize(self.log_path) > end:
+            logger.warning("Truncating partial results record at offset %d", end)
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(end)
+        self._log_size = end
+
+    def rebuild_index(self) -> int:
+        """Recreate the index from the log. Returns the number of indexed results."""
+        offsets: Dict[int, array] = {}
+        end = 0
+        for user_id, idx, offset, _ in self._versions():
+            user_offsets = offsets.setdefault(user_id, array('q'))
+            if idx < len(user_offsets):
+                user_offsets[idx] = offset
+            else:
+                user_offsets.append(offset)
+        records = [_INDEX_RECORD.pack(user_id, offset)
+                   for user_id, user_offsets in offsets.items() for offset in user_offsets]
+        with open(self.log_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+        self._truncate_log(end)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self._offsets = offsets
+        logger.info("Rebuilt results index: %d results for %d users", len(records), len(offsets))
+        return len(records)
+
+    def add_result(self, user_id: int, result: Dict) -> int:
+        """Append a result and return its index in the user's history."""
+        line = (json.dumps({"user_id": user_id, "result": result}, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            offset = self._log_size
+            with open(self.log_path, 'ab') as f:
+                f.write(line)
+            with open(self.index_path, 'ab') as f:
+                f.write(_INDEX_RECORD.pack(user_id, offset))
+            self._log_size += len(line)
+            user_offsets = self._offsets.setdefault(user_id, array('q'))
+            user_offsets.append(offset)
+            return len(user_offsets) - 1
+
+    def _read(self, offsets) -> List[Dict]:
+        results = []
+        with open(self.log_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                results.append(json.loads(f.readline())["result"])
+        return results
+
+    def count_results(self, user_id: int) -> int:
+        return len(self._offsets.get(user_id, ()))
+
+    def count_all(self) -> int:
+        return sum(len(offsets) for offsets in self._offsets.values())
+
+    def user_result(self, user_id: int, idx: int) -> Optional[Dict]:
+        user_offsets = self._offsets.get(user_id)
+        if not user_offsets or not -len(user_offsets) <= idx < len(user_offsets):
+            return None
+        return self._read([user_offsets[idx]])[0]
+
+    def recent_results(self, user_id: int, n: int) -> List[Dict]:
+        """The user's last ``n`` results, oldest first."""
+        return self._read(self._offsets.get(user_id, array('q'))[-n:]) if n > 0 else []
+
+    def user_results(self, user_id: int) -> List[Dict]:
+        return self._read(self._offsets.get(user_id, ()))
+
+    def all_results(self) -> Dict[int, List]:
+        results: Dict[int, List] = {}
+        for user_id, idx, _, result in self._versions():
+            user_results = results.setdefault(user_id, [])
+            if idx < len(user_results):
+                user_results[idx] = result
+            else:
+                user_results.append(result)
+        return results
+
+    def update_results(self, updates: Dict[int, Dict[int, Dict]]) -> int:
+        """Replace individual results, given as ``{user_id: {idx: result}}``. Returns how many."""
+        with self._lock:
+            targets = []
+            for user_id, changed in updates.items():
+                user_offsets = self._offsets.get(int(user_id), ())
+                for idx, result in changed.items():
+                    if 0 <= idx < len(user_offsets):
+                        targets.append((int(user_id), idx, user_offsets[idx], result))
+                    else:
+                        logger.warning("No result %s for user %s to update", idx, user_id)
+            if not targets:
+                return 0
+
+            lines = []
+            new_offsets = []
+            offset = self._log_size
+            for user_id, _, old, result in targets:
+                line = (json.dumps({"user_id": user_id, "result": result, "replaces": old}, ensure_ascii=False) + "\n").encode('utf-8')
+                lines.append(line)
+                new_offsets.append(offset)
+                offset += len(line)
+            with open(self.log_path, 'ab') as f:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_size = offset
+
+            wanted = {(user_id, old) for user_id, _, old, _ in targets}
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % _INDEX_RECORD.size
+            position = {record: i for i, record in enumerate(_INDEX_RECORD.iter_unpack(data[:usable])) if record in wanted}
+            if len(position) != len(wanted):
+                self.rebuild_index()
+                return len(targets)
+            with open(self.index_path, 'r+b') as f:
+                for (user_id, idx, old, _), new in zip(targets, new_offsets):
+                    f.seek(position[(user_id, old)] * _INDEX_RECORD.size)
+                    f.write(_INDEX_RECORD.pack(user_id, new))
+                    self._offsets[user_id][idx] = new
+            return len(targets)
+
+    def replace_results(self, results: Dict[int, List]):
+        """Rewrite the whole log; only used by bulk tools, never on the hot path."""
+        with self._lock:
+            tmp_path = self.log_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                for user_id, user_results in results.items():
+                    for result in user_results:
+                        f.write((json.dumps({"user_id": int(user_id), "result": result}, ensure_ascii=False) + "\n").encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.log_path)
+            self.rebuild_index()
+
+    def migrate_from_json(self, results_path: str) -> bool:
+        """Import the legacy exam_results.json if the log is still empty."""
+        if self._log_size or not os.path.exists(results_path):
+            return False
+        with open(results_path, 'r', encoding='utf-8') as f:
+            results = {int(k): v for k, v in json.load(f).items()}
+        if not any(results.values()):
+            return False
+        self.replace_results(results)
+        logger.info("Migrated %d results from %s", sum(len(v) for v in results.values()), results_path)
+        return True
+
+
+if __name__ == "__main__":
+    import argparse
+    from bot.storage import RESULTS_LOG_PATH, RESULTS_INDEX_PATH
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Maintain the append-only exam results log.")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recreate the offset index from the log")
+    parser.add_argument("--log", default=RESULTS_LOG_PATH)
+    parser.add_argument("--index", default=RESULTS_INDEX_PATH)
+    args = parser.parse_args()
+    ResultsLog(args.log, args.index).rebuild_index()
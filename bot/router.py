@@ -0,0 +1,164 @@
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+# callback_data formats:
+#   v1 (current) - "<code>:<arg>[:<arg>...]", e.g. "a:4:2" (option 2 of paper position 4),
+#                  "e:7:k3f9" (grade 7, short subject id)
+#   v0 (legacy)  - "answer_3", "exam_7_mathematics", ... still accepted from older messages
+SEP = ":"
+
+Handler = Callable[..., Awaitable]
+Parser = Callable[[str], Tuple]
+
+
+def cb_grade(grade_id: str) -> str:
+    return f"g{SEP}{grade_id}"
+
+
+def cb_exam(grade_id: str, subject_id: str) -> str:
+    return f"e{SEP}{grade_id}{SEP}{get_catalog().subject_code(grade_id, subject_id)}"
+
+
+def cb_begin(grade_id: str, subject_id: str) -> str:
+    return f"b{SEP}{grade_id}{SEP}{get_catalog().subject_code(grade_id, subject_id)}"
+
+
+def cb_answer(position: int, option: int) -> str:
+    return f"a{SEP}{position}{SEP}{option}"
+
+
+def cb_review(result_idx: int, page: int = 0) -> str:
+    return f"r{SEP}{result_idx}{SEP}{page}" if page else f"r{SEP}{result_idx}"
+
+
+def cb_study(grade_num: str) -> str:
+    return f"s{SEP}{grade_num}"
+
+
+def _grade_arg(value: str) -> str:
+    if not value.isdigit():
+        raise ValueError(f"invalid grade id {value!r}")
+    return value
+
+
+def parse_grade(payload: str) -> Tuple[str]:
+    return (_grade_arg(payload),)
+
+
+def parse_exam(payload: str) -> Tuple[str, str]:
+    """``7:k3f9`` -> ``("7", "mathematics")``, resolving the short subject id."""
+    grade_id, code = payload.split(SEP, 1)
+    grade_id = _grade_arg(grade_id)
+    return grade_id, get_catalog().resolve_subject(grade_id, code)
+
+
+def parse_legacy_exam(payload: str) -> Tuple[str, str]:
+    """``7_mathematics`` or ``grade_7_mathematics`` -> ``("7", "mathematics")``."""
+    parts = payload.split("_")
+    if parts[0].lower() == "grade":
+        parts = parts[1:]
+    if len(parts) < 2:
+        raise ValueError(f"missing subject in {payload!r}")
+    return _grade_arg(parts[0]), "_".join(parts[1:])
+
+
+def parse_answer(payload: str) -> Tuple[Optional[int], int]:
+    """``4:2`` -> ``(4, 2)``; a button from before positions were encoded (``2``) gives ``(None, 2)``."""
+    parts = payload.split(SEP)
+    if len(parts) == 1:
+        return None, int(parts[0])
+    return int(parts[0]), int(parts[1])
+
+
+def parse_review(payload: str, sep: str = SEP) -> Tuple[int, int]:
+    parts = payload.split(sep)
+    return int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+
+
+class Route:
+    """A callback handler; ``answers`` means it answers the query itself."""
+    __slots__ = ("name", "handler", "parse", "answers")
+
+    def __init__(self, name: str, handler: Handler, parse: Optional[Parser], answers: bool):
+        self.name = name
+        self.handler = handler
+        self.parse = parse
+        self.answers = answers
+
+
+class CallbackRouter:
+    """Dispatches callback queries: an exact-match dict first, then a prefix trie.
+
+    Prefix routes receive the rest of the payload through their ``parse``
+    function, whose tuple is passed to the handler after ``update, context``.
+    The query is answered before the handler runs unless the route says the
+    handler answers it itself. Hits are counted per route name.
+    """
+
+    def __init__(self, fallback: Optional[Handler] = None):
+        self._exact: Dict[str, Route] = {}
+        self._trie: Dict = {}
+        self.fallback = fallback
+        self.hits: Counter = Counter()
+
+    def exact(self, data: str, handler: Handler, name: Optional[str] = None, answers: bool = False):
+        self._exact[data] = Route(name or data, handler, None, answers)
+
+    def prefix(self, prefix: str, handler: Handler, parse: Parser, name: Optional[str] = None, answers: bool = False):
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[None] = Route(name or prefix, handler, parse, answers)
+
+    def resolve(self, data: str) -> Tuple[Optional[Route], str]:
+        """Return the route for ``data`` and the payload after its prefix (longest match)."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ""
+        node, best, end = self._trie, None, 0
+        for i, ch in enumerate(data):
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                best, end = node[None], i + 1
+        return best, data[end:]
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        data = query.data or ""
+        route, payload = self.resolve(data)
+        if route is None:
+            self.hits["<unmatched>"] += 1
+            logger.warning("Unhandled callback data: %s", data)
+            if self.fallback is not None:
+                await query.answer()
+                return await self.fallback(update, context)
+            return await query.answer()
+
+        self.hits[route.name] += 1
+        args = ()
+        if route.parse is not None:
+            try:
+                args = route.parse(payload)
+            except (ValueError, IndexError) as e:
+                self.hits["<invalid>"] += 1
+                logger.error("Invalid callback data for %s: %s (%s)", route.name, data, e)
+                await query.answer("⚠️ ទិន្នន័យមិនត្រឹមត្រូវ")
+                if self.fallback is not None:
+                    return await self.fallback(update, context)
+                return
+        if not route.answers:
+            await query.answer()
+        return await route.handler(update, context, *args)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.hits.most_common())
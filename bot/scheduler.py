@@ -1,52 +1,187 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from telegram.ext import ContextTypes
+from telegram.ext import Application
+import asyncio
 import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
 from bot.ui import get_main_menu
-from bot.storage import load_user_sessions
+from bot.storage import aload_user_sessions, adelete_user_session, load_reminder_state, asave_reminder_state, io_executor, ensure_leaderboards
+from bot.broadcast import broadcast
+from bot.reminders import ReminderSchedule, reminder_index
+from bot.cluster import local_sessions, local_worker
 
 logger = logging.getLogger(__name__)
 
 # Initialize scheduler as a global variable
 scheduler = AsyncIOScheduler()
+# Created on first use, once the environment is loaded
+reminder_schedule: Optional[ReminderSchedule] = None
 
-async def send_reminder_message(context: ContextTypes.DEFAULT_TYPE):
-    """Send periodic exam reminders to users."""
+PENDING_REMINDER_TEXT = (
+    "⏰ <b>Exam Reminder</b>\n\n"
+    "You have an unfinished exam! "
+    "Head to the main menu to continue your learning journey. 🎓"
+)
+
+INACTIVE_REMINDER_TEXT = (
+    "⏰ <b>Exam Reminder</b>\n\n"
+    "Don't forget to complete your pending exams! "
+    "Head to the main menu to start or continue your learning journey. 🎓"
+)
+
+async def prune_blocked_users(user_ids):
+    """Drop the sessions of users who blocked the bot so they are not targeted again."""
+    for user_id in user_ids:
+        await adelete_user_session(user_id)
+        reminder_index.forget(user_id)
+    logger.info("Pruned %d blocked users", len(user_ids))
+
+def _reminder_schedule() -> ReminderSchedule:
+    global reminder_schedule
+    if reminder_schedule is None:
+        reminder_schedule = ReminderSchedule(
+            float(os.getenv("REMINDER_INTERVAL_MINUTES", "60")) * 60,
+            int(os.getenv("REMINDER_SLOTS", "60"))
+        )
+        reminder_schedule.restore(load_reminder_state())
+    return reminder_schedule
+
+def build_reminder_index(sessions: Dict[int, Dict]):
+    """Build the reminder index from the sessions plus the saved last-reminded times."""
+    reminded = load_reminder_state().get("reminded", {})
+    reminder_index.build(sessions, reminded, _reminder_schedule().slots)
+
+async def send_reminder_message(application: Application):
+    """Remind the users whose slot is due: those with an unfinished exam, and
+    those inactive for REMINDER_INACTIVE_DAYS days.
+
+    Targets come from the due slots' buckets of the reminder index, so nobody
+    else is contacted and the user base is never scanned. The tick is saved before sending, so a restart
+    never re-sends a slot. Inactive users are snoozed before they are sent a
+    reminder, and the snooze is saved with the tick, so they get at most one
+    every REMINDER_INACTIVE_DAYS days, across restarts too.
+    """
     try:
-        bot = context.bot
-        sessions = load_user_sessions()
-        for user_id in sessions:
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=(
-                        "⏰ <b>Exam Reminder</b>\n\n"
-                        "Don't forget to complete your pending exams! "
-                        "Head to the main menu to start or continue your learning journey. 🎓"
-                    ),
-                    parse_mode='HTML',
-                    reply_markup=get_main_menu()
-                )
-                logger.info("Sent reminder to user %s", user_id)
-            except Exception as e:
-                logger.error("Failed to send reminder to user %s: %s", user_id, e)
+        schedule = _reminder_schedule()
+        tick, slots = schedule.due_slots()
+        if not slots:
+            return
+        if not reminder_index.built:
+            build_reminder_index(local_sessions(await aload_user_sessions()))
+
+        days = float(os.getenv("REMINDER_INACTIVE_DAYS", "3"))
+        pending = reminder_index.pending_users(slots)
+        pending_set = set(pending)
+        inactive = [uid for uid in reminder_index.inactive_users(slots, days) if uid not in pending_set]
+        schedule.mark_done(tick)
+        reminder_index.snooze(inactive)
+        await asave_reminder_state(dict(
+            schedule.to_dict(), reminded=reminder_index.reminded_since(time.time() - days * 86400)
+        ))
+        logger.info(
+            "Reminders for %d slot(s): %d with an unfinished exam, %d inactive",
+            len(slots), len(pending), len(inactive)
+        )
+
+        if pending:
+            await broadcast(
+                application.bot, pending, PENDING_REMINDER_TEXT,
+                name="pending_reminder", reply_markup=get_main_menu(), on_blocked=prune_blocked_users
+            )
+        if inactive:
+            await broadcast(
+                application.bot, inactive, INACTIVE_REMINDER_TEXT,
+                name="inactive_reminder", reply_markup=get_main_menu(), on_blocked=prune_blocked_users
+            )
     except Exception as e:
         logger.error("Error in send_reminder_message: %s", e)
 
+async def write_results_snapshot():
+    """Refresh the columnar results snapshot the dashboard reads, off the event loop."""
+    from bot.snapshot import write_snapshot
+    try:
+        await asyncio.get_running_loop().run_in_executor(io_executor(), write_snapshot)
+    except Exception as e:
+        logger.error("Error writing results snapshot: %s", e)
+
+async def refresh_leaderboards():
+    """Rebuild the leaderboards from the shared results store (cluster workers)."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(io_executor(), ensure_leaderboards, True)
+    except Exception as e:
+        logger.error("Error refreshing leaderboards: %s", e)
+
+def reminder_overview(user_id: Optional[int] = None, count: int = 5) -> Dict:
+    """Next-fire schedule of the reminder job, for inspection."""
+    schedule = _reminder_schedule()
+    job = scheduler.get_job('exam_reminder') if scheduler is not None else None
+    overview = {
+        "interval_minutes": schedule.interval / 60,
+        "slots": schedule.slots,
+        "slot_seconds": schedule.slot_seconds,
+        "last_tick_time": schedule.last_tick * schedule.slot_seconds if schedule.last_tick is not None else None,
+        "job_next_run": job.next_run_time.timestamp() if job is not None and job.next_run_time else None,
+        "upcoming": schedule.upcoming(count),
+        **reminder_index.stats(),
+    }
+    if user_id is not None:
+        overview["user_next_fire"] = schedule.next_fire_for(user_id)
+    return overview
+
 def setup_scheduler(application):
-    """Set up the scheduler with the bot's application context."""
+    """Set up the reminder job: one run per slot, aligned to the wall-clock slot boundaries."""
     global scheduler
     if scheduler is None:
         logger.error("Scheduler is None, reinitializing")
         scheduler = AsyncIOScheduler()
     
     try:
+        schedule = _reminder_schedule()
         scheduler.add_job(
             send_reminder_message,
             'interval',
-            hours=1,  # Change to minutes=1 for testing
+            seconds=schedule.slot_seconds,
+            # Just past the next boundary so the run sees the new tick
+            next_run_time=datetime.fromtimestamp(schedule.next_tick_time() + 1),
             args=[application],
-            id='exam_reminder'
+            id='exam_reminder',
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(
+            "Scheduler configured with exam reminder job: %d slots of %.0f s, resuming after tick %s",
+            schedule.slots, schedule.slot_seconds, schedule.last_tick
         )
-        logger.info("Scheduler configured with exam reminder job")
     except Exception as e:
-        logger.error("Error setting up scheduler: %s", e)
\ No newline at end of file
+        logger.error("Error setting up scheduler: %s", e)
+
+    # One process writes the snapshots: the results store is shared across cluster workers
+    interval = float(os.getenv("SNAPSHOT_INTERVAL_MINUTES", "60"))
+    worker = local_worker()
+    if interval > 0 and (worker is None or worker[0] == 0):
+        scheduler.add_job(
+            write_results_snapshot,
+            'interval',
+            minutes=interval,
+            next_run_time=datetime.now(),
+            id='results_snapshot',
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info("Results snapshot every %.0f minutes", interval)
+
+    # A worker records only its own users' results; the others' arrive through the shared store
+    if worker is not None:
+        scheduler.add_job(
+            refresh_leaderboards,
+            'interval',
+            minutes=float(os.getenv("LEADERBOARD_REFRESH_MINUTES", "5")),
+            id='leaderboard_refresh',
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
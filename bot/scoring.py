@@ -0,0 +1,130 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bot.catalog import NO_KEY, CompiledExam, get_catalog
+from bot.paper import load_paper
+from bot.storage import load_exam_results, patch_exam_results
+
+logger = logging.getLogger(__name__)
+
+# Padding for unanswered slots and for answer-key positions past the last question
+_NO_ANSWER = -2
+_NO_KEY = NO_KEY
+
+
+def pack_answers(rows: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack ragged answer lists into a padded int16 matrix plus their lengths."""
+    lengths = np.fromiter((len(r) for r in rows), dtype=np.int32, count=len(rows))
+    width = int(lengths.max()) if len(rows) else 0
+    matrix = np.full((len(rows), width), _NO_ANSWER, dtype=np.int16)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+    return matrix, lengths
+
+
+def score_batch(exam: CompiledExam, rows: Sequence[Sequence[int]],
+                questions: Optional[Sequence[Optional[Sequence[int]]]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Score many submissions of one exam at once.
+
+    ``questions`` gives, per row, the pool indices of the questions answered
+    (a question-bank paper); None, or a None entry, means the exam in order.
+    Returns ``(correct, total, score)`` arrays with the same semantics as
+    ``CompiledExam.score``: positions without a key (a removed question, an
+    index outside the pool) count in neither ``correct`` nor ``total``.
+    """
+    matrix, _ = pack_answers(rows)
+    full_key = np.frombuffer(exam.answer_key, dtype=np.int16)
+    key = np.full(matrix.shape[1], _NO_KEY, dtype=np.int16)
+    n = min(len(full_key), matrix.shape[1])
+    key[:n] = full_key[:n]
+    if questions is not None and any(q is not None for q in questions):
+        # One key row per paper, gathered from the pool's key
+        key = np.tile(key, (len(rows), 1))
+        for i, q in enumerate(questions):
+            if q is not None:
+                q = np.asarray(q[:matrix.shape[1]], dtype=np.intp)
+                # Questions no longer in the pool keep their position but have no key
+                in_pool = (q >= 0) & (q < len(full_key))
+                key[i, :len(q)] = _NO_KEY
+                key[i, :len(q)][in_pool] = full_key[q[in_pool]]
+                key[i, len(q):] = _NO_KEY
+    correct = (matrix == key).sum(axis=1)
+    total = ((matrix != _NO_ANSWER) & (key != _NO_KEY)).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(total > 0, correct / total * 100, 0.0)
+    return correct, total, score
+
+
+def rescore_results(results: Dict[int, List[Dict]],
+                    updates: Optional[Dict[int, Dict[int, Dict]]] = None) -> Dict:
+    """Re-score stored results in place against the current answer keys.
+
+    Results are grouped by exam and each group is scored with one vectorized
+    compare. Legacy results without grade/subject ids, and results for exams
+    that no longer exist, are left untouched. Results whose score changed are
+    also collected in ``updates`` as ``{user_id: {idx: result}}``, if given.
+    """
+    catalog = get_catalog()
+    groups: Dict[Tuple[str, str], List[Dict]] = {}
+    positions: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+    skipped = 0
+    for user_id, user_results in results.items():
+        for idx, result in enumerate(user_results):
+            key = (str(result.get("grade_id")), result.get("subject_id"))
+            if catalog.get_compiled(*key) is None:
+                skipped += 1
+                continue
+            groups.setdefault(key, []).append(result)
+            positions.setdefault(key, []).append((user_id, idx))
+
+    changed = 0
+    for key, group in groups.items():
+        exam = catalog.get_compiled(*key)
+        papers = [load_paper(exam, r).indices for r in group]
+        correct, total, score = score_batch(exam, [r.get("answers", []) for r in group], papers)
+        for result, (user_id, idx), c, t, sc in zip(group, positions[key], correct.tolist(), total.tolist(), score.tolist()):
+            if result.get("correct") != c or result.get("total") != t or abs(result.get("score", 0) - sc) > 1e-9:
+                result.update({"correct": c, "total": t, "score": sc})
+                changed += 1
+                if updates is not None:
+                    updates.setdefault(user_id, {})[idx] = result
+
+    rescored = sum(len(g) for g in groups.values())
+    return {"rescored": rescored, "changed": changed, "skipped": skipped, "exams": len(groups)}
+
+
+def rescore_all(dry_run: bool = False) -> Dict:
+    """Re-score every stored result and save the ones whose score changed.
+
+    Only the changed records are written, under the results lock, so it is
+    safe while the bot keeps recording results.
+    """
+    stats: Dict = {}
+
+    def rescore(results: Dict[int, List[Dict]]) -> Dict[int, Dict[int, Dict]]:
+        updates: Dict[int, Dict[int, Dict]] = {}
+        stats.update(rescore_results(results, updates))
+        return {} if dry_run else updates
+
+    if dry_run:
+        rescore(load_exam_results())
+    else:
+        patch_exam_results(rescore)
+    logger.info(
+        "Re-scored %d results across %d exams: %d changed, %d skipped%s",
+        stats["rescored"], stats["exams"], stats["changed"], stats["skipped"], " (dry run)" if dry_run else ""
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Re-score all stored exam results against the current answer keys.")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without saving them")
+    args = parser.parse_args()
+    print(json.dumps(rescore_all(dry_run=args.dry_run), indent=2))
@@ -0,0 +1,239 @@
+import asyncio
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks a session that was deleted but not yet flushed
+_DELETED = object()
+
+
+class SessionCache:
+    """In-memory session store with write-behind, batched flushes.
+
+    Writes land in memory and mark the user dirty; a background task hands
+    all dirty sessions to ``writer`` in one batch every ``flush_interval``
+    seconds, or sooner once ``max_dirty`` users are pending. Repeated updates
+    to the same user between flushes are coalesced into one write. Until
+    ``start()`` is called every update is written through immediately.
+
+    Sessions are kept in least-recently-used order; beyond ``max_cached``
+    the oldest clean ones are dropped (they are re-read from storage on the
+    next access). Dirty sessions are never dropped before they are written.
+
+    A detached batch stays in ``_inflight_batch`` until its write returns, so
+    ``overlay`` and eviction treat it like dirty sessions meanwhile.
+    """
+
+    def __init__(self, writer: Callable[[Dict[int, Optional[Dict]]], None],
+                 flush_interval: float = 0.3, max_dirty: int = 200, max_cached: int = 10000):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.max_cached = max_cached
+        self._sessions: "OrderedDict[int, object]" = OrderedDict()
+        self._dirty = set()
+        # Sessions may be primed from storage I/O threads while the loop reads them
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[Executor] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._inflight_batch: Dict[int, Optional[Dict]] = {}
+        self._stopping = False
+        self.flush_count = 0
+        self.flushed_entries = 0
+        self.evicted = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                self._sessions.move_to_end(user_id)
+        return None if session is _DELETED else session
+
+    def contains(self, user_id: int) -> bool:
+        return user_id in self._sessions
+
+    def prime(self, user_id: int, session: Dict) -> Dict:
+        """Cache a session just read from storage without marking it dirty.
+
+        Returns the cached session, which is an earlier one if another reader won the race.
+        """
+        with self._lock:
+            cached = self._sessions.setdefault(user_id, session)
+            self._evict()
+        return session if cached is _DELETED else cached
+
+    def put(self, user_id: int, session: Dict):
+        with self._lock:
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+            self._dirty.add(user_id)
+        self._after_write()
+
+    def delete(self, user_id: int):
+        with self._lock:
+            self._sessions[user_id] = _DELETED
+            self._sessions.move_to_end(user_id)
+            self._dirty.add(user_id)
+        self._after_write()
+
+    def _evict(self):
+        """Drop the least recently used clean sessions beyond ``max_cached``; call with the lock held."""
+        excess = len(self._sessions) - self.max_cached
+        if excess <= 0:
+            return
+        victims = []
+        for user_id in self._sessions:
+            if user_id not in self._dirty and user_id not in self._inflight_batch:
+                victims.append(user_id)
+                if len(victims) == excess:
+                    break
+        for user_id in victims:
+            del self._sessions[user_id]
+        self.evicted += len(victims)
+
+    def overlay(self, sessions: Dict[int, Dict]) -> Dict[int, Dict]:
+        """Apply cached changes not yet in storage (being written, or dirty) on top of sessions read from it.
+
+        The caller must keep the writer out between its read and this call,
+        or a batch written in between would be missed.
+        """
+        with self._lock:
+            # Newest last: the in-flight batch, then what changed since it was taken
+            pending = [(user_id, _DELETED if session is None else session)
+                       for user_id, session in self._inflight_batch.items()]
+            pending += [(user_id, self._sessions.get(user_id)) for user_id in self._dirty]
+        for user_id, session in pending:
+            if session is _DELETED:
+                sessions.pop(user_id, None)
+            elif session is not None:
+                sessions[user_id] = session
+        return sessions
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._dirty.clear()
+            self._inflight_batch = {}
+
+    def _after_write(self):
+        if not self.running:
+            self.flush()
+        elif len(self._dirty) >= self.max_dirty:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take_batch(self) -> Dict[int, Optional[Dict]]:
+        """Detach the dirty set as the in-flight batch, copying sessions so handlers can keep mutating them."""
+        with self._lock:
+            batch = {}
+            for user_id in self._dirty:
+                session = self._sessions.get(user_id)
+                batch[user_id] = None if session is _DELETED else copy.deepcopy(session)
+            self._dirty.clear()
+            if batch:
+                self._inflight_batch = batch
+        return batch
+
+    def _write_batch(self, batch: Dict[int, Optional[Dict]]) -> int:
+        started = time.perf_counter()
+        try:
+            self.writer(batch)
+        except Exception as e:
+            logger.error("Error flushing %d sessions, will retry: %s", len(batch), e)
+            with self._lock:
+                self._dirty.update(batch)
+                self._inflight_batch = {}
+            return 0
+
+        with self._lock:
+            self._inflight_batch = {}
+            for user_id, session in batch.items():
+                if session is None and self._sessions.get(user_id) is _DELETED and user_id not in self._dirty:
+                    self._sessions.pop(user_id, None)
+            self._evict()
+            self.flush_count += 1
+            self.flushed_entries += len(batch)
+        logger.debug("Flushed %d sessions in %.1f ms", len(batch), (time.perf_counter() - started) * 1000)
+        return len(batch)
+
+    def flush(self) -> int:
+        """Write all dirty sessions in one batch on the calling thread. Returns the number written."""
+        batch = self._take_batch()
+        return self._write_batch(batch) if batch else 0
+
+    async def flush_async(self) -> int:
+        """Like ``flush`` but performs the write on the storage executor.
+
+        Waits for the previous write first, so an older batch never lands
+        after a newer one. The write is shielded: cancelling the caller does
+        not abandon a batch that is already detached.
+        """
+        if self._inflight is not None:
+            await asyncio.shield(self._inflight)
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        self._inflight = asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+        return await asyncio.shield(self._inflight)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_async()
+
+    async def start(self, executor: Optional[Executor] = None):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._executor = executor
+        self._inflight = None
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            "Session write-behind started (interval %.0f ms, batch limit %d)",
+            self.flush_interval * 1000, self.max_dirty
+        )
+
+    async def stop(self):
+        """Stop the background task and flush whatever is still pending.
+
+        The task is woken and left to finish its loop rather than cancelled:
+        a cancel racing the wakeup inside ``wait_for`` can be swallowed,
+        leaving the task waiting forever.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        written = await self.flush_async()
+        logger.info(
+            "Session write-behind stopped: final flush %d sessions, %d flushes / %d sessions total",
+            written, self.flush_count, self.flushed_entries
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "cached": len(self._sessions),
+            "dirty": len(self._dirty),
+            "evicted": self.evicted,
+            "flush_count": self.flush_count,
+            "flushed_entries": self.flushed_entries,
+        }
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from bot.analytics import SCORE_BINS, AnswerColumns, ItemAnalysis
+from bot.storage import SNAPSHOT_DIR, load_exam_results
+
+logger = logging.getLogger(__name__)
+
+# Points at the newest complete snapshot directory
+CURRENT_FILE = "CURRENT"
+
+# Column (attribute of AnswerColumns/ItemAnalysis, and file name) -> stored dtype
+_SITTING_COLUMNS = {
+    "sitting_user": np.int64,
+    "sitting_exam": np.int32,
+    "sitting_score": np.float32,
+    "sitting_day": np.int32,
+    "sitting_answers": np.int32,
+}
+_ROW_COLUMNS = {
+    "sitting": np.int32,
+    "item": np.int32,
+    "choice": np.int16,
+    "correct": np.bool_,
+}
+_ITEM_COLUMNS = {
+    "responses": np.int64,
+    "difficulty": np.float32,
+    "discrimination": np.float32,
+    "option_counts": np.int64,
+}
+
+
+def snapshot_dir() -> str:
+    return os.getenv("SNAPSHOT_DIR", SNAPSHOT_DIR)
+
+
+def write_snapshot(columns: Optional[AnswerColumns] = None, directory: Optional[str] = None) -> Dict:
+    """Write the results as a directory of ``.npy`` columns and make it the current snapshot.
+
+    ``columns`` defaults to every stored result. The snapshot is written to a
+    temporary directory and renamed into place, then ``CURRENT`` is switched
+    over atomically, so readers only ever open complete snapshots. The newest
+    SNAPSHOT_KEEP (2) snapshots are kept; a reader still mapping an older one
+    keeps its pages until it lets go.
+    """
+    directory = directory or snapshot_dir()
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    if columns is None:
+        columns = AnswerColumns.from_results(load_exam_results())
+    analysis = ItemAnalysis(columns)
+
+    tmp = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+    try:
+        for name, dtype in _SITTING_COLUMNS.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), getattr(columns, name).astype(dtype, copy=False))
+        for name, dtype in _ROW_COLUMNS.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), getattr(columns, name).astype(dtype, copy=False))
+        for name, dtype in _ITEM_COLUMNS.items():
+            np.save(os.path.join(tmp, f"item_{name}.npy"), getattr(analysis, name).astype(dtype, copy=False))
+        np.save(os.path.join(tmp, "item_offset.npy"), columns.item_offset.astype(np.int64))
+        np.save(os.path.join(tmp, "exam_histogram.npy"), analysis.histogram)
+
+        manifest = {
+            "created": time.time(),
+            "sittings": columns.sittings,
+            "rows": columns.rows,
+            "skipped_results": columns.skipped,
+            "score_bins": SCORE_BINS,
+            "exams": [
+                {"grade_id": e.grade_id, "subject_id": e.subject_id, "grade_title": e.grade_title,
+                 "title": e.title, "questions": len(e.questions)}
+                for e in columns.exams
+            ],
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        now = time.time_ns()
+        # Sorts by creation time, which is what pruning relies on
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(now / 1e9)) + f"-{now % 10**9:09d}"
+        os.rename(tmp, os.path.join(directory, name))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    fd, pointer = tempfile.mkstemp(dir=directory, prefix=".tmp-current")
+    with os.fdopen(fd, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+    _prune(directory, int(os.getenv("SNAPSHOT_KEEP", "2")))
+
+    stats = {"snapshot": name, "sittings": columns.sittings, "rows": columns.rows,
+             "seconds": round(time.perf_counter() - started, 3)}
+    logger.info("Results snapshot %s: %d sittings, %d answers in %.2fs",
+                name, stats["sittings"], stats["rows"], stats["seconds"])
+    return stats
+
+
+def _prune(directory: str, keep: int):
+    snapshots = sorted(
+        d for d in os.listdir(directory)
+        if not d.startswith(".") and os.path.isdir(os.path.join(directory, d))
+    )
+    for old in snapshots[:-max(keep, 1)]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def current_snapshot(directory: Optional[str] = None) -> Optional[str]:
+    """Path of the current snapshot, or None if none has been written."""
+    directory = directory or snapshot_dir()
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+class Snapshot:
+    """A results snapshot opened read-only; every column is memory-mapped, not read.
+
+    Queries take a boolean mask over the sittings (``select``) and aggregate
+    with ``np.bincount``, touching only the columns they use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.exams = self.manifest["exams"]
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return column
+
+    @property
+    def sittings(self) -> int:
+        return self.manifest["sittings"]
+
+    def exam_codes(self, grade_ids: Optional[Iterable[str]] = None, subject_ids: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Indices of the exams matching the grades and subjects (None: any)."""
+        grades = set(grade_ids) if grade_ids else None
+        subjects = set(subject_ids) if subject_ids else None
+        return np.array([
+            code for code, e in enumerate(self.exams)
+            if (grades is None or e["grade_id"] in grades) and (subjects is None or e["subject_id"] in subjects)
+        ], dtype=np.int32)
+
+    def day_range(self) -> Tuple[Optional[int], Optional[int]]:
+        days = self["sitting_day"]
+        known = days[days >= 0]
+        return (int(known.min()), int(known.max())) if len(known) else (None, None)
+
+    def select(self, exam_codes: Optional[np.ndarray] = None, first_day: Optional[int] = None,
+               last_day: Optional[int] = None) -> np.ndarray:
+        """Boolean mask of the sittings of ``exam_codes`` between two days (inclusive)."""
+        mask = np.ones(self.sittings, dtype=bool)
+        if exam_codes is not None:
+            wanted = np.zeros(len(self.exams), dtype=bool)
+            wanted[exam_codes] = True
+            mask &= wanted[self["sitting_exam"]]
+        if first_day is not None or last_day is not None:
+            days = self["sitting_day"]
+            if first_day is not None:
+                mask &= days >= first_day
+            if last_day is not None:
+                mask &= days <= last_day
+        return mask
+
+    def score_histogram(self, mask: np.ndarray) -> np.ndarray:
+        """Sittings per 10-point score bin."""
+        bins = np.minimum((self["sitting_score"][mask] // 10).astype(np.int64), SCORE_BINS - 1)
+        return np.bincount(np.maximum(bins, 0), minlength=SCORE_BINS)
+
+    def per_exam(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """``(sittings, mean score)`` per exam."""
+        exams = self["sitting_exam"][mask]
+        count = np.bincount(exams, minlength=len(self.exams))
+        total = np.bincount(exams, weights=self["sitting_score"][mask], minlength=len(self.exams))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return count, np.where(count > 0, total / count, np.nan)
+
+    def trend(self, mask: np.ndarray, days_per_bucket: int = 7) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(first day of each bucket, sittings, mean score)`` over time; undated sittings are left out."""
+        days = self["sitting_day"][mask]
+        dated = days >= 0
+        days = days[dated]
+        if not len(days):
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+        start = int(days.min()) // days_per_bucket
+        buckets = days // days_per_bucket - start
+        count = np.bincount(buckets)
+        total = np.bincount(buckets, weights=self["sitting_score"][mask][dated])
+        first_days = (np.arange(len(count)) + start) * days_per_bucket
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return first_days, count, np.where(count > 0, total / count, np.nan)
+
+
+def open_snapshot(directory: Optional[str] = None) -> Optional[Snapshot]:
+    """The current snapshot, or None if none has been written yet."""
+    path = current_snapshot(directory)
+    return Snapshot(path) if path else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    print(json.dumps(write_snapshot(), indent=2))
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_user ON results (user_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStore:
+    """SQLite (WAL) storage for user sessions and exam results.
+
+    One row per session and one row per result, so writing a single user's
+    state costs the same no matter how many users are stored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        logger.info("Opened SQLite storage at %s", path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Sessions
+
+    def get_session(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_session(self, user_id: int, session: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                (user_id, json.dumps(session, ensure_ascii=False))
+            )
+
+    def put_sessions(self, sessions: Iterable[Tuple[int, Dict]]):
+        """Upsert many sessions in a single transaction."""
+        rows = [(user_id, json.dumps(session, ensure_ascii=False)) for user_id, session in sessions]
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO sessions (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                rows
+            )
+
+    def delete_session(self, user_id: int) -> bool:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return cur.rowcount > 0
+
+    def all_sessions(self) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM sessions").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def replace_sessions(self, sessions: Dict[int, Dict]):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.executemany(
+                "INSERT INTO sessions (user_id, data) VALUES (?, ?)",
+                [(int(k), json.dumps(v, ensure_ascii=False)) for k, v in sessions.items()]
+            )
+
+    # Results
+
+    def add_result(self, user_id: int, result: Dict) -> int:
+        """Insert a result and return its per-user index."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO results (user_id, data) VALUES (?, ?)",
+                (user_id, json.dumps(result, ensure_ascii=False))
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results WHERE user_id = ?", (user_id,)).fetchone()[0]
+        return count - 1
+
+    def user_results(self, user_id: int) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM results WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count_results(self, user_id: int) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def count_all(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def user_result(self, user_id: int, idx: int) -> Optional[Dict]:
+        if idx < 0:
+            idx += self.count_results(user_id)
+            if idx < 0:
+                return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM results WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?", (user_id, idx)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent_results(self, user_id: int, n: int) -> List[Dict]:
+        """The user's last ``n`` results, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM results WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, n)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def all_results(self) -> Dict[int, List]:
+        results: Dict[int, List] = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM results ORDER BY id").fetchall()
+        for user_id, data in rows:
+            results.setdefault(user_id, []).append(json.loads(data))
+        return results
+
+    def replace_results(self, results: Dict[int, List]):
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM results")
+            self._conn.executemany(
+                "INSERT INTO results (user_id, data) VALUES (?, ?)",
+                [(int(k), json.dumps(r, ensure_ascii=False)) for k, v in results.items() for r in v]
+            )
+
+    def update_results(self, updates: Dict[int, Dict[int, Dict]]) -> int:
+        """Replace individual results, given as ``{user_id: {idx: result}}``. Returns how many."""
+        updated = 0
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            for user_id, changed in updates.items():
+                ids = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM results WHERE user_id = ? ORDER BY id", (int(user_id),)
+                )]
+                rows = [(json.dumps(result, ensure_ascii=False), ids[idx]) for idx, result in changed.items()
+                        if 0 <= idx < len(ids)]
+                self._conn.executemany("UPDATE results SET data = ? WHERE id = ?", rows)
+                updated += len(rows)
+        return updated
+
+    # Migration
+
+    def migrate_from_json(self, sessions_path: str, results_path: str, force: bool = False) -> bool:
+        """Import the legacy JSON files once. Returns True if a migration ran."""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done and not force:
+            return False
+
+        sessions, results = {}, {}
+        for path, target in ((sessions_path, sessions), (results_path, results)):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    target.update({int(k): v for k, v in json.load(f).items()})
+
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO sessions (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                [(k, json.dumps(v, ensure_ascii=False)) for k, v in sessions.items()]
+            )
+            if force:
+                self._conn.execute("DELETE FROM results")
+            self._conn.executemany(
+                "INSERT INTO results (user_id, data) VALUES (?, ?)",
+                [(k, json.dumps(r, ensure_ascii=False)) for k, v in results.items() for r in v]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', datetime('now'))"
+            )
+        logger.info(
+            "Migrated %d sessions and %d results from JSON into %s",
+            len(sessions), sum(len(v) for v in results.values()), self.path
+        )
+        return True
+
+
+if __name__ == "__main__":
+    import argparse
+    from bot.storage import SQLITE_DB_PATH, USER_SESSIONS_PATH, EXAM_RESULTS_PATH
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Migrate JSON sessions/results into the SQLite store.")
+    parser.add_argument("--db", default=SQLITE_DB_PATH)
+    parser.add_argument("--force", action="store_true", help="re-import even if a migration already ran")
+    args = parser.parse_args()
+    SQLiteStore(args.db).migrate_from_json(USER_SESSIONS_PATH, EXAM_RESULTS_PATH, force=args.force)
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RECENT_RESULTS = 5
+
+
+def subject_key(result: Dict) -> str:
+    """Identify the exam a result belongs to; legacy results only carry ``exam_id``."""
+    if result.get("subject_id"):
+        return f"{result.get('grade_id')}/{result['subject_id']}"
+    return str(result.get("exam_id", "unknown"))
+
+
+class UserStats:
+    """Running aggregates of one user's results."""
+    __slots__ = ("count", "score_sum", "best", "subjects", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.score_sum = 0.0
+        self.best = 0.0
+        self.subjects = set()
+        # Ring buffer of the latest results: {"idx", "exam_title", "score", "date"}
+        self.recent = deque(maxlen=RECENT_RESULTS)
+
+    @property
+    def average(self) -> float:
+        return self.score_sum / self.count if self.count else 0.0
+
+    def add(self, result: Dict, idx: int):
+        score = float(result.get("score", 0))
+        self.count += 1
+        self.score_sum += score
+        self.best = max(self.best, score)
+        self.subjects.add(subject_key(result))
+        self.recent.append({
+            "idx": idx,
+            "exam_title": result.get("exam_title", ""),
+            "score": score,
+            "date": result.get("date", ""),
+        })
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "score_sum": self.score_sum,
+            "best": self.best,
+            "subjects": sorted(self.subjects),
+            "recent": list(self.recent),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.score_sum = data["score_sum"]
+        stats.best = data["best"]
+        stats.subjects = set(data["subjects"])
+        stats.recent.extend(data["recent"])
+        return stats
+
+
+class StatsStore:
+    """Per-user aggregates kept in memory and updated in O(1) per new result.
+
+    The aggregates are saved to ``path`` together with the number of results
+    they cover; if that number no longer matches the results store on load
+    (e.g. after a crash), they are rebuilt with ``backfill``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._users: Dict[int, UserStats] = {}
+        self._lock = threading.Lock()
+        self.results_total = 0
+        self.loaded = False
+
+    def record(self, user_id: int, result: Dict, idx: int):
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is None:
+                stats = self._users[user_id] = UserStats()
+            stats.add(result, idx)
+            self.results_total += 1
+
+    def get(self, user_id: int) -> Optional[UserStats]:
+        return self._users.get(user_id)
+
+    def backfill(self, results: Dict[int, List[Dict]]):
+        """Rebuild every user's aggregates from their full result history."""
+        users: Dict[int, UserStats] = {}
+        total = 0
+        for user_id, user_results in results.items():
+            stats = UserStats()
+            for idx, result in enumerate(user_results):
+                stats.add(result, idx)
+            if stats.count:
+                users[int(user_id)] = stats
+            total += len(user_results)
+        with self._lock:
+            self._users = users
+            self.results_total = total
+            self.loaded = True
+        logger.info("Built statistics for %d users from %d results", len(users), total)
+
+    def load(self, expected_total: int) -> bool:
+        """Load saved aggregates if they cover exactly ``expected_total`` results."""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("results_total") != expected_total:
+                logger.info(
+                    "Saved statistics cover %s results, store has %d; rebuilding",
+                    data.get("results_total"), expected_total
+                )
+                return False
+            users = {int(k): UserStats.from_dict(v) for k, v in data.get("users", {}).items()}
+        except Exception as e:
+            logger.error("Error loading user statistics: %s", e)
+            return False
+        with self._lock:
+            self._users = users
+            self.results_total = expected_total
+            self.loaded = True
+        return True
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "results_total": self.results_total,
+                "users": {str(k): v.to_dict() for k, v in self._users.items()},
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+    from bot.storage import load_exam_results, user_stats, save_user_stats
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Per-user result statistics.")
+    parser.add_argument("command", choices=["backfill"], help="backfill: rebuild statistics from stored results")
+    parser.parse_args()
+    user_stats.backfill(load_exam_results())
+    save_user_stats()
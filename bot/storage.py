@@ -1,7 +1,17 @@
+import asyncio
+import functools
 import json
 import os
 import logging
-from typing import Dict, List
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from bot.leaderboard import Leaderboards
+from bot.session_cache import SessionCache
+from bot.stats import StatsStore, UserStats
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +20,107 @@ DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
 EXAM_DB_PATH = os.path.join(DATA_DIR, "exam_data.json")
+# Pre-validated catalog built from EXAM_DB_PATH by ``python -m bot.ingest``
+EXAM_CATALOG_PATH = os.path.join(DATA_DIR, "exam_catalog.json")
 USER_SESSIONS_PATH = os.path.join(DATA_DIR, "user_sessions.json")
 EXAM_RESULTS_PATH = os.path.join(DATA_DIR, "exam_results.json")
-LESSON_DB_PATH = os.path.join(DATA_DIR, "lesson.json") 
+LESSON_DB_PATH = os.path.join(DATA_DIR, "lesson_data.json")
+SQLITE_DB_PATH = os.path.join(DATA_DIR, "bot.db")
+RESULTS_LOG_PATH = os.path.join(DATA_DIR, "exam_results.jsonl")
+RESULTS_INDEX_PATH = os.path.join(DATA_DIR, "exam_results.idx")
+# Columnar snapshots of the results for the dashboard (bot/snapshot.py)
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+# Cluster workers each keep their own statistics and reminder progress
+_WORKER_SUFFIX = f".w{os.environ['CLUSTER_WORKER']}" if os.getenv("CLUSTER_WORKER") else ""
+USER_STATS_PATH = os.path.join(DATA_DIR, f"user_stats{_WORKER_SUFFIX}.json")
+REMINDER_STATE_PATH = os.path.join(DATA_DIR, f"reminder_schedule{_WORKER_SUFFIX}.json")
+
+_sqlite_store = None
+_results_log = None
+_backend_lock = threading.Lock()
+# Guards read-modify-write of the JSON files, which may run on several I/O threads
+_json_lock = threading.RLock()
+_io_executor: Optional[ThreadPoolExecutor] = None
+# Keeps the per-user statistics in step with the results store
+_stats_lock = threading.RLock()
+# Orders session batch writes against full reads (load_user_sessions)
+_sessions_lock = threading.Lock()
+user_stats = StatsStore(USER_STATS_PATH)
+leaderboards = Leaderboards()
+_user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def user_lock(user_id: int) -> asyncio.Lock:
+    """Lock serializing one user's session updates; different users never contend.
+
+    Locks are held weakly, so a user's lock disappears once nobody is using it.
+    """
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    return lock
+
+def _atomic_write_json(path: str, data, indent: Optional[int] = 2):
+    """Write JSON to a temp file in the same directory, fsync it, then rename it over ``path``."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
+def _sqlite():
+    """Return the SQLite store when STORAGE_BACKEND=sqlite, otherwise None."""
+    global _sqlite_store
+    if _sqlite_store is None and os.getenv("STORAGE_BACKEND", "json").lower() == "sqlite":
+        with _backend_lock:
+            if _sqlite_store is None:
+                from bot.sqlite_store import SQLiteStore
+                store = SQLiteStore(SQLITE_DB_PATH)
+                store.migrate_from_json(USER_SESSIONS_PATH, EXAM_RESULTS_PATH)
+                _sqlite_store = store
+    return _sqlite_store
+
+def _results_store():
+    """Return the results store in use: the append-only log (RESULTS_BACKEND=log),
+    the SQLite store, or None for the legacy JSON file."""
+    global _results_log
+    if _results_log is None and os.getenv("RESULTS_BACKEND", "").lower() == "log":
+        with _backend_lock:
+            if _results_log is None:
+                from bot.results_log import ResultsLog
+                log = ResultsLog(RESULTS_LOG_PATH, RESULTS_INDEX_PATH)
+                log.migrate_from_json(EXAM_RESULTS_PATH)
+                _results_log = log
+    return _results_log or _sqlite()
+
+def new_user_session() -> Dict:
+    """Return a fresh, inactive session."""
+    return {
+        "current_exam": None,
+        "current_question": 0,
+        "answers": [],
+        "start_time": None,
+        "exam_active": False
+    }
+
+
+def validate_exam_database(data: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Drop grades and subjects that fail the catalog schema (bot/ingest.py); failing questions become None."""
+    from bot.ingest import validate_catalog
+
+    clean, errors, warnings = validate_catalog(data)
+    for path, message in errors:
+        logger.warning("Exam database: %s: %s, removing", path, message)
+    if errors or warnings:
+        logger.warning("Exam database has %d errors and %d warnings; run `python -m bot.ingest` for the full report",
+                       len(errors), len(warnings))
+    return clean
 
 def load_exam_database() -> Dict[str, Dict]:
     """Load exam database in the original nested grade -> subjects structure."""
@@ -25,45 +132,49 @@ def load_exam_database() -> Dict[str, Dict]:
             return {}
         with open(EXAM_DB_PATH, 'r') as f:
             data = json.load(f)
-        for grade_id, grade_data in list(data.items()):
-            if 'subjects' not in grade_data:
-                logger.warning("Grade %s missing 'subjects' key, removing", grade_id)
-                data.pop(grade_id)
-                continue
-            for subject_id, subject_data in list(grade_data['subjects'].items()):
-                required_fields = ['title', 'description', 'duration', 'questions']
-                if not all(k in subject_data for k in required_fields):
-                    logger.warning("Subject %s in grade %s missing required fields, removing", subject_id, grade_id)
-                    grade_data['subjects'].pop(subject_id)
-                    continue
-        return data
+        return validate_exam_database(data)
     except Exception as e:
         logger.error("Error loading exam database: %s", e)
         return {}
     
+def _read_json_sessions() -> Dict[int, Dict]:
+    if not os.path.exists(USER_SESSIONS_PATH):
+        with open(USER_SESSIONS_PATH, 'w') as f:
+            json.dump({}, f)
+    with open(USER_SESSIONS_PATH, 'r') as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
 def load_user_sessions() -> Dict[int, Dict]:
-    """Load user sessions from JSON file."""
+    """Load all user sessions, including changes not yet flushed or still being written."""
     try:
-        if not os.path.exists(USER_SESSIONS_PATH):
-            with open(USER_SESSIONS_PATH, 'w') as f:
-                json.dump({}, f)
-        with open(USER_SESSIONS_PATH, 'r') as f:
-            return {int(k): v for k, v in json.load(f).items()}
+        store = _sqlite()
+        # No batch may land between the read and the overlay
+        with _sessions_lock:
+            sessions = store.all_sessions() if store else _read_json_sessions()
+            return session_cache.overlay(sessions)
     except Exception as e:
         logger.error("Error loading user sessions: %s", e)
         return {}
 
 def save_user_sessions(sessions: Dict[int, Dict]):
-    """Save user sessions to JSON file."""
+    """Replace all user sessions."""
     try:
-        with open(USER_SESSIONS_PATH, 'w') as f:
-            json.dump(sessions, f, indent=2)
+        session_cache.clear()
+        store = _sqlite()
+        if store:
+            store.replace_sessions(sessions)
+            return
+        with _json_lock:
+            _atomic_write_json(USER_SESSIONS_PATH, sessions)
     except Exception as e:
         logger.error("Error saving user sessions: %s", e)
 
 def load_exam_results() -> Dict[int, List]:
-    """Load exam results from JSON file."""
+    """Load all exam results."""
     try:
+        store = _results_store()
+        if store:
+            return store.all_results()
         if not os.path.exists(EXAM_RESULTS_PATH):
             with open(EXAM_RESULTS_PATH, 'w') as f:
                 json.dump({}, f)
@@ -74,48 +185,310 @@ def load_exam_results() -> Dict[int, List]:
         return {}
 
 def save_exam_results(results: Dict[int, List]):
-    """Save exam results to JSON file."""
+    """Replace all exam results."""
     try:
-        with open(EXAM_RESULTS_PATH, 'w') as f:
-            json.dump(results, f, indent=2)
+        with _stats_lock:
+            store = _results_store()
+            if store:
+                store.replace_results(results)
+            else:
+                with _json_lock:
+                    _atomic_write_json(EXAM_RESULTS_PATH, results)
+            _refresh_aggregates(results)
     except Exception as e:
         logger.error("Error saving exam results: %s", e)
 
+def patch_exam_results(fn: Callable[[Dict[int, List]], Dict[int, Dict[int, Dict]]]) -> int:
+    """Load all results, let ``fn`` pick the ones to change and write back only those.
+
+    ``fn`` gets every user's results and returns ``{user_id: {idx: new result}}``.
+    The results lock is held from the load to the write, so results recorded
+    meanwhile are neither lost nor overwritten. Returns the number written.
+    """
+    with _stats_lock:
+        results = load_exam_results()
+        updates = {user_id: changed for user_id, changed in fn(results).items() if changed}
+        if not updates:
+            return 0
+        store = _results_store()
+        if store:
+            written = store.update_results(updates)
+        else:
+            with _json_lock:
+                stored = load_exam_results()
+                written = 0
+                for user_id, changed in updates.items():
+                    user_results = stored.get(user_id, [])
+                    for idx, result in changed.items():
+                        if 0 <= idx < len(user_results):
+                            user_results[idx] = result
+                            written += 1
+                _atomic_write_json(EXAM_RESULTS_PATH, stored)
+            results = stored
+        for user_id, changed in updates.items():
+            for idx, result in changed.items():
+                if 0 <= idx < len(results.get(user_id, ())):
+                    results[user_id][idx] = result
+        _refresh_aggregates(results)
+    return written
+
+def _refresh_aggregates(results: Dict[int, List]):
+    """Rebuild the statistics and leaderboards that are in use after a bulk change to ``results``."""
+    if user_stats.loaded:
+        user_stats.backfill(results)
+        save_user_stats()
+    if leaderboards.built:
+        leaderboards.rebuild(results)
+
+def _write_sessions(batch: Dict[int, Optional[Dict]]):
+    """Persist a batch of changed sessions; None means the session was deleted."""
+    store = _sqlite()
+    if store:
+        with _sessions_lock:
+            store.put_sessions((k, v) for k, v in batch.items() if v is not None)
+            for user_id in (k for k, v in batch.items() if v is None):
+                store.delete_session(user_id)
+        return
+    with _sessions_lock, _json_lock:
+        sessions = _read_json_sessions()
+        for user_id, session in batch.items():
+            if session is None:
+                sessions.pop(user_id, None)
+            else:
+                sessions[user_id] = session
+        _atomic_write_json(USER_SESSIONS_PATH, sessions)
+
+session_cache = SessionCache(_write_sessions, max_cached=int(os.getenv("SESSION_CACHE_SIZE", "10000")))
+
 def get_user_session(user_id: int) -> Dict:
-    """Get or create user session."""
-    sessions = load_user_sessions()
-    if user_id not in sessions:
-        sessions[user_id] = {
-            "current_exam": None,
-            "current_question": 0,
-            "answers": [],
-            "start_time": None,
-            "exam_active": False
-        }
-        save_user_sessions(sessions)
-    return sessions[user_id]
+    """Get or create user session.
+
+    A failed read is re-raised rather than answered with a new session: that
+    session would be flushed over the stored one, active exam included.
+    """
+    session = session_cache.get(user_id)
+    if session is not None:
+        return session
+    if not session_cache.contains(user_id):
+        try:
+            store = _sqlite()
+            session = store.get_session(user_id) if store else _read_json_sessions().get(user_id)
+        except Exception as e:
+            logger.error("Error loading session for user %s: %s", user_id, e)
+            raise
+    if session is None:
+        session = new_user_session()
+        session_cache.put(user_id, session)
+    else:
+        session = session_cache.prime(user_id, session)
+    return session
 
 def update_user_session(user_id: int, session_data: Dict):
-    """Update and save user session data."""
-    sessions = load_user_sessions()
-    sessions[user_id] = session_data
-    save_user_sessions(sessions)
-
-def add_exam_result(user_id: int, exam_result: Dict):
-    """Add a new exam result for a user."""
-    results = load_exam_results()
-    if user_id not in results:
-        results[user_id] = []
-    results[user_id].append(exam_result)
-    save_exam_results(results)
+    """Update user session data; written to storage on the next flush."""
+    session_cache.put(user_id, session_data)
+
+def add_exam_result(user_id: int, exam_result: Dict) -> int:
+    """Add a new exam result for a user and return its index in the user's history."""
+    with _stats_lock:
+        store = _results_store()
+        if store:
+            idx = store.add_result(user_id, exam_result)
+        else:
+            with _json_lock:
+                results = load_exam_results()
+                if user_id not in results:
+                    results[user_id] = []
+                results[user_id].append(exam_result)
+                _atomic_write_json(EXAM_RESULTS_PATH, results)
+                idx = len(results[user_id]) - 1
+        if user_stats.loaded:
+            user_stats.record(user_id, exam_result, idx)
+        if leaderboards.built:
+            leaderboards.record(user_id, exam_result)
+    return idx
+
+def get_user_results(user_id: int) -> List[Dict]:
+    """Get one user's exam results, oldest first."""
+    store = _results_store()
+    if store:
+        try:
+            return store.user_results(user_id)
+        except Exception as e:
+            logger.error("Error loading results for user %s: %s", user_id, e)
+            return []
+    return load_exam_results().get(user_id, [])
+
+def get_user_result(user_id: int, idx: int) -> Optional[Dict]:
+    """Get a single result by its index in the user's history."""
+    store = _results_store()
+    if store:
+        try:
+            return store.user_result(user_id, idx)
+        except Exception as e:
+            logger.error("Error loading result %s for user %s: %s", idx, user_id, e)
+            return None
+    results = get_user_results(user_id)
+    return results[idx] if -len(results) <= idx < len(results) else None
+
+def get_recent_results(user_id: int, n: int) -> List[Dict]:
+    """Get a user's last ``n`` results, oldest first."""
+    store = _results_store()
+    if store:
+        try:
+            return store.recent_results(user_id, n)
+        except Exception as e:
+            logger.error("Error loading recent results for user %s: %s", user_id, e)
+            return []
+    return get_user_results(user_id)[-n:] if n > 0 else []
+
+def count_user_results(user_id: int) -> int:
+    """Number of results recorded for a user."""
+    store = _results_store()
+    if store:
+        try:
+            return store.count_results(user_id)
+        except Exception as e:
+            logger.error("Error counting results for user %s: %s", user_id, e)
+            return 0
+    return len(get_user_results(user_id))
+
+def count_all_results() -> int:
+    """Total number of stored results across all users."""
+    store = _results_store()
+    if store:
+        return store.count_all()
+    return sum(len(v) for v in load_exam_results().values())
+
+def save_user_stats():
+    """Persist the per-user statistics."""
+    try:
+        _atomic_write_json(USER_STATS_PATH, user_stats.snapshot(), indent=None)
+    except Exception as e:
+        logger.error("Error saving user statistics: %s", e)
+
+def ensure_user_stats():
+    """Load the per-user statistics, rebuilding them from all results if they are stale."""
+    if user_stats.loaded:
+        return
+    with _stats_lock:
+        if user_stats.loaded:
+            return
+        if not user_stats.load(count_all_results()):
+            user_stats.backfill(load_exam_results())
+            save_user_stats()
+
+def ensure_leaderboards(refresh: bool = False):
+    """Build the leaderboards from all results, unless built already (or ``refresh``)."""
+    if leaderboards.built and not refresh:
+        return
+    with _stats_lock:
+        if not leaderboards.built or refresh:
+            leaderboards.rebuild(load_exam_results())
+
+def get_user_stats(user_id: int) -> Optional[UserStats]:
+    """Aggregated statistics for a user, or None if they have no results."""
+    ensure_user_stats()
+    return user_stats.get(user_id)
+
+def load_reminder_state() -> Dict:
+    """Load the persisted reminder schedule state, or {} if there is none."""
+    try:
+        if not os.path.exists(REMINDER_STATE_PATH):
+            return {}
+        with open(REMINDER_STATE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error("Error loading reminder schedule: %s", e)
+        return {}
+
+def save_reminder_state(state: Dict):
+    """Persist the reminder schedule state."""
+    try:
+        _atomic_write_json(REMINDER_STATE_PATH, state)
+    except Exception as e:
+        logger.error("Error saving reminder schedule: %s", e)
 
 def delete_user_session(user_id: int):
     """Delete a user's session data."""
-    sessions = load_user_sessions()
-    if user_id in sessions:
-        sessions.pop(user_id)
-        save_user_sessions(sessions)
-        logger.info("Deleted session data for user %s", user_id)
+    session_cache.delete(user_id)
+    logger.info("Deleted session data for user %s", user_id)
+
+def io_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool for storage I/O, sized by STORAGE_IO_THREADS (default 4)."""
+    global _io_executor
+    if _io_executor is None:
+        with _backend_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("STORAGE_IO_THREADS", "4")),
+                    thread_name_prefix="storage-io"
+                )
+    return _io_executor
+
+def shutdown_io_executor():
+    """Wait for queued storage I/O to finish and release the pool."""
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
+
+async def _run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_executor(), functools.partial(func, *args))
+
+# Async variants of the storage API for use inside handlers. They run the
+# blocking file/database work on the storage I/O pool instead of the event loop.
+
+async def aget_user_session(user_id: int) -> Dict:
+    session = session_cache.get(user_id)
+    if session is not None:
+        return session
+    return await _run_io(get_user_session, user_id)
+
+async def aupdate_user_session(user_id: int, session_data: Dict):
+    if session_cache.running:
+        update_user_session(user_id, session_data)
+    else:
+        await _run_io(update_user_session, user_id, session_data)
+
+async def adelete_user_session(user_id: int):
+    if session_cache.running:
+        delete_user_session(user_id)
+    else:
+        await _run_io(delete_user_session, user_id)
+
+async def aload_user_sessions() -> Dict[int, Dict]:
+    return await _run_io(load_user_sessions)
+
+async def asave_reminder_state(state: Dict):
+    await _run_io(save_reminder_state, state)
+
+async def aload_exam_results() -> Dict[int, List]:
+    return await _run_io(load_exam_results)
+
+async def aadd_exam_result(user_id: int, exam_result: Dict) -> int:
+    return await _run_io(add_exam_result, user_id, exam_result)
+
+async def aget_user_results(user_id: int) -> List[Dict]:
+    return await _run_io(get_user_results, user_id)
+
+async def aget_user_result(user_id: int, idx: int) -> Optional[Dict]:
+    return await _run_io(get_user_result, user_id, idx)
+
+async def aget_recent_results(user_id: int, n: int) -> List[Dict]:
+    return await _run_io(get_recent_results, user_id, n)
+
+async def acount_user_results(user_id: int) -> int:
+    return await _run_io(count_user_results, user_id)
+
+async def aget_user_stats(user_id: int) -> Optional[UserStats]:
+    if user_stats.loaded:
+        return user_stats.get(user_id)
+    return await _run_io(get_user_stats, user_id)
+
+async def aget_standing(grade_id: str, subject_id: str, user_id: int, k: int) -> Optional[Dict]:
+    if not leaderboards.built:
+        await _run_io(ensure_leaderboards)
+    return leaderboards.standing(grade_id, subject_id, user_id, k)
 
 def load_lessons() -> Dict[str, Dict]:
     """Load lesson/study materials database."""
@@ -0,0 +1,100 @@
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from telegram.ext import ContextTypes, Job, JobQueue
+
+from bot.catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_REASON = "⏰ អស់ម៉ោងប្រឡង"
+
+
+def exam_deadline(session: Dict) -> Optional[float]:
+    """When the session's exam runs out: its start time plus the subject's duration.
+
+    A subject that left the catalog or has no usable duration gets
+    EXAM_MAX_MINUTES, so every active exam ends eventually. None if no exam
+    is active.
+    """
+    if not session.get("exam_active") or not session.get("start_time"):
+        return None
+    exam = get_catalog().get_compiled(session.get("current_grade"), session.get("current_subject"))
+    try:
+        minutes = float(exam.duration) if exam is not None else 0.0
+    except (TypeError, ValueError):
+        minutes = 0.0
+    if not minutes > 0:
+        minutes = float(os.getenv("EXAM_MAX_MINUTES", "180"))
+    return float(session["start_time"]) + minutes * 60 + float(os.getenv("EXAM_GRACE_SECONDS", "30"))
+
+
+class ExamTimers:
+    """One JobQueue deadline job per active exam; nothing scans sessions periodically.
+
+    A job carries the ``start_time`` of the exam it was scheduled for, so a
+    job that outlived its exam (finished, restarted) ends nothing. Jobs are
+    kept by user id, so rescheduling or cancelling one is O(1). After a
+    restart ``rebuild`` schedules the jobs again from the stored sessions;
+    exams whose deadline passed while the bot was down end right away.
+    """
+
+    def __init__(self):
+        self.job_queue: Optional[JobQueue] = None
+        self._jobs: Dict[int, Job] = {}
+        self.fired = 0
+
+    def attach(self, job_queue: Optional[JobQueue]):
+        if job_queue is None:
+            logger.warning("No JobQueue available, exam time limits are not enforced")
+        self.job_queue = job_queue
+
+    def schedule(self, user_id: int, session: Dict) -> Optional[float]:
+        """(Re)schedule the deadline of the user's active exam; returns the deadline."""
+        self.cancel(user_id)
+        deadline = exam_deadline(session)
+        if deadline is None or self.job_queue is None:
+            return None
+        self._jobs[user_id] = self.job_queue.run_once(
+            self._expire,
+            when=max(0.0, deadline - time.time()),
+            data=(user_id, session["start_time"]),
+            name=f"exam_timeout:{user_id}",
+            chat_id=user_id,
+            user_id=user_id,
+        )
+        return deadline
+
+    def cancel(self, user_id: int):
+        job = self._jobs.pop(user_id, None)
+        if job is not None:
+            job.schedule_removal()
+
+    def rebuild(self, sessions: Dict[int, Dict]) -> int:
+        """Schedule the deadline of every active exam in ``sessions`` (at startup)."""
+        count = 0
+        for user_id, session in sessions.items():
+            if session.get("exam_active") and self.schedule(int(user_id), session) is not None:
+                count += 1
+        logger.info("Exam timers: %d active exams scheduled", count)
+        return count
+
+    async def _expire(self, context: ContextTypes.DEFAULT_TYPE):
+        from bot.exam import end_exam
+
+        user_id, started_at = context.job.data
+        if self._jobs.get(user_id) is context.job:
+            del self._jobs[user_id]
+        self.fired += 1
+        try:
+            await end_exam(None, context, TIMEOUT_REASON, user_id=user_id, started_at=started_at)
+        except Exception as e:
+            logger.error("Error ending timed-out exam for user %s: %s", user_id, e)
+
+    def stats(self) -> Dict:
+        return {"scheduled": len(self._jobs), "fired": self.fired}
+
+
+exam_timers = ExamTimers()
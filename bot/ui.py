@@ -3,7 +3,8 @@ from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ConversationHandler, ContextTypes
 
-from .storage import load_exam_database
+from .catalog import get_catalog
+from .markup import markup_cache
 
 logger = logging.getLogger(__name__)
 
@@ -12,22 +13,7 @@ SELECTING_GRADE, SELECTING_SUBJECT, PREPARING_EXAM, TAKING_EXAM = range(4)
 
 def get_main_menu():
     """Main menu in Khmer."""
-    keyboard = [
-        [
-            InlineKeyboardButton("🎓 ចូលប្រឡង", callback_data='take_exam'),
-            InlineKeyboardButton("📊 មើលលទ្ធផល", callback_data='view_results')
-        ],
-        [
-            InlineKeyboardButton("📚 សម្ភារៈសិក្សា", callback_data='study_materials'),
-            InlineKeyboardButton("⏰ កាលវិភាគប្រឡង", callback_data='exam_schedule')
-        ],
-        [
-            InlineKeyboardButton("👤 ប្រវត្តិរូប", callback_data='profile'),
-            InlineKeyboardButton("❓ ជំនួយ និងការគាំទ្រ", callback_data='help')
-        ],
-        [InlineKeyboardButton("⚙️ ការកំណត់", callback_data='settings')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return markup_cache.main_menu
 
 async def send_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message with main menu in Khmer."""
@@ -69,22 +55,12 @@ async def take_exam_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     
-    keyboard = []
-    exam_db = load_exam_database()
-    if not exam_db:
+    if not get_catalog().grades():
         text = (
             "⚠️ <b>មិនមានការប្រឡង</b>\n\n"
             "បច្ចុប្បន្ននេះមិនមានការប្រឡងទេ។ សូមពិនិត្យមើលម្តងទៀតនៅពេលក្រោយ ឬទាក់ទងការគាំទ្រ។"
         )
-        keyboard = [[InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')]]
-    else:
-        for grade_id, grade_data in exam_db.items():
-            clean_grade_id = grade_id.replace('grade_', '')
-            button_text = grade_data.get('title', 'ថ្នាក់គ្មានចំណងជើង')
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f'grade_{clean_grade_id}')])
-    
-    keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = markup_cache.grades_menu()
     
     try:
         if update.callback_query:
@@ -96,35 +72,16 @@ async def take_exam_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return SELECTING_GRADE
 
-async def show_subjects_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_subjects_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, grade_id: str):
     """Display subjects in Khmer for the selected grade."""
     query = update.callback_query
     await query.answer()
 
-    try:
-        logger.info("Processing callback: %s", query.data)
-
-        if query.data.startswith('grade_'):
-            grade_id = query.data[len('grade_'):]
-        else:
-            grade_id = query.data
-
-        if not grade_id.isdigit():
-            raise ValueError(f"Invalid grade ID extracted: {grade_id}")
-
-        db_grade_id = f'grade_{grade_id}'
-        logger.info("Selected grade_id: %s, db_grade_id: %s", grade_id, db_grade_id)
-    except (AttributeError, ValueError) as e:
-        logger.error("Invalid callback data: %s, error: %s", query.data, str(e))
-        await query.message.reply_text(
-            f"⚠️ ជម្រើសថ្នាក់មិនត្រឹមត្រូវ: {query.data}។ សូមសាកល្បងម្តងទៀត។ [Error ID: ERR_{int(datetime.now().timestamp())}]",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ ត្រឡប់ទៅមេនុយ", callback_data='main_menu')]])
-        )
-        return SELECTING_GRADE
+    db_grade_id = f'grade_{grade_id}'
+    logger.info("Selected grade_id: %s, db_grade_id: %s", grade_id, db_grade_id)
 
     try:
-        exam_db = load_exam_database()
-        logger.info("Available grades: %s", list(exam_db.keys()))
+        grade_data = get_catalog().get_grade(grade_id)
     except Exception as e:
         logger.error("Failed to load exam database: %s", str(e))
         await query.message.reply_text(
@@ -133,7 +90,6 @@ async def show_subjects_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return SELECTING_GRADE
 
-    grade_data = exam_db.get(db_grade_id)
     if not grade_data:
         logger.error("Grade %s not found in exam database", db_grade_id)
         await query.message.reply_text(
@@ -156,15 +112,7 @@ async def show_subjects_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "សូមជ្រើសរើសមុខវិជ្ជា ដើម្បីមើលព័ត៌មានប្រឡង និងចាប់ផ្តើម:"
     )
 
-    keyboard = []
-    for subject_id, subject_data in subjects.items():
-        button_text = f"{subject_data.get('title', 'មុខវិជ្ជាគ្មានចំណងជើង')} ({subject_data.get('duration', 'N/A')} នាទី)"
-        callback_data = f'exam_{grade_id}_{subject_id}'
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
-        logger.info("Generated subject callback: %s", callback_data)
-
-    keyboard.append([InlineKeyboardButton("⬅️ ត្រឡប់ទៅថ្នាក់", callback_data='take_exam')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = markup_cache.subjects_menu(grade_id)
 
     try:
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import hmac
+import logging
+import os
+import secrets
+from typing import Any, Awaitable, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def secret_matches(token: Optional[str], secret: str) -> bool:
+    """Constant-time check of a request's secret token header."""
+    return token is not None and hmac.compare_digest(token.encode(), secret.encode())
+
+
+class GracefulServer(uvicorn.Server):
+    """A uvicorn server that returns from ``serve()`` on SIGINT/SIGTERM.
+
+    Plain uvicorn re-raises the signal once it has stopped, which would kill
+    the process before the bot's own shutdown (the final session flush) runs.
+    """
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        with super().capture_signals():
+            yield
+            self._captured_signals.clear()
+
+
+class TrackingUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent update processing that counts finished updates.
+
+    Together with the number of updates the webhook accepted this gives the
+    updates still queued or running, which is what backpressure is based on.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.finished = 0
+        self.room = asyncio.Event()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await coroutine
+        finally:
+            self.finished += 1
+            self.room.set()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class WebhookIngress:
+    """Feeds webhook updates into the application's update queue.
+
+    At most ``max_pending`` updates are queued or being handled at once. A
+    request arriving when that many are in flight waits up to ``max_wait``
+    seconds for room, which holds Telegram's connection and so slows its
+    delivery; after that it is answered 503 and Telegram redelivers it later.
+    """
+
+    def __init__(self, application: Application, secret_token: str, max_pending: int = 500, max_wait: float = 2.0):
+        processor = application.update_processor
+        if not isinstance(processor, TrackingUpdateProcessor):
+            raise TypeError("webhook mode needs the application built with a TrackingUpdateProcessor")
+        self.application = application
+        self.processor = processor
+        self.secret_token = secret_token
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.accepted = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        self.invalid = 0
+
+    @property
+    def pending(self) -> int:
+        return self.accepted - self.processor.finished
+
+    async def wait_for_room(self) -> bool:
+        """Wait until fewer than ``max_pending`` updates are in flight; False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while self.pending >= self.max_pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            self.processor.room.clear()
+            try:
+                await asyncio.wait_for(self.processor.room.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def handle(self, request: Request) -> JSONResponse:
+        if not secret_matches(request.headers.get(SECRET_HEADER), self.secret_token):
+            self.unauthorized += 1
+            logger.warning("Webhook request with a wrong secret token from %s", request.client.host if request.client else "?")
+            return JSONResponse({"ok": False}, status_code=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            self.invalid += 1
+            logger.error("Invalid webhook update: %s", e)
+            return JSONResponse({"ok": False}, status_code=400)
+        if update is None:
+            self.invalid += 1
+            return JSONResponse({"ok": False}, status_code=400)
+
+        if not await self.wait_for_room():
+            self.rejected += 1
+            logger.warning("Webhook busy (%d updates in flight), rejecting update %s", self.pending, update.update_id)
+            return JSONResponse({"ok": False}, status_code=503, headers={"Retry-After": "1"})
+        self.accepted += 1
+        await self.application.update_queue.put(update)
+        return JSONResponse({"ok": True})
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "finished": self.processor.finished,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+            "invalid": self.invalid,
+        }
+
+
+def create_app(ingress: WebhookIngress, path: str) -> FastAPI:
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    app.add_api_route(path, ingress.handle, methods=["POST"])
+
+    @app.get("/healthz")
+    async def healthz():
+        return ingress.stats()
+
+    return app
+
+
+async def register_webhook(bot, url: str, secret: str):
+    await bot.set_webhook(
+        url=url,
+        secret_token=secret,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=True,
+        max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+    )
+    logger.info("Webhook registered at %s", url)
+
+
+def webhook_secret() -> str:
+    """WEBHOOK_SECRET, or a random token for this run (it is re-registered on every start)."""
+    secret = os.getenv("WEBHOOK_SECRET")
+    if not secret:
+        secret = secrets.token_urlsafe(32)
+        logger.info("WEBHOOK_SECRET not set, using a random secret token for this run")
+    return secret
+
+
+async def run_webhook(application: Application, register: bool = True):
+    """Serve updates over a webhook until the server is stopped.
+
+    Starts the application (its update queue consumer), registers the webhook
+    with Telegram and runs uvicorn on WEBHOOK_LISTEN:WEBHOOK_PORT. Cluster
+    workers pass ``register=False``: the ingress process owns the webhook.
+    """
+    public_url = os.getenv("WEBHOOK_URL")
+    if register and not public_url:
+        raise RuntimeError("WEBHOOK_URL environment variable is missing!")
+    path = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+    secret = webhook_secret()
+    ingress = WebhookIngress(
+        application,
+        secret,
+        max_pending=int(os.getenv("WEBHOOK_MAX_PENDING", "500")),
+        max_wait=float(os.getenv("WEBHOOK_MAX_WAIT", "2")),
+    )
+    server = GracefulServer(uvicorn.Config(
+        create_app(ingress, path),
+        host=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        log_level="warning",
+        lifespan="off",
+    ))
+
+    await application.start()
+    try:
+        if register:
+            await register_webhook(application.bot, public_url.rstrip("/") + path, secret)
+        logger.info("Serving webhook updates on port %d%s", server.config.port, path)
+        await server.serve()
+    finally:
+        logger.info("Webhook server stopped: %s", ingress.stats())
+        await application.stop()
@@ -0,0 +1,103 @@
+"""Teacher dashboard over the results snapshots the bot writes (bot/snapshot.py).
+
+    streamlit run dashboard.py
+
+The bot refreshes the snapshot every SNAPSHOT_INTERVAL_MINUTES (or run
+``python -m bot.snapshot``). The dashboard memory-maps its ``.npy`` columns
+and never parses the results JSON, so filtering costs a few vectorized
+passes over the selected columns.
+"""
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from bot.analytics import SCORE_BINS
+from bot.snapshot import Snapshot, current_snapshot
+
+EPOCH = date(1970, 1, 1)
+BIN_LABELS = [f"{10 * i}-{10 * i + 9}" for i in range(SCORE_BINS - 1)] + ["100"]
+
+
+@st.cache_resource(max_entries=2)
+def load_snapshot(path: str) -> Snapshot:
+    # Keyed by path: a new snapshot is opened once, then shared by every session
+    return Snapshot(path)
+
+
+def to_date(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def to_day(d: date) -> int:
+    return (d - EPOCH).days
+
+
+st.set_page_config(page_title="Exam results", page_icon="📊", layout="wide")
+st.title("📊 Exam results")
+
+path = current_snapshot()
+if path is None:
+    st.info("No results snapshot yet. The bot writes one every SNAPSHOT_INTERVAL_MINUTES, "
+            "or run `python -m bot.snapshot`.")
+    st.stop()
+snapshot = load_snapshot(path)
+
+grades = sorted({e["grade_id"] for e in snapshot.exams}, key=lambda g: (not g.isdigit(), int(g) if g.isdigit() else 0, g))
+grade_titles = {e["grade_id"]: e["grade_title"] for e in snapshot.exams}
+chosen_grades = st.sidebar.multiselect("Grades", grades, format_func=lambda g: grade_titles.get(g, g))
+subject_titles = {e["subject_id"]: e["title"] for e in snapshot.exams
+                  if not chosen_grades or e["grade_id"] in chosen_grades}
+chosen_subjects = st.sidebar.multiselect("Subjects", sorted(subject_titles), format_func=lambda s: subject_titles[s])
+
+first_day, last_day = snapshot.day_range()
+if first_day is not None:
+    picked = st.sidebar.date_input("Dates", (to_date(first_day), to_date(last_day)),
+                                   min_value=to_date(first_day), max_value=to_date(last_day))
+    first_day, last_day = (to_day(picked[0]), to_day(picked[-1])) if picked else (None, None)
+bucket = st.sidebar.radio("Trend by", (1, 7, 30), index=1, format_func=lambda d: {1: "day", 7: "week", 30: "month"}[d])
+
+started = time.perf_counter()
+codes = snapshot.exam_codes(chosen_grades, chosen_subjects) if chosen_grades or chosen_subjects else None
+mask = snapshot.select(codes, first_day, last_day)
+histogram = snapshot.score_histogram(mask)
+counts, means = snapshot.per_exam(mask)
+trend_days, trend_counts, trend_means = snapshot.trend(mask, bucket)
+scores = snapshot["sitting_score"][mask]
+elapsed = time.perf_counter() - started
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Sittings", f"{int(mask.sum()):,}")
+col2.metric("Mean score", f"{scores.mean():.1f}%" if len(scores) else "—")
+col3.metric("Median score", f"{np.median(scores):.1f}%" if len(scores) else "—")
+col4.metric("Students", f"{len(np.unique(snapshot['sitting_user'][mask])):,}")
+
+left, right = st.columns(2)
+with left:
+    st.subheader("Score distribution")
+    st.bar_chart(pd.DataFrame({"sittings": histogram}, index=BIN_LABELS))
+with right:
+    st.subheader("Trend")
+    if len(trend_days):
+        trend = pd.DataFrame({"mean score": trend_means, "sittings": trend_counts},
+                             index=[to_date(d) for d in trend_days])
+        st.line_chart(trend["mean score"])
+        st.bar_chart(trend["sittings"])
+    else:
+        st.caption("No dated results in the selection.")
+
+st.subheader("Per grade and subject")
+shown = np.flatnonzero(counts)
+st.dataframe(pd.DataFrame({
+    "grade": [grade_titles.get(snapshot.exams[c]["grade_id"], "") for c in shown],
+    "subject": [snapshot.exams[c]["title"] for c in shown],
+    "sittings": counts[shown],
+    "mean score": np.round(means[shown], 1),
+}), hide_index=True, use_container_width=True)
+
+st.caption(
+    f"Snapshot {snapshot.name}: {snapshot.sittings:,} sittings, {snapshot.manifest['rows']:,} answers. "
+    f"Filtered in {elapsed * 1000:.0f} ms."
+)